@@ -1,7 +1,7 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, request, jsonify
 from flask_cors import CORS
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 import os
 import random
 import smtplib
@@ -18,10 +18,18 @@ from flask_limiter.util import get_remote_address
 from werkzeug.utils import secure_filename
 from datetime import date, timedelta
 import traceback
+from utils import bulk_import, catalog, catalog_snapshot, db, engagement, etag, images, query_stats, similar, upload_sessions, uploads
+from utils.upload_stream import MAX_IMAGE_BYTES, MAX_IMPORT_BYTES, UploadRequest, IngestFile, streamed_upload
+from utils.view_counter import views
+from utils.db import get_db_connection
+from utils.idempotency import idempotent
+import migrations
 
 load_dotenv()
 
 app = Flask(__name__)
+db.init_app(app)
+query_stats.init_app(app)
 
 CORS(app, resources={
     r"/api/*": {
@@ -31,7 +39,8 @@ CORS(app, resources={
             "https://your-frontend.vercel.app"  # Add your Vercel URL
         ],
         "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"],
+        "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"],
+        "expose_headers": ["Idempotent-Replayed"],
         "supports_credentials": True
     }
 })
@@ -39,6 +48,10 @@ CORS(app, resources={
 UPLOAD_FOLDER = 'static/uploads'
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['USE_X_SENDFILE'] = uploads.SERVE_MODE == 'x-sendfile'
+# Routes with @streamed_upload set their own, larger limit.
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_CONTENT_LENGTH', 2 * 1024 * 1024))
+app.request_class = UploadRequest
 
 if not os.path.exists(UPLOAD_FOLDER):
     os.makedirs(UPLOAD_FOLDER)
@@ -52,41 +65,59 @@ limiter = Limiter(
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'default_secret_key_change_me')
 
-def get_db_connection():
-    try:
-        db_url = os.getenv('DATABASE_URL')
-        if db_url:
-            conn = psycopg2.connect(
-                db_url, 
-                sslmode='require', 
-                cursor_factory=RealDictCursor,
-                keepalives=1,
-                keepalives_idle=30,
-                keepalives_interval=10,
-                keepalives_count=5
-            )
-            with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'Asia/Manila'") 
-        else:
-            conn = psycopg2.connect(
-                host=os.getenv('DB_HOST', 'localhost'),
-                database=os.getenv('DB_NAME', 'postgres'),
-                user=os.getenv('DB_USER', 'postgres'),
-                password=os.getenv('DB_PASSWORD', 'password'),
-                cursor_factory=RealDictCursor
-            )
-            with conn.cursor() as cur:
-                cur.execute("SET TIME ZONE 'Asia/Manila'")
-                
-        return conn
-    except Exception as e:
-        print(f"Database Connection Failed: {e}")
-        return None
-        
 def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def save_upload(file):
+    """Store an uploaded image under its content hash, with resized variants.
+
+    Returns a utils.uploads.StoredUpload (its .url goes into the row; pass
+    it to uploads.add_ref once the row exists), or None when there is no
+    file, which callers treat as "no image" like before. On @streamed_upload
+    routes the file is already hashed on disk and its type checked by
+    content; elsewhere it is copied and only the extension is checked. A
+    file that fails to decode is kept as uploaded; variant requests for it
+    fall back to the original.
+    """
+    if not file or not file.filename:
+        return None
+    if isinstance(file.stream, IngestFile):
+        upload = file.stream.save(app.config['UPLOAD_FOLDER'])
+        if upload is None:
+            return None
+    elif allowed_file(file.filename):
+        upload = uploads.store(file.stream, app.config['UPLOAD_FOLDER'], secure_filename(file.filename), file.mimetype)
+    else:
+        return None
+    generate_variants(upload)
+    return upload
+
+def generate_variants(upload):
+    if upload.created:
+        try:
+            images.generate(app.config['UPLOAD_FOLDER'], upload.filename)
+        except images.ImageError as e:
+            print(f"Image variants skipped: {e}")
+
+def form_upload():
+    """The multipart 'image' of a create request, stored with its variants.
+
+    Call it before checking out a connection: variant encoding takes a
+    while and must not hold one. None when the request names a resumable
+    upload_id instead (see session_upload).
+    """
+    if request.form.get('upload_id'):
+        return None
+    return save_upload(request.files.get('image'))
+
+def session_upload(conn, user_id, upload):
+    """The finished resumable upload named by upload_id (utils.upload_sessions), else `upload`."""
+    upload_id = request.form.get('upload_id')
+    if upload_id:
+        return upload_sessions.stored_upload(conn, upload_id, user_id)
+    return upload
+
 def create_notification(user_id, message, event_type, conn, sender_id=None, deep_link=None):
     if not conn:
         return
@@ -99,214 +130,154 @@ def create_notification(user_id, message, event_type, conn, sender_id=None, deep
     except Exception as e:
         print(f"Notification creation failed: {e}")
 
-def init_tables():
-    conn = get_db_connection()
-    if not conn:
-        print("Skipping table initialization due to failed DB connection.")
-        return
+def create_notifications(rows, conn):
+    """Insert many notifications in one statement.
 
+    rows: (user_id, message, event_type, sender_id, deep_link) tuples.
+    """
+    if not conn or not rows:
+        return
     try:
         cur = conn.cursor()
+        execute_values(cur, """
+            INSERT INTO notifications (user_id, message, type, sender_id, deep_link)
+            VALUES %s
+        """, rows, page_size=len(rows))
+    except Exception as e:
+        print(f"Notification creation failed: {e}")
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS users (
-                id SERIAL PRIMARY KEY,
-                username VARCHAR(100) NOT NULL,
-                email VARCHAR(100) UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                bio TEXT,
-                profile_image TEXT,
-                course VARCHAR(100),
-                year_level VARCHAR(50),
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS otps (
-                email VARCHAR(100) PRIMARY KEY,
-                code VARCHAR(6) NOT NULL,
-                expires_at TIMESTAMP DEFAULT (NOW() + INTERVAL '5 minutes')
-            );
-        """)
-
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS products (
-                id SERIAL PRIMARY KEY,
-                seller_id INTEGER REFERENCES users(id),
-                name VARCHAR(200) NOT NULL,
-                description TEXT,
-                price DECIMAL(10, 2),
-                category VARCHAR(100),
-                condition VARCHAR(50),
-                availability TEXT, 
-                image_url TEXT,
-                listing_type VARCHAR(20) DEFAULT 'sell',
-                status VARCHAR(20) DEFAULT 'available',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS rentals (
-                id SERIAL PRIMARY KEY,
-                product_id INTEGER REFERENCES products(id),
-                renter_id INTEGER REFERENCES users(id),
-                owner_id INTEGER REFERENCES users(id),
-                rent_start DATE NOT NULL,
-                rent_end DATE NOT NULL,
-                status VARCHAR(20) DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS swaps (
-                id SERIAL PRIMARY KEY,
-                product_id INTEGER REFERENCES products(id),
-                offered_item_id INTEGER REFERENCES products(id),
-                requester_id INTEGER REFERENCES users(id),
-                offer_description TEXT,
-                offer_image_url TEXT,
-                status VARCHAR(20) DEFAULT 'pending',
-                rejection_reason TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS transactions (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id) NOT NULL, 
-                amount DECIMAL(10, 2),
-                payment_method VARCHAR(50),
-                payment_reference VARCHAR(100),
-                meetup_details TEXT, 
-                status VARCHAR(20) DEFAULT 'pending',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS transaction_items (
-                id SERIAL PRIMARY KEY,
-                transaction_id INTEGER REFERENCES transactions(id) ON DELETE CASCADE, 
-                product_id INTEGER REFERENCES products(id) ON DELETE RESTRICT,
-                seller_id INTEGER REFERENCES users(id) NOT NULL, 
-                quantity INTEGER NOT NULL,
-                price_at_sale DECIMAL(10, 2) NOT NULL,
-                listing_type VARCHAR(50) NOT NULL
-            );
-        """)
-        
+migrations.check_schema()
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS notifications (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                sender_id INTEGER REFERENCES users(id) DEFAULT NULL,
-                message TEXT NOT NULL,
-                type VARCHAR(50),
-                deep_link TEXT,
-                is_read BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
+@app.before_request
+def reject_oversized_body():
+    # Views read their body inside try/except, where Werkzeug's 413 would become a 500.
+    limit = request.max_content_length
+    if limit is not None and request.content_length is not None and request.content_length > limit:
+        return jsonify({"error": f"Request body is larger than {limit // 1024} KB."}), 413
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS cart (
-                id SERIAL PRIMARY KEY,
-                user_id INTEGER REFERENCES users(id),
-                product_id INTEGER REFERENCES products(id),
-                quantity INTEGER DEFAULT 1,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(user_id, product_id)
-            );
-        """)
-        
+@app.errorhandler(413)
+@app.errorhandler(415)
+def upload_rejected(e):
+    """Uploads refused by size or type (utils.upload_stream), as JSON like every other error."""
+    return jsonify({"error": e.description}), e.code
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS messages (
-                id SERIAL PRIMARY KEY,
-                sender_id INTEGER REFERENCES users(id),
-                receiver_id INTEGER REFERENCES users(id),
-                product_id INTEGER REFERENCES products(id) DEFAULT NULL,
-                message TEXT,
-                image_url TEXT,
-                is_read BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            );
-        """)
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_relationships (
-                follower_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                followed_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                PRIMARY KEY (follower_id, followed_id)
-            );
-        """)  
+@app.route('/api/health', methods=['GET'])
+def health_check():
+    return jsonify({
+        "status": "online",
+        "message": "Backend is running",
+        "catalog_snapshot": catalog_snapshot.snapshot.stats(),
+        "view_counter": views.stats(),
+    }), 200
 
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS user_ratings (
-                id SERIAL PRIMARY KEY,
-                rater_id INTEGER REFERENCES users(id) NOT NULL,
-                rated_user_id INTEGER REFERENCES users(id) NOT NULL,
-                transaction_type VARCHAR(20) NOT NULL, -- 'sell', 'rent', 'swap'
-                transaction_id INTEGER, -- Reference sa transactions/rentals/swaps table ID
-                rating INTEGER CHECK (rating >= 1 AND rating <= 5) NOT NULL,
-                review_text TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                -- Siguraduhin na isang beses lang pwedeng mag-rate ang isang user para sa isang transaction
-                UNIQUE(rater_id, transaction_type, transaction_id) 
-            );
-        """)      
-        try:
-            cur.execute("ALTER TABLE notifications ADD COLUMN IF NOT EXISTS sender_id INTEGER REFERENCES users(id) DEFAULT NULL;")
-            cur.execute("ALTER TABLE notifications ADD COLUMN IF NOT EXISTS deep_link TEXT;")
-            
-            cur.execute("ALTER TABLE swaps ADD COLUMN IF NOT EXISTS rejection_reason TEXT;")
-            
-            cur.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS amount DECIMAL(10, 2);") 
-            cur.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50);")
-            cur.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS payment_reference VARCHAR(100);")
-            cur.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS receipt_code VARCHAR(100);")
-            cur.execute("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS meetup_details TEXT;")
-            
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS message TEXT;")
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS receiver_id INTEGER REFERENCES users(id);")
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS sender_id INTEGER REFERENCES users(id);")
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS product_id INTEGER REFERENCES products(id) DEFAULT NULL;")
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS image_url TEXT;")
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS is_read BOOLEAN DEFAULT FALSE;")
-            cur.execute("ALTER TABLE messages ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP;") 
-            
-            cur.execute("ALTER TABLE rentals ADD COLUMN IF NOT EXISTS comment TEXT;")
+@app.route('/static/uploads/<filename>')
+def uploaded_file(filename):
+    """An upload; cache headers and front-server offload come from uploads.send_upload."""
+    name = secure_filename(filename)
+    if not name or not os.path.isfile(os.path.join(app.config['UPLOAD_FOLDER'], name)):
+        return jsonify({"error": "File not found"}), 404
+    return uploads.send_upload(app.config['UPLOAD_FOLDER'], name)
+
+@app.route('/static/uploads/variants/<variant>/<filename>')
+def uploaded_variant(variant, filename):
+    """A resized variant (utils.images), generated on first request for older uploads."""
+    if variant not in images.VARIANTS or not filename.endswith(images.VARIANT_EXTENSION):
+        return jsonify({"error": "Unknown image variant"}), 404
+    name = secure_filename(filename[:-len(images.VARIANT_EXTENSION)])
+    try:
+        path = images.ensure(app.config['UPLOAD_FOLDER'], variant, name)
+    except images.ImageError as e:
+        print(f"Image Variant Error: {e}")
+        # Not decodable: the original is still better than a broken image.
+        return uploads.send_upload(app.config['UPLOAD_FOLDER'], name)
+    if path is None:
+        return jsonify({"error": "Image not found"}), 404
+    return uploads.send_upload(app.config['UPLOAD_FOLDER'], os.path.relpath(path, app.config['UPLOAD_FOLDER']))
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload_session():
+    """Start a resumable upload (utils.upload_sessions): {user_id, filename, size[, sha256]}."""
+    conn = None
+    try:
+        data = request.get_json(silent=True) or {}
+        if not data.get('user_id'):
+            return jsonify({"error": "User ID required"}), 400
 
-            cur.execute("ALTER TABLE user_ratings ADD COLUMN IF NOT EXISTS likes INTEGER DEFAULT 0;")
-            cur.execute("ALTER TABLE user_ratings ADD COLUMN IF NOT EXISTS dislikes INTEGER DEFAULT 0;")
-                 
-        except Exception as e:
-            print(f"Schema alteration warning: {e}")
-            conn.rollback()
-            
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        session = upload_sessions.create(conn, app.config['UPLOAD_FOLDER'], data['user_id'],
+                                         data.get('filename'), data.get('size'), data.get('sha256'))
         conn.commit()
-        cur.close()
-        conn.close()
-        print("Tables initialized and schema updated successfully.")
+        return jsonify(upload_sessions.describe(session)), 201
+    except upload_sessions.SessionError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
-        print(f"Error initializing tables: {e}")
-        if conn:
-            conn.close()
+        if conn: conn.rollback()
+        print(f"Upload Session Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
-init_tables() 
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+def get_upload_session(upload_id):
+    """Where a resumable upload stands: offset received without gaps and the missing chunks."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        session = upload_sessions.get(conn, upload_id)
+        if session is None:
+            return jsonify({"error": "Upload session not found or expired"}), 404
+        return jsonify(upload_sessions.describe(session))
+    except Exception as e:
+        print(f"Upload Session Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
-@app.route('/api/health', methods=['GET'])
-def health_check():
-    return jsonify({"status": "online", "message": "Backend is running"}), 200
+@app.route('/api/uploads/<upload_id>/chunks/<int:index>', methods=['PUT'])
+def put_upload_chunk(upload_id, index):
+    """Raw bytes of one chunk, streamed to its place in the part file."""
+    conn = None
+    try:
+        if request.content_length is None:
+            return jsonify({"error": "Content-Length required"}), 411
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        session = upload_sessions.write_chunk(conn, app.config['UPLOAD_FOLDER'], upload_id, index,
+                                              request.stream, request.content_length)
+        conn.commit()
+        return jsonify(upload_sessions.describe(session))
+    except upload_sessions.SessionError as e:
+        if conn: conn.rollback()
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        if conn: conn.rollback()
+        print(f"Upload Chunk Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
-@app.route('/static/uploads/<filename>')
-def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload_session(upload_id):
+    """Assemble a fully received upload; pass its upload_id to POST /api/products or /api/swaps."""
+    conn = None
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        session, upload = upload_sessions.finalize(conn, app.config['UPLOAD_FOLDER'], upload_id)
+        conn.commit()
+        upload_sessions.remove_part(app.config['UPLOAD_FOLDER'], upload_id)
+        if upload:
+            generate_variants(upload)
+        result = upload_sessions.describe(session)
+        result['image_variants'] = images.variant_urls(result['image_url'])
+        return jsonify(result)
+    except upload_sessions.SessionError as e:
+        if conn: conn.rollback()
+        return jsonify({"error": str(e)}), e.status
+    except Exception as e:
+        if conn: conn.rollback()
+        print(f"Upload Complete Error: {e}")
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/products/<int:product_id>', methods=['PUT', 'DELETE'])
 def modify_product(product_id):
@@ -321,22 +292,26 @@ def modify_product(product_id):
         cur.execute("SELECT id FROM products WHERE id = %s", (product_id,))
         if not cur.fetchone():
             cur.close()
-            conn.close()
             return jsonify({"error": "Product not found"}), 404
 
         if request.method == 'DELETE':
             try:
                 cur.execute("DELETE FROM cart WHERE product_id = %s", (product_id,))
                 cur.execute("DELETE FROM rentals WHERE product_id = %s", (product_id,))
-                cur.execute("DELETE FROM swaps WHERE product_id = %s", (product_id,))
+                cur.execute("DELETE FROM swaps WHERE product_id = %s RETURNING id", (product_id,))
+                swap_ids = [row['id'] for row in cur.fetchall()]
                 
                 cur.execute("DELETE FROM products WHERE id = %s", (product_id,))
+                uploads.drop_refs(conn, 'product', [product_id])
+                uploads.drop_refs(conn, 'swap', swap_ids)
+                catalog.bump_version(conn)
                 conn.commit()
                 return jsonify({"message": "Product deleted successfully"}), 200
             
             except psycopg2.errors.ForeignKeyViolation:
                 conn.rollback()
                 cur.execute("UPDATE products SET status = 'archived' WHERE id = %s", (product_id,))
+                catalog.bump_version(conn)
                 conn.commit()
                 return jsonify({"message": "Product archived (history preserved)"}), 200
 
@@ -359,17 +334,20 @@ def modify_product(product_id):
             query = f"UPDATE products SET {', '.join(updates)} WHERE id = %s"
             
             cur.execute(query, tuple(values))
+            catalog.bump_version(conn)
             conn.commit()
+            similar.schedule(product_id)
             return jsonify({"message": "Product updated successfully"}), 200
 
     except Exception as e:
-        if conn: conn.rollback(); conn.close()
+        if conn: conn.rollback()
         print(f"Product Modify Error: {e}")
         return jsonify({"error": str(e)}), 500
     finally:
         if conn: conn.close()
         
 @app.route('/api/products', methods=['POST'])
+@streamed_upload(MAX_IMAGE_BYTES)
 def create_product():
     conn = None
     try:
@@ -385,19 +363,15 @@ def create_product():
         if not all([seller_id, name, category, condition]):
             return jsonify({"error": "Missing required fields for posting."}), 400
 
-        image_url = ""
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"product_{seller_id}_{int(datetime.datetime.now().timestamp())}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
-                image_url = f"/static/uploads/{unique_filename}"
-            
+        upload = form_upload()
+
         conn = get_db_connection()
         if not conn:
             return jsonify({"error": "Database connection failed"}), 500
 
+        upload = session_upload(conn, seller_id, upload)
+        image_url = upload.url if upload else ""
+
         cur = conn.cursor()
         
         cur.execute("""
@@ -407,6 +381,8 @@ def create_product():
         """, (seller_id, name, description, price, category, condition, availability, image_url, listing_type))
         
         new_product = cur.fetchone()
+        if upload:
+            uploads.add_ref(conn, upload, 'product', new_product['id'])
 
         message = f"Your new listing '{new_product['name']}' is now available for {listing_type}."
         create_notification(
@@ -417,44 +393,347 @@ def create_product():
             sender_id=seller_id,
             deep_link=f"/my-posts"
         )
-        
+        catalog.bump_version(conn)
+
         conn.commit()
         cur.close()
         conn.close()
+        similar.schedule(new_product['id'])
         
         return jsonify({"message": "Product posted successfully!", "product_id": new_product['id']}), 201
 
+    except upload_sessions.SessionError as e:
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         print(f"Product Creation Error: {e}")
         if conn:
             conn.close()
         return jsonify({"error": str(e)}), 500
 
-@app.route('/api/products', methods=['GET'])
-def get_products():
+@app.route('/api/products/import', methods=['POST'])
+@streamed_upload(MAX_IMPORT_BYTES, kinds=None)
+@idempotent
+def import_products():
+    """Create many listings for one seller from a CSV or JSON file (see utils.bulk_import).
+
+    Send the file as multipart field "file" with seller_id in the form, or
+    as the raw body (Content-Type text/csv, application/json or
+    application/x-ndjson) with ?seller_id=. Valid rows are imported even
+    when others fail; every failure is listed with its row.
+    """
     conn = None
     try:
+        upload = request.files.get('file')
+        if upload:
+            seller_id = request.form.get('seller_id')
+            fmt = request.form.get('format') or bulk_import.detect_format(upload.filename, upload.mimetype)
+            stream = upload.stream
+        else:
+            seller_id = request.args.get('seller_id')
+            fmt = request.args.get('format') or bulk_import.detect_format(content_type=request.content_type)
+            # Spooled to disk by @streamed_upload; a bare stream if it ever isn't.
+            stream = request.body_file or request.stream
+
+        if not seller_id or not str(seller_id).isdigit():
+            return jsonify({"error": "Missing or invalid seller_id"}), 400
+        if not fmt:
+            return jsonify({"error": "Send a .csv, .json or .jsonl file, or set format=csv|json"}), 400
+
         conn = get_db_connection()
         if not conn:
             return jsonify({"error": "Database connection failed"}), 500
-
         cur = conn.cursor()
-        
-        query = """
-            SELECT p.*, u.username as seller_name, u.profile_image as seller_image
+
+        cur.execute("SELECT id FROM users WHERE id = %s", (seller_id,))
+        if not cur.fetchone():
+            cur.close(); conn.close()
+            return jsonify({"error": "Seller not found"}), 404
+
+        result = bulk_import.import_products(
+            conn, int(seller_id), bulk_import.records(stream, fmt), app.config['UPLOAD_FOLDER']
+        )
+        if result['imported']:
+            # One notification for the batch instead of one per listing.
+            create_notification(
+                user_id=seller_id,
+                message=f"{result['imported']} new listings from your import are now available.",
+                event_type="new_post",
+                conn=conn,
+                sender_id=seller_id,
+                deep_link="/my-posts"
+            )
+            catalog.bump_version(conn)
+        conn.commit()
+        cur.close(); conn.close()
+
+        similar.schedule_many(result['product_ids'])
+
+        return jsonify(result), 201 if result['imported'] else 422
+
+    except ValueError as e:
+        if conn: conn.rollback(); conn.close()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if conn: conn.rollback(); conn.close()
+        print(f"Product Import Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def fetch_catalog_page(cur, filters, sort, limit, position, fields, ranking=None):
+    """One catalog page as {items, next_cursor}: from the snapshot when it is on, else via cur."""
+    if sort == 'trending' and ranking is None:
+        ranking = engagement.trending()
+    if catalog_snapshot.ENABLED:
+        products = catalog_snapshot.snapshot.get().page(filters, sort, limit, position, ranking)
+    else:
+        join, params = '', []
+        if sort == 'trending':
+            join, params = engagement.join_clause(ranking)
+        conditions, where_params = catalog.where_clause(filters)
+        params.extend(where_params)
+        keyset, order_by, keyset_params = catalog.page_clause(sort, position)
+        if keyset:
+            conditions.append(keyset)
+            params.extend(keyset_params)
+
+        # One extra row tells us whether there is a next page.
+        query = f"""
+            SELECT {catalog.select_list(fields, sort)}
             FROM products p
             JOIN users u ON p.seller_id = u.id
-            WHERE p.status = 'available'
-            ORDER BY p.created_at DESC
+            {join}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY {order_by}
+            LIMIT %s
         """
-        cur.execute(query)
+        cur.execute(query, params + [limit + 1])
         products = cur.fetchall()
-        
+
+    next_cursor = None
+    if len(products) > limit:
+        products = products[:limit]
+        next_cursor = catalog.encode_cursor(products[-1], sort)
+    return {"items": catalog.project(products, fields), "next_cursor": next_cursor}
+
+@app.route('/api/products', methods=['GET'])
+def get_products():
+    conn = None
+    try:
+        parameterized = catalog.is_parameterized(request.args)
+        if parameterized:
+            filters = catalog.parse_filters(request.args)
+            sort, limit, position = catalog.parse_page(request.args)
+            fields = catalog.parse_fields(request.args)
+        # The trending order moves without a catalog write, so it is part of the tag.
+        ranking = engagement.trending() if parameterized and sort == 'trending' else None
+        suffix = f"-t{ranking.digest}" if ranking else ""
+
+        if catalog_snapshot.ENABLED:
+            snapshot = catalog_snapshot.snapshot.get()
+            tag = f"catalog-{snapshot.version}-{etag.query_digest()}{suffix}"
+            cached = etag.not_modified(tag)
+            if cached:
+                return cached
+            if not parameterized:
+                return etag.tagged(app.response_class(snapshot.legacy_json, mimetype='application/json'), tag)
+            page = fetch_catalog_page(None, filters, sort, limit, position, fields, ranking)
+        else:
+            conn = get_db_connection()
+            if not conn:
+                return jsonify({"error": "Database connection failed"}), 500
+
+            cur = conn.cursor()
+            tag = f"catalog-{catalog.current_version(cur)}-{etag.query_digest()}{suffix}"
+            cached = etag.not_modified(tag)
+            if cached:
+                cur.close()
+                conn.close()
+                return cached
+
+            if not parameterized:
+                query = f"""
+                    SELECT {catalog.PRODUCT_COLUMNS}, u.username as seller_name, u.profile_image as seller_image
+                    FROM products p
+                    JOIN users u ON p.seller_id = u.id
+                    WHERE p.status = 'available'
+                    ORDER BY p.created_at DESC
+                """
+                cur.execute(query)
+                products = [images.add_variant_urls(row) for row in cur.fetchall()]
+
+                cur.close()
+                conn.close()
+
+                return etag.tagged(jsonify(products), tag)
+
+            page = fetch_catalog_page(cur, filters, sort, limit, position, fields, ranking)
+
+            cur.close()
+            conn.close()
+
+        return etag.tagged(jsonify(page), tag)
+    except ValueError as e:
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/bootstrap', methods=['GET'])
+def get_bootstrap():
+    """Everything the home screen needs on open, in one response.
+
+    Takes the /api/products filter parameters for the first catalog page and
+    an optional user_id for the cart summary and unread counts.
+    """
+    conn = None
+    try:
+        filters = catalog.parse_filters(request.args)
+        sort, limit, position = catalog.parse_page(request.args)
+        fields = catalog.parse_fields(request.args)
+        user_id = request.args.get('user_id', type=int)
+        # Before checking out a connection: trending() may need one of its own.
+        ranking = engagement.trending() if sort == 'trending' else None
+
+        result = {"catalog": None, "cart": None, "unread_notifications": 0, "unread_message_threads": 0}
+        if catalog_snapshot.ENABLED:
+            result["catalog"] = fetch_catalog_page(None, filters, sort, limit, position, fields, ranking)
+            if not user_id:
+                return jsonify(result), 200
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+
+        if user_id:
+            # Independent counts as scalar subqueries: one statement, one round trip.
+            # A thread is unread when its latest message came from the other
+            # user and is unread, the same rule AppNavbar applies to /threads.
+            cur.execute("""
+                SELECT
+                    (SELECT json_build_object(
+                                'items', count(*),
+                                'quantity', COALESCE(sum(c.quantity), 0),
+                                'subtotal', COALESCE(sum(c.quantity * COALESCE(p.price, 0)), 0))
+                     FROM cart c
+                     JOIN products p ON p.id = c.product_id
+                     WHERE c.user_id = %(user_id)s) AS cart,
+                    (SELECT count(*) FROM notifications
+                     WHERE user_id = %(user_id)s AND NOT is_read) AS unread_notifications,
+                    (SELECT count(*)
+                     FROM (
+                         SELECT DISTINCT ON (m.sender_id) m.sender_id, m.is_read, m.created_at
+                         FROM messages m
+                         WHERE m.receiver_id = %(user_id)s
+                         ORDER BY m.sender_id, m.created_at DESC
+                     ) latest
+                     WHERE NOT latest.is_read
+                     AND NOT EXISTS (
+                         SELECT 1 FROM messages r
+                         WHERE r.sender_id = %(user_id)s AND r.receiver_id = latest.sender_id
+                         AND r.created_at > latest.created_at
+                     )) AS unread_message_threads
+            """, {'user_id': user_id})
+            counts = cur.fetchone()
+            result.update(counts)
+
+        if result["catalog"] is None:
+            result["catalog"] = fetch_catalog_page(cur, filters, sort, limit, position, fields, ranking)
+
         cur.close()
         conn.close()
-        
-        return jsonify(products), 200
+
+        return jsonify(result), 200
+    except ValueError as e:
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Bootstrap Error: {e}")
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    conn = None
+    try:
+        filters = catalog.parse_filters(request.args)
+        term = filters.pop('q', None)
+        if not term:
+            return jsonify({"error": "q is required"}), 400
+        limit = catalog.parse_limit(request.args)
+        fields = catalog.parse_fields(request.args) + ('score', 'name_highlight', 'snippet')
+        position = None
+        if request.args.get('cursor'):
+            position = catalog.decode_cursor(request.args['cursor'], 'relevance')
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+
+        query, params = catalog.search_query(filters, term, limit + 1, position, catalog.has_trigram(cur))
+        cur.execute(query, params)
+        results = cur.fetchall()
+
+        cur.close()
+        conn.close()
+
+        next_cursor = None
+        if len(results) > limit:
+            results = results[:limit]
+            next_cursor = catalog.encode_cursor(results[-1], 'relevance')
+
+        items = catalog.project(results, fields)
+        return jsonify({"items": items, "next_cursor": next_cursor}), 200
+    except ValueError as e:
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"Product Search Error: {e}")
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/products/facets', methods=['GET'])
+def get_product_facets():
+    conn = None
+    try:
+        filters = catalog.parse_filters(request.args)
+        key = catalog.filter_key(filters)
+
+        # With the snapshot on, a cache hit never touches the database.
+        version = catalog_snapshot.snapshot.version() if catalog_snapshot.ENABLED else None
+        result = catalog.facet_cache.get(version, key) if version is not None else None
+        if result is None:
+            conn = get_db_connection()
+            if not conn:
+                return jsonify({"error": "Database connection failed"}), 500
+            cur = conn.cursor()
+
+            if version is None:
+                version = catalog.current_version(cur)
+                result = catalog.facet_cache.get(version, key)
+            if result is None:
+                query, params = catalog.facet_query(filters)
+                cur.execute(query, params)
+                result = catalog.facet_counts(cur.fetchall())
+                catalog.facet_cache.put(version, key, result)
+
+            cur.close()
+            conn.close()
+
+        return jsonify(result), 200
+    except ValueError as e:
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
+        print(f"Facet Error: {e}")
         if conn:
             conn.close()
         return jsonify({"error": str(e)}), 500
@@ -517,6 +796,7 @@ def mark_notifications_read():
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/transactions', methods=['POST'])
+@idempotent
 def create_transaction():
     conn = None
     try:
@@ -535,39 +815,39 @@ def create_transaction():
         if not isinstance(items, list) or not items:
             return jsonify({"error": "Items list must be a non-empty array."}), 400
 
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
-        total_amount = 0
-        item_details = []
-        
+        quantities = {}
         for item in items:
             product_id = item.get('product_id')
-            quantity = item.get('quantity', 1)
-            
-            cur.execute("""
-                SELECT seller_id, name, listing_type, status, price 
-                FROM products WHERE id = %s
-            """, (product_id,))
-            product = cur.fetchone()
-            
+            if not product_id:
+                return jsonify({"error": "Every item needs a product_id."}), 400
+            quantities[int(product_id)] = quantities.get(int(product_id), 0) + int(item.get('quantity', 1))
+        product_ids = sorted(quantities)
+
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+        cur = conn.cursor()
+
+        # Lock every listing in the cart at once, in id order so two carts
+        # sharing items can't deadlock. A concurrent checkout of the same
+        # item blocks here and then sees the status this one commits.
+        cur.execute("""
+            SELECT id, seller_id, name, listing_type, status, price
+            FROM products
+            WHERE id = ANY(%s)
+            ORDER BY id
+            FOR UPDATE
+        """, (product_ids,))
+        products = {row['id']: row for row in cur.fetchall()}
+
+        for product_id in product_ids:
+            product = products.get(product_id)
             if not product:
                 raise ValueError(f"Product ID {product_id} not found.")
             if product['status'] != 'available':
-                 raise ValueError(f"Product '{product['name']}' is currently not available.")
-            
-            price_at_sale = product['price'] or 0 
-            total_amount += (price_at_sale * quantity)
-            
-            item_details.append({
-                'product_id': product_id,
-                'quantity': quantity,
-                'price_at_sale': price_at_sale,
-                'listing_type': product['listing_type'],
-                'seller_id': product['seller_id'],
-                'product_name': product['name']
-            })
-            
+                raise ValueError(f"Product '{product['name']}' is currently not available.")
+
+        total_amount = sum((products[pid]['price'] or 0) * quantities[pid] for pid in product_ids)
         receipt_code = str(uuid.uuid4())[:18].upper()
         
         cur.execute("""
@@ -577,32 +857,28 @@ def create_transaction():
         """, (user_id, total_amount, payment_method, json.dumps(meetup_details), receipt_code))
         transaction_id = cur.fetchone()['id']
         
-        for detail in item_details:
-            cur.execute("""
-                INSERT INTO transaction_items 
-                (transaction_id, product_id, seller_id, quantity, price_at_sale, listing_type)
-                VALUES (%s, %s, %s, %s, %s, %s)
-            """, (
-                transaction_id,
-                detail['product_id'],
-                detail['seller_id'],
-                detail['quantity'],
-                detail['price_at_sale'],
-                detail['listing_type']
-            ))
-            
-            cur.execute("UPDATE products SET status = 'pending_sale' WHERE id = %s", (detail['product_id'],))
-            
-            notif_msg = f"New order received for '{detail['product_name']}' (Txn #{transaction_id})."
-            create_notification(detail['seller_id'], notif_msg, 'new_order', conn, user_id, f'/receipt/{transaction_id}')
-
-            
-        product_ids_to_remove = [detail['product_id'] for detail in item_details]
-        cur.execute(f"""
-            DELETE FROM cart 
-            WHERE user_id = %s AND product_id IN ({','.join(['%s'] * len(product_ids_to_remove))})
-        """, [user_id] + product_ids_to_remove)
-
+        execute_values(cur, """
+            INSERT INTO transaction_items
+            (transaction_id, product_id, seller_id, quantity, price_at_sale, listing_type)
+            VALUES %s
+        """, [
+            (transaction_id, pid, products[pid]['seller_id'], quantities[pid],
+             products[pid]['price'] or 0, products[pid]['listing_type'])
+            for pid in product_ids
+        ], page_size=len(product_ids))
+
+        cur.execute("UPDATE products SET status = 'pending_sale' WHERE id = ANY(%s)", (product_ids,))
+        catalog.bump_version(conn)
+
+        create_notifications([
+            (products[pid]['seller_id'],
+             f"New order received for '{products[pid]['name']}' (Txn #{transaction_id}).",
+             'new_order', user_id, f'/receipt/{transaction_id}')
+            for pid in product_ids
+        ], conn)
+
+        cur.execute("DELETE FROM cart WHERE user_id = %s AND product_id = ANY(%s)", (user_id, product_ids))
+        engagement.record(conn, 'checkout', product_ids)
 
         conn.commit()
         cur.close(); conn.close()
@@ -724,7 +1000,7 @@ def report_transaction(transaction_id):
             msg = f"Transaction cancelled by {buyer_name}. Reason: {reason}. Your item is now available again."
             create_notification(seller_id, msg, "transaction_cancelled", conn, buyer_id, f"/transactions")
 
-        
+        catalog.bump_version(conn)
         conn.commit()
         cur.close()
         conn.close()
@@ -736,6 +1012,41 @@ def report_transaction(transaction_id):
         if conn: conn.close()
         return jsonify({"error": str(e)}), 500
     
+@app.route('/api/users/<int:user_id>/listing-stats', methods=['GET'])
+def get_listing_stats(user_id):
+    """Views and engagement counters for each of a seller's listings.
+
+    Views are written behind (utils.view_counter), so the last few seconds
+    of them may not be counted yet.
+    """
+    conn = None
+    try:
+        conn = get_db_connection()
+        if not conn:
+            return jsonify({"error": "Database connection failed"}), 500
+
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT p.id AS product_id, p.name, p.status,
+                   COALESCE(e.views, 0) AS views,
+                   COALESCE(e.cart_adds, 0) AS cart_adds,
+                   COALESCE(e.requests, 0) AS requests,
+                   COALESCE(e.checkouts, 0) AS checkouts
+            FROM products p
+            LEFT JOIN product_engagement e ON e.product_id = p.id
+            WHERE p.seller_id = %s
+            ORDER BY p.created_at DESC, p.id DESC
+        """, (user_id,))
+        stats = cur.fetchall()
+        cur.close()
+        conn.close()
+
+        return jsonify(stats), 200
+    except Exception as e:
+        if conn: conn.close()
+        print(f"Listing Stats Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/users/<int:user_id>/transactions', methods=['GET'])
 def get_user_transactions(user_id):
     conn = None
@@ -804,6 +1115,7 @@ def get_user_transactions(user_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/rentals', methods=['POST'])
+@idempotent
 def create_rental():
     conn = None
     try:
@@ -882,6 +1194,7 @@ def create_rental():
             sender_id=renter_id,
             deep_link=f"/rentalrequests?id={new_rental_id}"
         )
+        engagement.record(conn, 'request', [product_id])
         
         conn.commit()
         cur.close()
@@ -989,6 +1302,7 @@ def update_rental_status(rental_id):
             msg = f"Your rental request for '{product_name}' was accepted by {owner_username}."
             create_notification(renter_id, msg, "rental_accepted", conn, current_user_id, f"/rentalrequests?id={rental_id}")
             cur.execute("UPDATE products SET status = 'rented' WHERE id = %s", (product_id,))
+            catalog.bump_version(conn)
             
             cur.execute("""
                 UPDATE rentals
@@ -1012,6 +1326,7 @@ def update_rental_status(rental_id):
             product_stat = cur.fetchone()['status']
             if product_stat == 'rented':
                 cur.execute("UPDATE products SET status = 'available' WHERE id = %s", (product_id,))
+                catalog.bump_version(conn)
 
         elif status == 'completed':
             # Logic: Only Owner can mark as returned/completed.
@@ -1032,6 +1347,7 @@ def update_rental_status(rental_id):
             msg = f"Rental for '{product_name}' marked as returned. Transaction complete."
             create_notification(renter_id, msg, "rental_completed", conn, current_user_id)
             cur.execute("UPDATE products SET status = 'available' WHERE id = %s", (product_id,))
+            catalog.bump_version(conn)
         
         conn.commit()
         conn.close()
@@ -1102,6 +1418,7 @@ def update_swap_status(swap_id):
             
             # Update Product Status
             cur.execute("UPDATE products SET status = 'swapped' WHERE id = %s", (product_id,))
+            catalog.bump_version(conn)
             
             # Auto-reject others
             cur.execute("""
@@ -1160,6 +1477,8 @@ def update_swap_status(swap_id):
         return jsonify({"error": str(e)}), 500
 
 @app.route('/api/swaps', methods=['POST'])
+@streamed_upload(MAX_IMAGE_BYTES)
+@idempotent
 def create_swap():
     conn = None
     try:
@@ -1171,19 +1490,15 @@ def create_swap():
         if offered_item_id == 'null' or offered_item_id == '':
             offered_item_id = None
 
-        image_url = ""
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"swap_{requester_id}_{int(datetime.datetime.now().timestamp())}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
-                image_url = f"/static/uploads/{unique_filename}"
+        upload = form_upload()
 
         conn = get_db_connection()
         if not conn:
             return jsonify({"error": "Database connection failed"}), 500
 
+        upload = session_upload(conn, requester_id, upload)
+        image_url = upload.url if upload else ""
+
         cur = conn.cursor()
         
         cur.execute("SELECT seller_id, name FROM products WHERE id = %s", (product_id,))
@@ -1198,6 +1513,8 @@ def create_swap():
         """, (product_id, offered_item_id, requester_id, offer_description, image_url))
         
         new_swap_id = cur.fetchone()['id']
+        if upload:
+            uploads.add_ref(conn, upload, 'swap', new_swap_id)
         
         cur.execute("SELECT username FROM users WHERE id = %s", (requester_id,))
         requester_username = cur.fetchone()['username']
@@ -1210,12 +1527,17 @@ def create_swap():
             sender_id=requester_id,
             deep_link=f"/swaprequests?id={new_swap_id}"
         )
+        engagement.record(conn, 'request', [product_id])
         
         conn.commit()
         cur.close()
         conn.close()
         
         return jsonify({"message": "Swap request sent successfully!"}), 201
+    except upload_sessions.SessionError as e:
+        if conn:
+            conn.close()
+        return jsonify({"error": str(e)}), e.status
     except Exception as e:
         print(f"Swap Error: {e}")
         if conn:
@@ -1744,6 +2066,7 @@ def add_to_cart():
             cur.execute("UPDATE cart SET quantity = %s WHERE id = %s", (new_quantity, existing_item['id']))
         else:
             cur.execute("INSERT INTO cart (user_id, product_id, quantity) VALUES (%s, %s, %s)", (user_id, product_id, quantity))
+        engagement.record(conn, 'cart', [product_id])
 
         conn.commit(); cur.close(); conn.close()
         return jsonify({"message": "Item added to cart"}), 201
@@ -1795,6 +2118,7 @@ def remove_from_cart(product_id):
         return jsonify({"error": str(e)}), 500
         
 @app.route('/api/users/profile-image', methods=['POST'])
+@streamed_upload(MAX_IMAGE_BYTES)
 def upload_profile_image():
     conn = None
     try:
@@ -1805,18 +2129,24 @@ def upload_profile_image():
         file = request.files['image']
         if file.filename == '': return jsonify({"error": "No selected file"}), 400
 
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            unique_filename = f"profile_{user_id}_{int(datetime.datetime.now().timestamp())}_{filename}"
-            file.save(os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
-            image_url = f"/static/uploads/{unique_filename}"
-
+        upload = save_upload(file)
+        if upload:
+            image_url = upload.url
             conn = get_db_connection()
             cur = conn.cursor()
             cur.execute("UPDATE users SET profile_image = %s WHERE id = %s", (image_url, user_id))
+            uploads.drop_refs(conn, 'profile', [user_id])
+            uploads.add_ref(conn, upload, 'profile', user_id)
+            catalog.bump_version(conn)
+            etag.bump_profile_version(conn, [user_id])
+            etag.bump_rater_identity(conn, user_id)
             conn.commit()
             cur.close(); conn.close()
-            return jsonify({"message": "Profile updated", "image_url": image_url}), 200
+            return jsonify({
+                "message": "Profile updated",
+                "image_url": image_url,
+                "image_variants": images.variant_urls(image_url),
+            }), 200
         else:
             return jsonify({"error": "File type not allowed"}), 400
     except Exception as e:
@@ -1831,6 +2161,15 @@ def get_user_profile(user_id):
         
         conn = get_db_connection()
         cur = conn.cursor()
+
+        versions = etag.user_versions(cur, user_id)
+        if versions:
+            viewer = current_user_id if current_user_id and current_user_id.isdigit() else '0'
+            tag = f"profile-{user_id}-{versions['profile_version']}-v{viewer}"
+            cached = etag.not_modified(tag, private=True)
+            if cached:
+                cur.close(); conn.close()
+                return cached
         
         cur.execute("SELECT id, username, email, bio, profile_image, course, year_level FROM users WHERE id = %s", (user_id,))
         user = cur.fetchone()
@@ -1860,8 +2199,9 @@ def get_user_profile(user_id):
         user['followers'] = followers_count
         user['following'] = following_count
         user['is_following'] = is_following
+        images.add_variant_urls(user, 'profile_image', 'profile_image_variants')
         
-        return jsonify(user), 200
+        return etag.tagged(jsonify(user), tag, private=True)
         
     except Exception as e:
         if conn: conn.close()
@@ -1898,6 +2238,7 @@ def follow_user():
         cur.execute("SELECT username FROM users WHERE id = %s", (int(follower_id),))
         follower_name = cur.fetchone()['username']
         create_notification(int(followed_id), f"{follower_name} started following you.", "new_follower", conn, int(follower_id), f'/user-ratings/{followed_id}')
+        etag.bump_profile_version(conn, [follower_id, followed_id])
 
         conn.commit()
         cur.close(); conn.close()
@@ -1927,6 +2268,8 @@ def unfollow_user():
             DELETE FROM user_relationships 
             WHERE follower_id = %s AND followed_id = %s
         """, (int(follower_id), int(followed_id)))
+        if cur.rowcount:
+            etag.bump_profile_version(conn, [follower_id, followed_id])
 
         conn.commit()
         cur.close(); conn.close()
@@ -1941,14 +2284,34 @@ def unfollow_user():
 def get_product_details(product_id):
     conn = None
     try:
+        if catalog_snapshot.ENABLED:
+            snapshot = catalog_snapshot.snapshot.get()
+            tag = f"catalog-{snapshot.version}-p{product_id}"
+            cached = etag.not_modified(tag)
+            if cached:
+                views.hit(product_id)
+                return cached
+            product = snapshot.by_id.get(product_id)
+            if product:
+                views.hit(product_id)
+                return etag.tagged(jsonify(product), tag)
+
+        # Not available any more (sold, rented, archived) or snapshot disabled.
         conn = get_db_connection()
         if not conn: return jsonify({"error": "DB Error"}), 500
 
         cur = conn.cursor()
+        if not catalog_snapshot.ENABLED:
+            tag = f"catalog-{catalog.current_version(cur)}-p{product_id}"
+            cached = etag.not_modified(tag)
+            if cached:
+                cur.close(); conn.close()
+                views.hit(product_id)
+                return cached
         
         # Select specific product by ID
-        query = """
-            SELECT p.*, u.username as seller_name, u.profile_image as seller_image
+        query = f"""
+            SELECT {catalog.PRODUCT_COLUMNS}, u.username as seller_name, u.profile_image as seller_image
             FROM products p
             JOIN users u ON p.seller_id = u.id
             WHERE p.id = %s
@@ -1960,7 +2323,8 @@ def get_product_details(product_id):
         conn.close()
         
         if product:
-            return jsonify(product), 200
+            views.hit(product_id)
+            return etag.tagged(jsonify(images.add_variant_urls(product)), tag)
         else:
             return jsonify({"error": "Product not found"}), 404
 
@@ -1968,7 +2332,48 @@ def get_product_details(product_id):
         if conn: conn.close()
         return jsonify({"error": str(e)}), 500
         
+@app.route('/api/products/<int:product_id>/similar', methods=['GET'])
+def get_similar_products(product_id):
+    """Precomputed similar listings (see utils.similar), as listing cards."""
+    conn = None
+    try:
+        limit = similar.DEFAULT_LIMIT
+        if 'limit' in request.args:
+            limit = min(catalog.parse_limit(request.args), similar.TOP_K)
+        fields = catalog.parse_fields(request.args)
+
+        conn = get_db_connection()
+        if not conn: return jsonify({"error": "DB Error"}), 500
+
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT {catalog.select_list(fields)}, s.score
+            FROM product_similar s
+            JOIN products p ON p.id = s.similar_id
+            JOIN users u ON p.seller_id = u.id
+            WHERE s.product_id = %s AND p.status = 'available'
+            ORDER BY s.score DESC, s.similar_id
+            LIMIT %s
+        """, (product_id, limit))
+        items = cur.fetchall()
+        if 'image_url' in fields:
+            items = [images.add_variant_urls(item) for item in items]
+        cur.close()
+        conn.close()
+
+        return jsonify({"items": items}), 200
+
+    except ValueError as e:
+        if conn: conn.close()
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        if conn: conn.close()
+        print(f"Similar Products Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/messages', methods=['POST'])
+@streamed_upload(MAX_IMAGE_BYTES)
+@idempotent
 def send_message():
     conn = None
     try:
@@ -1985,15 +2390,9 @@ def send_message():
         if int(sender_id) == int(receiver_id):
             return jsonify({"error": "Cannot send message to yourself."}), 400
 
-        image_url = None
         # Check for file upload
-        if 'image' in request.files:
-            file = request.files['image']
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                unique_filename = f"chat_{sender_id}_{int(datetime.datetime.now().timestamp())}_{filename}"
-                file.save(os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
-                image_url = f"/static/uploads/{unique_filename}"
+        upload = save_upload(request.files.get('image'))
+        image_url = upload.url if upload else None
 
         # CRITICAL CHECK: Ensure there is content (text or image)
         if not message_text and not image_url:
@@ -2010,6 +2409,8 @@ def send_message():
         """, (sender_id, receiver_id, message_text, product_id, image_url))
         
         new_msg = cur.fetchone()
+        if upload:
+            uploads.add_ref(conn, upload, 'message', new_msg['id'])
         conn.commit()
         
         # Notify Receiver
@@ -2216,6 +2617,7 @@ def submit_rating():
             int(rater_id), 
             f'/user-ratings/{rated_user_id}' 
         )
+        etag.bump_ratings_version(conn, [rated_user_id])
         conn.commit()
         conn.close()
         return jsonify({"message": "Rating submitted successfully"}), 201
@@ -2303,6 +2705,13 @@ def get_user_average_rating_api(user_id):
     try:
         conn = get_db_connection()
         cur = conn.cursor()
+
+        versions = etag.user_versions(cur, user_id)
+        tag = f"ratings-{user_id}-{versions['ratings_version'] if versions else 0}"
+        cached = etag.not_modified(tag)
+        if cached:
+            cur.close(); conn.close()
+            return cached
         
         cur.execute("""
             SELECT 
@@ -2316,10 +2725,10 @@ def get_user_average_rating_api(user_id):
         
         conn.close()
         
-        return jsonify({
+        return etag.tagged(jsonify({
             "average_rating": float(result['average_rating']) if result['average_rating'] else 0.0,
             "total_reviews": result['total_reviews']
-        }), 200
+        }), tag)
 
     except Exception as e:
         if conn: conn.close()
@@ -2332,6 +2741,13 @@ def get_all_user_reviews(user_id):
     try:
         conn = get_db_connection()
         cur = conn.cursor()
+
+        versions = etag.user_versions(cur, user_id)
+        tag = f"reviews-{user_id}-{versions['ratings_version'] if versions else 0}"
+        cached = etag.not_modified(tag)
+        if cached:
+            cur.close(); conn.close()
+            return cached
         
         cur.execute("""
             SELECT 
@@ -2356,7 +2772,7 @@ def get_all_user_reviews(user_id):
         
         cur.close(); conn.close()
         
-        return jsonify(reviews), 200
+        return etag.tagged(jsonify(reviews), tag)
 
     except Exception as e:
         if conn: conn.close()
@@ -2386,6 +2802,9 @@ def update_user_settings():
             SET username = %s, bio = %s, course = %s, year_level = %s
             WHERE id = %s
         """, (username, bio, course, year_level, user_id))
+        catalog.bump_version(conn)
+        etag.bump_profile_version(conn, [user_id])
+        etag.bump_rater_identity(conn, user_id)
 
         conn.commit()
         cur.close()
@@ -0,0 +1,267 @@
+"""Query-plan audit for the SQL issued by the Flask routes.
+
+Runs a scripted test-client session against a seeded scratch schema,
+captures every statement through the cursor listener in utils.db, then
+re-runs each distinct statement under EXPLAIN (ANALYZE, BUFFERS) and
+reports, per endpoint:
+
+  * sequential scans on tables bigger than --seq-scan-rows
+  * sorts that spilled to disk
+  * nested loops whose inner side ran more than --loop-limit times
+  * row estimates off by more than --estimate-factor (on nodes handling
+    at least --estimate-min-rows rows)
+
+Writes are explained inside a savepoint that is rolled back.
+
+    python audit_queries.py --scale 2
+    python audit_queries.py --fail-on-findings   # non-zero exit for CI
+"""
+import argparse
+import os
+import re
+import sys
+from collections import OrderedDict
+
+SCHEMA = 'audit_queries'
+
+_EXPLAINABLE = re.compile(r'^\s*(WITH|SELECT|INSERT|UPDATE|DELETE)\b', re.IGNORECASE)
+
+
+def build_scenario(ids):
+    u, v = ids['seller'], ids['buyer']
+    p, p2 = ids['product'], ids['product2']
+    return [
+        ('GET', '/api/products', {}),
+        ('GET', '/api/products?sort=price_asc&listing_type=sell&availability=monday,friday', {}),
+        ('GET', '/api/products?q=book&sort=newest&limit=24', {}),
+        ('GET', '/api/products?sort=trending&listing_type=rent&limit=24', {}),
+        ('GET', '/api/products/search?q=used+book&listing_type=sell', {}),
+        ('GET', '/api/products/facets?listing_type=sell&availability=monday', {}),
+        ('GET', f'/api/bootstrap?user_id={v}', {}),
+        ('GET', f'/api/products/{p}', {}),
+        ('GET', f'/api/notifications/{u}', {}),
+        ('PUT', '/api/notifications/mark_read', {'json': {'mark_all': True, 'user_id': u}}),
+        ('GET', f'/api/cart?user_id={v}', {}),
+        ('POST', '/api/cart', {'json': {'user_id': v, 'product_id': p}}),
+        ('PUT', f'/api/cart/{p}', {'json': {'user_id': v, 'quantity': 2}}),
+        ('POST', '/api/transactions', {'json': {'user_id': v, 'items': [{'product_id': p}, {'product_id': p2}]}}),
+        ('GET', f'/api/transactions/receipt/{ids["transaction"]}', {}),
+        ('GET', f'/api/users/{u}/transactions', {}),
+        ('GET', f'/api/users/{u}/listing-stats', {}),
+        ('PUT', f'/api/transactions/{ids["transaction"]}/complete', {}),
+        ('PUT', f'/api/transactions/{ids["transaction"]}/report', {'json': {'reason': 'audit'}}),
+        ('POST', '/api/rentals', {'json': {'product_id': ids['rent_product'], 'renter_id': v,
+                                           'start_date': '2031-01-10', 'end_date': '2031-01-12'}}),
+        ('GET', f'/api/rentals/requests/{u}', {}),
+        ('PUT', f'/api/rentals/requests/{ids["rental"]}/status', {'json': {'status': 'accepted', 'current_user_id': u}}),
+        ('GET', f'/api/swaps/requests/{u}', {}),
+        ('PUT', f'/api/swaps/requests/{ids["swap"]}/status', {'json': {'status': 'accepted', 'current_user_id': u}}),
+        ('GET', f'/api/users/profile/{u}?current_user_id={v}', {}),
+        ('POST', '/api/users/follow', {'json': {'follower_id': v, 'followed_id': u}}),
+        ('GET', f'/api/messages/threads/{u}', {}),
+        ('GET', f'/api/messages/threads/{u}?q=student1', {}),
+        ('GET', f'/api/messages/thread/{v}?current_user_id={u}', {}),
+        ('POST', '/api/messages', {'data': {'sender_id': v, 'receiver_id': u, 'message': 'audit'}}),
+        ('GET', f'/api/users/{u}/ratings/average', {}),
+        ('GET', f'/api/users/{u}/reviews/all', {}),
+        ('PUT', '/api/users/settings/profile', {'json': {'user_id': u, 'username': 'audited', 'bio': '',
+                                                         'course': 'BSIT', 'year_level': '4'}}),
+    ]
+
+
+def sample_ids(cur):
+    cur.execute("""
+        SELECT p.seller_id, p.id FROM products p
+        WHERE p.status = 'available' AND p.listing_type = 'sell'
+        ORDER BY p.id LIMIT 2
+    """)
+    first, second = cur.fetchall()
+    cur.execute("SELECT id FROM users WHERE id <> %s ORDER BY id LIMIT 1", (first['seller_id'],))
+    buyer = cur.fetchone()['id']
+    cur.execute("SELECT id FROM products WHERE status = 'available' AND listing_type = 'rent' ORDER BY id LIMIT 1")
+    rent_product = cur.fetchone()['id']
+    cur.execute("SELECT id FROM rentals WHERE status = 'pending' ORDER BY id LIMIT 1")
+    rental = cur.fetchone()['id']
+    cur.execute("SELECT id FROM swaps WHERE status = 'pending' ORDER BY id LIMIT 1")
+    swap = cur.fetchone()['id']
+    cur.execute("SELECT id FROM transactions ORDER BY id LIMIT 1")
+    transaction = cur.fetchone()['id']
+    return {
+        'seller': first['seller_id'], 'buyer': buyer,
+        'product': first['id'], 'product2': second['id'],
+        'rent_product': rent_product, 'rental': rental, 'swap': swap, 'transaction': transaction,
+    }
+
+
+def capture(flask_app, scenario):
+    """Drive the scenario through the test client; return {endpoint: [(query, vars)]}."""
+    from flask import has_request_context, request
+    from utils.db import add_query_listener, remove_query_listener
+
+    captured = OrderedDict()
+
+    def listener(cursor, query, vars, seconds):
+        if not has_request_context():
+            return
+        key = f"{request.method} {request.url_rule.rule if request.url_rule else request.path}"
+        if isinstance(query, bytes):
+            query = query.decode('utf-8')
+        statements = captured.setdefault(key, OrderedDict())
+        statements.setdefault(' '.join(query.split()), (query, vars))
+
+    client = flask_app.test_client()
+    add_query_listener(listener)
+    try:
+        for method, url, kwargs in scenario:
+            response = client.open(url, method=method, **kwargs)
+            if response.status_code >= 500:
+                print(f"   ! {method} {url} -> {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    finally:
+        remove_query_listener(listener)
+    return {endpoint: list(statements.values()) for endpoint, statements in captured.items()}
+
+
+def table_sizes(cur):
+    cur.execute("""
+        SELECT c.relname, c.reltuples::bigint AS rows
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = current_schema() AND c.relkind = 'r'
+    """)
+    return {row['relname']: row['rows'] for row in cur.fetchall()}
+
+
+def findings_for(plan, sizes, args):
+    from utils.explain import walk
+
+    findings = []
+    for node in walk(plan['Plan']):
+        node_type = node['Node Type']
+        relation = node.get('Relation Name')
+
+        if node_type == 'Seq Scan' and sizes.get(relation, 0) >= args.seq_scan_rows:
+            removed = node.get('Rows Removed by Filter', 0)
+            findings.append(f"seq scan on {relation} (~{sizes[relation]} rows, {removed} removed by filter)")
+
+        if node.get('Sort Space Type') == 'Disk':
+            findings.append(f"sort spilled to disk ({node.get('Sort Space Used')} kB, {node.get('Sort Method')})")
+
+        if node_type == 'Nested Loop':
+            inner = node.get('Plans', [None, None])[-1]
+            if inner and inner.get('Actual Loops', 0) > args.loop_limit:
+                findings.append(
+                    f"nested loop ran inner {inner['Node Type']} {inner.get('Actual Loops')} times"
+                )
+
+        # Bitmap nodes always report 0 actual rows, and tiny counts are noise.
+        if node_type in ('Bitmap Index Scan', 'BitmapOr', 'BitmapAnd'):
+            continue
+        planned = max(node.get('Plan Rows', 0), 1)
+        actual = max(node.get('Actual Rows', 0), 1)
+        if (node.get('Actual Loops', 0)
+                and max(planned, actual) >= args.estimate_min_rows
+                and max(planned / actual, actual / planned) >= args.estimate_factor):
+            findings.append(
+                f"row estimate off on {node_type}{' ' + relation if relation else ''}: "
+                f"planned {node.get('Plan Rows')}, actual {node.get('Actual Rows')}"
+            )
+    return list(OrderedDict.fromkeys(findings))
+
+
+def audit(conn, captured, args):
+    from utils.explain import explain
+
+    results = OrderedDict()
+    with conn.cursor() as cur:
+        sizes = table_sizes(cur)
+        for endpoint, statements in captured.items():
+            rows = []
+            for query, vars in statements:
+                if not _EXPLAINABLE.match(query) or query.strip().upper() == 'SELECT 1':
+                    continue
+                cur.execute("SAVEPOINT audit_stmt")
+                try:
+                    plan = explain(cur, query, vars)
+                    rows.append((query, plan['Execution Time'], findings_for(plan, sizes, args)))
+                except Exception as e:
+                    rows.append((query, None, [f"could not explain: {str(e).strip()}"]))
+                finally:
+                    cur.execute("ROLLBACK TO SAVEPOINT audit_stmt")
+            results[endpoint] = rows
+    conn.rollback()
+    return results
+
+
+def report(results):
+    total = 0
+    for endpoint, rows in results.items():
+        flagged = [row for row in rows if row[2]]
+        total += sum(len(row[2]) for row in flagged)
+        status = f"{len(flagged)} flagged" if flagged else "ok"
+        print(f"\n{endpoint}  ({len(rows)} statements, {status})")
+        for query, ms, findings in flagged:
+            timing = f"{ms:.2f} ms" if ms is not None else "n/a"
+            print(f"  [{timing}] {' '.join(query.split())[:110]}")
+            for finding in findings:
+                print(f"      - {finding}")
+    print(f"\n{total} finding(s) across {len(results)} endpoint(s).")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--seq-scan-rows', type=int, default=1000)
+    parser.add_argument('--loop-limit', type=int, default=1000)
+    parser.add_argument('--estimate-factor', type=float, default=10.0)
+    parser.add_argument('--estimate-min-rows', type=int, default=100)
+    parser.add_argument('--keep', action='store_true', help=f"keep the {SCHEMA} schema afterwards")
+    parser.add_argument('--fail-on-findings', action='store_true')
+    args = parser.parse_args()
+
+    # Every pooled connection, including the app's, lands in the scratch schema.
+    os.environ['PGOPTIONS'] = f"{os.getenv('PGOPTIONS', '')} -c search_path={SCHEMA}".strip()
+
+    import migrations
+    from seed import seed_database
+    from utils.db import get_db_connection
+
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("Database connection failed")
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+    conn.autocommit = False
+
+    try:
+        migrations.migrate(conn)
+        print(f"Seeding {SCHEMA} at scale {args.scale}...")
+        seed_database(conn, args.scale)
+        with conn.cursor() as cur:
+            ids = sample_ids(cur)
+        conn.rollback()
+        conn.close()
+
+        from app import app as flask_app
+        captured = capture(flask_app, build_scenario(ids))
+
+        conn = get_db_connection()
+        total = report(audit(conn, captured, args))
+    finally:
+        conn.rollback()
+        if not args.keep:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            conn.autocommit = False
+        conn.close()
+
+    if args.fail_on_findings and total:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Payload size and JSON encode time: full product rows vs. listing cards.
+
+Builds a synthetic catalog in memory (no database needed) shaped like the
+rows get_products returns: Decimal prices, datetimes and descriptions of a
+few hundred characters. It then encodes it with the app's own JSON
+provider, the way jsonify does. Both payloads go through catalog.project,
+as in the route: full records are fields=all (with image_variants), and
+cards are catalog.CARD_FIELDS (with card_image_url):
+
+    python -m benchmarks.bench_card_projection --products 10000 --runs 5
+"""
+import argparse
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from flask import Flask
+
+from seed import CATEGORIES, CONDITIONS, DAYS, LISTING_TYPES, WORDS
+from utils import catalog
+
+
+def synthetic_rows(count, seed=7):
+    rng = random.Random(seed)
+    now = datetime.datetime(2025, 1, 1)
+    rows = []
+    for i in range(1, count + 1):
+        words = rng.sample(WORDS, 3)
+        rows.append({
+            'id': i,
+            'seller_id': rng.randint(1, count // 10 or 1),
+            'name': f"{words[0].title()} {words[1]} #{i}",
+            'description': ' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 90))),
+            'price': Decimal(rng.randint(1000, 500000)) / 100,
+            'category': rng.choice(CATEGORIES),
+            'condition': rng.choice(CONDITIONS),
+            'availability': ','.join(d for d in DAYS if rng.random() < 0.5),
+            'image_url': f"/static/uploads/product_{i}_{1700000000 + i}_{words[2]}.jpg",
+            'listing_type': rng.choice(LISTING_TYPES),
+            'status': 'available',
+            'created_at': now - datetime.timedelta(minutes=i),
+            'seller_name': f"student{rng.randint(1, 1000)}",
+            'seller_image': f"/static/uploads/profile_{rng.randint(1, 1000)}.jpg",
+        })
+    return rows
+
+
+def measure(encode, payload, runs):
+    timings = []
+    body = None
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = encode(payload())
+        timings.append((time.perf_counter() - started) * 1000)
+    return len(body.encode('utf-8')), statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--page-size', type=int, default=catalog.DEFAULT_PAGE_SIZE)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    rows = synthetic_rows(args.products)
+    page = rows[:args.page_size]
+
+    every_field = tuple(catalog.FIELDS)
+    cases = [
+        (f"whole catalog ({len(rows)})",
+         lambda: catalog.project(rows, every_field), lambda: catalog.project(rows, catalog.CARD_FIELDS)),
+        (f"one page ({len(page)})",
+         lambda: catalog.project(page, every_field), lambda: catalog.project(page, catalog.CARD_FIELDS)),
+    ]
+
+    print(f"\n{'payload':<24} {'full KB':>9} {'card KB':>9} {'ratio':>6} {'full ms':>9} {'card ms':>9}")
+    print('-' * 70)
+    with app.app_context():
+        encode = app.json.dumps
+        for label, full, card in cases:
+            # Both timings include the projection itself.
+            full_bytes, full_ms = measure(encode, full, args.runs)
+            card_bytes, card_ms = measure(encode, card, args.runs)
+            print(f"{label:<24} {full_bytes / 1024:>9.1f} {card_bytes / 1024:>9.1f} "
+                  f"{card_bytes / full_bytes:>6.2f} {full_ms:>9.3f} {card_ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
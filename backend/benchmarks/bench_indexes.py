@@ -0,0 +1,189 @@
+"""Before/after benchmark for the hot-path index migration (0002).
+
+Builds a scratch schema, migrates it to the pre-index version, seeds it,
+times the hot queries from app.py with EXPLAIN ANALYZE, applies the index
+migration and times them again. Point it at a local database:
+
+    python -m benchmarks.bench_indexes --scale 2 --runs 5
+"""
+import argparse
+import statistics
+
+import migrations
+from seed import seed_database
+from utils.db import get_db_connection
+from utils.explain import explain, scan_summary
+
+SCHEMA = 'bench_indexes'
+INDEX_MIGRATION = 2
+
+# (label, SQL as issued by the route, params built from the sample ids)
+QUERIES = [
+    ("get_products", """
+        SELECT p.*, u.username as seller_name, u.profile_image as seller_image
+        FROM products p
+        JOIN users u ON p.seller_id = u.id
+        WHERE p.status = 'available'
+        ORDER BY p.created_at DESC
+        LIMIT 24
+    """, lambda ids: ()),
+    ("get_notifications", """
+        SELECT n.*, u_sender.username as sender_name, u_sender.profile_image as sender_profile_url
+        FROM notifications n
+        LEFT JOIN users u_sender ON n.sender_id = u_sender.id
+        WHERE n.user_id = %s
+        ORDER BY n.created_at DESC
+        LIMIT 50
+    """, lambda ids: (ids['user'],)),
+    ("get_thread_messages", """
+        SELECT m.*, u.username as sender_name, u.profile_image as sender_image
+        FROM messages m
+        JOIN users u ON m.sender_id = u.id
+        WHERE (m.sender_id = %s AND m.receiver_id = %s)
+        OR (m.sender_id = %s AND m.receiver_id = %s)
+        ORDER BY m.created_at ASC
+    """, lambda ids: (ids['sender'], ids['receiver'], ids['receiver'], ids['sender'])),
+    ("get_chat_threads", """
+        SELECT sender_id, receiver_id, created_at
+        FROM messages
+        WHERE sender_id = %s OR receiver_id = %s
+    """, lambda ids: (ids['user'], ids['user'])),
+    ("create_rental overlap", """
+        SELECT id FROM rentals
+        WHERE product_id = %s
+        AND status IN ('pending', 'accepted')
+        AND rent_start <= CURRENT_DATE + 30 AND rent_end >= CURRENT_DATE
+    """, lambda ids: (ids['rented_product'],)),
+    ("get_user_transactions sales", """
+        SELECT t.id, t.amount, t.created_at, t.status, t.receipt_code,
+               json_agg(json_build_object('product_id', ti.product_id, 'product_name', p.name)) AS items
+        FROM transactions t
+        JOIN transaction_items ti ON t.id = ti.transaction_id
+        JOIN products p ON ti.product_id = p.id
+        JOIN users u_buyer ON t.user_id = u_buyer.id
+        WHERE ti.seller_id = %s
+        GROUP BY t.id
+        ORDER BY t.created_at DESC
+    """, lambda ids: (ids['seller'],)),
+    ("get_receipt items", """
+        SELECT ti.quantity, ti.price_at_sale as unit_price, ti.listing_type,
+               p.name as product_name, p.image_url
+        FROM transaction_items ti
+        JOIN products p ON ti.product_id = p.id
+        WHERE ti.transaction_id = %s
+    """, lambda ids: (ids['transaction'],)),
+    ("get_all_user_reviews", """
+        SELECT ur.rating, ur.review_text, ur.created_at, u_rater.username AS rater_name
+        FROM user_ratings ur
+        JOIN users u_rater ON ur.rater_id = u_rater.id
+        WHERE ur.rated_user_id = %s
+        ORDER BY ur.created_at DESC
+    """, lambda ids: (ids['rated_user'],)),
+    ("get_user_average_rating", """
+        SELECT AVG(rating) AS average_rating, COUNT(id) AS total_reviews
+        FROM user_ratings
+        WHERE rated_user_id = %s
+    """, lambda ids: (ids['rated_user'],)),
+    ("get_user_profile followers", """
+        SELECT count(*) FROM user_relationships WHERE followed_id = %s
+    """, lambda ids: (ids['user'],)),
+]
+
+
+def sample_ids(cur):
+    cur.execute("SELECT sender_id, receiver_id FROM messages ORDER BY id LIMIT 1")
+    pair = cur.fetchone()
+    cur.execute("SELECT product_id FROM rentals ORDER BY id LIMIT 1")
+    rented = cur.fetchone()['product_id']
+    cur.execute("SELECT seller_id, transaction_id FROM transaction_items ORDER BY id LIMIT 1")
+    item = cur.fetchone()
+    cur.execute("SELECT rated_user_id FROM user_ratings ORDER BY id LIMIT 1")
+    rated = cur.fetchone()['rated_user_id']
+    return {
+        'user': pair['sender_id'],
+        'sender': pair['sender_id'],
+        'receiver': pair['receiver_id'],
+        'rented_product': rented,
+        'seller': item['seller_id'],
+        'transaction': item['transaction_id'],
+        'rated_user': rated,
+    }
+
+
+def measure(conn, ids, runs):
+    results = {}
+    with conn.cursor() as cur:
+        for label, query, params in QUERIES:
+            timings = []
+            plan = None
+            for _ in range(runs):
+                plan = explain(cur, query, params(ids))
+                timings.append(plan['Execution Time'])
+            results[label] = {
+                'ms': statistics.median(timings),
+                'scans': scan_summary(plan),
+                'shared_hit': plan['Plan'].get('Shared Hit Blocks', 0),
+                'shared_read': plan['Plan'].get('Shared Read Blocks', 0),
+            }
+    conn.rollback()
+    return results
+
+
+def report(before, after):
+    print(f"\n{'query':<30} {'before ms':>10} {'after ms':>10} {'speedup':>8}")
+    print('-' * 62)
+    for label, _, _ in QUERIES:
+        b, a = before[label], after[label]
+        speedup = b['ms'] / a['ms'] if a['ms'] else float('inf')
+        print(f"{label:<30} {b['ms']:>10.3f} {a['ms']:>10.3f} {speedup:>7.1f}x")
+    print()
+    for label, _, _ in QUERIES:
+        print(f"{label}")
+        print(f"    before: {', '.join(before[label]['scans'])}")
+        print(f"    after:  {', '.join(after[label]['scans'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--keep', action='store_true', help=f"keep the {SCHEMA} schema afterwards")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("Database connection failed")
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {SCHEMA}")
+        cur.execute(f"SET search_path TO {SCHEMA}")
+    conn.autocommit = False
+
+    try:
+        migrations.migrate(conn, target=INDEX_MIGRATION - 1)
+        print(f"Seeding {SCHEMA} at scale {args.scale}...")
+        seed_database(conn, args.scale)
+
+        with conn.cursor() as cur:
+            ids = sample_ids(cur)
+        conn.rollback()
+
+        before = measure(conn, ids, args.runs)
+        migrations.migrate(conn, target=INDEX_MIGRATION)
+        after = measure(conn, ids, args.runs)
+        report(before, after)
+    finally:
+        conn.rollback()
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            if not args.keep:
+                cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+            cur.execute("RESET search_path")
+        conn.autocommit = False
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
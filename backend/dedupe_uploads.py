@@ -0,0 +1,108 @@
+"""Move uploads from before content addressing onto <sha256>.<extension> names.
+
+For every local image URL still using an old name (product_3_1765..._x.jpg)
+in products, swaps, messages or users, this hashes the file, hard-links
+it to its content-addressed name (or finds that content already stored),
+rewrites the rows to the new URL and records upload_blobs/upload_refs.
+Identical files collapse onto one name. The old files are left in place
+for clients still holding their URLs; the upload GC removes them once
+nothing references them.
+
+    python dedupe_uploads.py [--dry-run]
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import sys
+
+from utils import catalog, etag, uploads
+from utils.db import get_db_connection
+
+UPLOAD_FOLDER = 'static/uploads'
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(uploads.CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(source, target):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help="report only; change no files or rows")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed.")
+        return 1
+
+    cur = conn.cursor()
+    names = set()
+    for table, column in uploads.OWNER_COLUMNS.values():
+        cur.execute(f"SELECT DISTINCT {column} AS url FROM {table} WHERE {column} LIKE %s",
+                    (uploads.URL_PREFIX + '%',))
+        for row in cur.fetchall():
+            name = row['url'][len(uploads.URL_PREFIX):]
+            if '/' not in name and not uploads.is_content_addressed(name):
+                names.add(name)
+
+    missing = 0
+    renamed = {}
+    first_name = {}
+    duplicate_bytes = 0
+    for name in sorted(names):
+        path = os.path.join(UPLOAD_FOLDER, name)
+        if not os.path.isfile(path):
+            missing += 1
+            continue
+        sha256 = file_digest(path)
+        size = os.path.getsize(path)
+        target = f"{sha256}.{uploads.extension_for(name)}"
+        if sha256 in first_name:
+            duplicate_bytes += size
+        else:
+            first_name[sha256] = name
+        renamed[name] = (target, sha256, size)
+        if not args.dry_run and not os.path.exists(os.path.join(UPLOAD_FOLDER, target)):
+            link_or_copy(path, os.path.join(UPLOAD_FOLDER, target))
+
+    print(f"{len(names)} legacy upload names, {missing} missing on disk, "
+          f"{len(first_name)} distinct contents, {duplicate_bytes / 1024:.1f} KB in duplicates.")
+    if args.dry_run:
+        conn.rollback()
+        conn.close()
+        return 0
+
+    try:
+        for name, (target, sha256, size) in renamed.items():
+            upload = uploads.StoredUpload(sha256, target, size, None, False)
+            for owner_type, (table, column) in uploads.OWNER_COLUMNS.items():
+                cur.execute(f"UPDATE {table} SET {column} = %s WHERE {column} = %s RETURNING id",
+                            (upload.url, uploads.URL_PREFIX + name))
+                owner_ids = [row['id'] for row in cur.fetchall()]
+                if owner_ids:
+                    uploads.add_refs(conn, upload, owner_type, owner_ids)
+                if owner_type == 'profile' and owner_ids:
+                    etag.bump_profile_version(conn, owner_ids)
+        if renamed:
+            catalog.bump_version(conn)
+        conn.commit()
+    finally:
+        conn.close()
+    print(f"✅ Rewrote rows for {len(renamed)} uploads.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+"""Remove uploaded files that no row points at any more.
+
+Deleted listings, replaced profile pictures, and removed swaps and
+messages leave their files behind in static/uploads. This job finds the
+unreferenced ones and moves them to a quarantine directory (default) or
+deletes them (--delete). It covers:
+
+    <name>                      uploads, legacy and content-addressed
+    variants/<v>/<name>.webp    resized variants (utils.images)
+    .upload-*, *.tmp            temp files of requests that died mid-upload
+    .sessions/<id>.part         resumable upload parts with no session left
+
+An upload counts as referenced while products.image_url,
+swaps.offer_image_url, messages.image_url or users.profile_image holds its
+URL, or an unexpired finalized upload session points at it. A variant is
+referenced while its upload is. The referenced names are collected into a
+temp table inside the database, and the directory is read with scandir
+and checked against that table BATCH names at a time. Memory stays
+bounded however many files or rows there are.
+
+Only files last modified more than --grace-hours ago are touched. That
+covers an upload whose row is still being written; uploads.place refreshes
+the mtime when it reuses a stored file. Expired upload sessions are swept
+first. Quarantined files keep their relative path under
+<quarantine>/<run time>/; delete that directory once nothing is missed.
+
+    python gc_uploads.py [--dry-run] [--delete] [--grace-hours 24] [--quarantine DIR]
+"""
+import argparse
+import datetime
+import os
+import shutil
+import sys
+import time
+
+from utils import images, upload_sessions, uploads
+from utils.db import get_db_connection
+
+UPLOAD_FOLDER = 'static/uploads'
+QUARANTINE_FOLDER = 'upload_quarantine'
+BATCH = 1000
+
+
+def referenced_table(cur):
+    """Fill TEMP gc_referenced with every upload name in use, without fetching any."""
+    cur.execute("CREATE TEMP TABLE gc_referenced (name TEXT PRIMARY KEY) ON COMMIT PRESERVE ROWS")
+    for table, column in uploads.OWNER_COLUMNS.values():
+        cur.execute(f"""
+            INSERT INTO gc_referenced (name)
+            SELECT DISTINCT substr({column}, %s) FROM {table} WHERE {column} LIKE %s
+            ON CONFLICT DO NOTHING
+        """, (len(uploads.URL_PREFIX) + 1, uploads.URL_PREFIX + '%'))
+    cur.execute("""
+        INSERT INTO gc_referenced (name)
+        SELECT stored_filename FROM upload_sessions
+        WHERE status = 'complete' AND expires_at > NOW()
+        ON CONFLICT DO NOTHING
+    """)
+    cur.execute("ANALYZE gc_referenced")
+    cur.execute("SELECT COUNT(*) AS n FROM gc_referenced")
+    return cur.fetchone()['n']
+
+
+def scan(folder):
+    """(path relative to folder, kind, key) for every file the GC may remove.
+
+    kind is upload, variant, temp or part; key is what has to be
+    referenced for the file to stay (None for temp files).
+    """
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                if entry.name.startswith('.upload-'):
+                    yield entry.name, 'temp', None
+                elif not entry.name.startswith('.'):
+                    yield entry.name, 'upload', entry.name
+    for variant in images.VARIANTS:
+        directory = os.path.join(folder, images.VARIANT_DIR, variant)
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                path = os.path.join(images.VARIANT_DIR, variant, entry.name)
+                if entry.name.endswith(images.VARIANT_EXTENSION):
+                    yield path, 'variant', entry.name[:-len(images.VARIANT_EXTENSION)]
+                elif entry.name.endswith('.tmp'):
+                    yield path, 'temp', None
+    directory = os.path.join(folder, upload_sessions.SESSION_DIR)
+    if os.path.isdir(directory):
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False) and entry.name.endswith('.part'):
+                    yield os.path.join(upload_sessions.SESSION_DIR, entry.name), 'part', entry.name[:-len('.part')]
+
+
+def batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def unreferenced(cur, batch):
+    """The entries of a scan batch whose key nothing references."""
+    names = [key for _, kind, key in batch if kind in ('upload', 'variant')]
+    parts = [key for _, kind, key in batch if kind == 'part']
+    cur.execute("""
+        SELECT key FROM unnest(%s::text[]) AS k(key)
+        WHERE NOT EXISTS (SELECT 1 FROM gc_referenced r WHERE r.name = k.key)
+    """, (names,))
+    orphan_names = {row['key'] for row in cur.fetchall()}
+    cur.execute("""
+        SELECT key FROM unnest(%s::text[]) AS k(key)
+        WHERE NOT EXISTS (SELECT 1 FROM upload_sessions s WHERE s.id = k.key)
+    """, (parts,))
+    orphan_parts = {row['key'] for row in cur.fetchall()}
+    return [entry for entry in batch
+            if entry[1] == 'temp'
+            or (entry[1] == 'part' and entry[2] in orphan_parts)
+            or (entry[1] in ('upload', 'variant') and entry[2] in orphan_names)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dry-run', action='store_true', help="report only; move or delete nothing")
+    parser.add_argument('--delete', action='store_true', help="delete instead of quarantining")
+    parser.add_argument('--grace-hours', type=float, default=24,
+                        help="leave files modified more recently than this (default 24)")
+    parser.add_argument('--quarantine', default=QUARANTINE_FOLDER,
+                        help=f"where quarantined files go (default {QUARANTINE_FOLDER})")
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed.")
+        return 1
+
+    cutoff = time.time() - args.grace_hours * 3600
+    target = os.path.join(args.quarantine, datetime.datetime.now().strftime('%Y%m%d-%H%M%S'))
+    scanned = 0
+    recent = 0
+    removed = {}
+    removed_bytes = {}
+    try:
+        cur = conn.cursor()
+        if not args.dry_run:
+            swept = 0
+            while True:
+                count = upload_sessions.sweep(conn, UPLOAD_FOLDER)
+                conn.commit()
+                if not count:
+                    break
+                swept += count
+            print(f"Swept {swept} expired upload sessions.")
+        print(f"{referenced_table(cur)} upload names are referenced.")
+
+        for batch in batches(scan(UPLOAD_FOLDER), BATCH):
+            scanned += len(batch)
+            orphan_blobs = []
+            for path, kind, key in unreferenced(cur, batch):
+                full = os.path.join(UPLOAD_FOLDER, path)
+                try:
+                    stat = os.stat(full)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime > cutoff:
+                    recent += 1
+                    continue
+                removed[kind] = removed.get(kind, 0) + 1
+                removed_bytes[kind] = removed_bytes.get(kind, 0) + stat.st_size
+                if kind == 'upload' and uploads.is_content_addressed(key):
+                    orphan_blobs.append(key.split('.', 1)[0])
+                if args.dry_run:
+                    continue
+                if args.delete:
+                    os.remove(full)
+                else:
+                    os.makedirs(os.path.dirname(os.path.join(target, path)), exist_ok=True)
+                    shutil.move(full, os.path.join(target, path))
+            if orphan_blobs and not args.dry_run:
+                cur.execute("DELETE FROM upload_refs WHERE sha256 = ANY(%s)", (orphan_blobs,))
+                cur.execute("DELETE FROM upload_blobs WHERE sha256 = ANY(%s)", (orphan_blobs,))
+                conn.commit()
+        cur.execute("DROP TABLE gc_referenced")
+        conn.commit()
+    finally:
+        conn.close()
+
+    action = "Would reclaim" if args.dry_run else ("Deleted" if args.delete else f"Quarantined to {target}:")
+    total = sum(removed_bytes.values())
+    print(f"Scanned {scanned} files; {recent} unreferenced but inside the {args.grace_hours:g}h grace period.")
+    for kind in sorted(removed):
+        print(f"  {kind:8} {removed[kind]:6} files  {removed_bytes[kind] / 1024 / 1024:9.1f} MB")
+    print(f"✅ {action} {sum(removed.values())} files, {total:,} bytes ({total / 1024 / 1024:.1f} MB).")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import argparse
+import sys
+
+from utils import bulk_import, catalog
+from utils.db import get_db_connection
+
+UPLOAD_FOLDER = 'static/uploads'
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import listings for one seller from CSV or JSON (see utils/bulk_import.py).")
+    parser.add_argument('file', help="CSV, JSON array or JSON Lines file; '-' reads stdin")
+    parser.add_argument('--seller', type=int, required=True, help="seller user id")
+    parser.add_argument('--format', choices=('csv', 'json'), help="default: from the file extension")
+    parser.add_argument('--dry-run', action='store_true', help="validate and load, then roll back")
+    args = parser.parse_args()
+
+    fmt = args.format or bulk_import.detect_format(args.file)
+    if not fmt:
+        print("Cannot tell the format from the file name; pass --format csv|json.")
+        return 1
+
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed.")
+        return 1
+    stream = sys.stdin.buffer if args.file == '-' else open(args.file, 'rb')
+    try:
+        result = bulk_import.import_products(conn, args.seller, bulk_import.records(stream, fmt), UPLOAD_FOLDER)
+        for error in result['errors']:
+            print(f"  row {error['row']}: {error['error']}")
+        if result['failed'] > len(result['errors']):
+            print(f"  ... and {result['failed'] - len(result['errors'])} more")
+        if args.dry_run:
+            conn.rollback()
+            print(f"Dry run: {result['imported']} of {result['total']} rows would import.")
+            return 0
+        if result['imported']:
+            catalog.bump_version(conn)
+        conn.commit()
+    except bulk_import.ImportFileError as e:
+        conn.rollback()
+        print(f"❌ {e}")
+        return 1
+    finally:
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        conn.close()
+
+    print(f"✅ Imported {result['imported']} of {result['total']} rows ({result['failed']} failed).")
+    if result['imported']:
+        print("Run `python rebuild_similar.py` to add them to similar-item lists.")
+    return 0 if result['imported'] or not result['total'] else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
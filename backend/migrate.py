@@ -0,0 +1,39 @@
+import sys
+
+import migrations
+
+USAGE = """Usage:
+    python migrate.py               Apply pending migrations
+    python migrate.py status        Show applied / pending migrations
+    python migrate.py reset --yes   Drop every table and migrate from scratch
+"""
+
+
+def main(argv):
+    command = argv[0] if argv else 'up'
+
+    if command == 'up':
+        applied = migrations.migrate()
+        if applied:
+            print(f"✅ Applied {len(applied)} migration(s).")
+        else:
+            print("✅ Database schema is up to date.")
+    elif command == 'status':
+        for migration, applied in migrations.status():
+            mark = 'x' if applied else ' '
+            print(f"[{mark}] {migration.version:04d}_{migration.name}")
+    elif command == 'reset':
+        if '--yes' not in argv:
+            print("Refusing to drop every table without --yes.")
+            return 1
+        print("💥 DROPPING ALL TABLES...")
+        migrations.reset()
+        print("✅ SUCCESS! Database has been nuked and rebuilt correctly.")
+    else:
+        print(USAGE)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,253 @@
+"""Versioned schema migrations tracked in the schema_migrations table.
+
+Each migration is a module in this package named vNNNN_description.py with
+a STATEMENTS list. Migrations run inside one transaction unless the module
+sets TRANSACTIONAL = False, which is required for CREATE INDEX CONCURRENTLY;
+those statements run one by one in autocommit mode so hot tables are never
+locked against writes while an index builds. Both kinds run with
+lock_timeout = MIGRATION_LOCK_TIMEOUT, so a statement stuck behind a long
+transaction fails instead of queueing every read and write behind it. A STATEMENTS entry may also
+be a callable taking a cursor, for steps that depend on what the server
+offers (optional extensions).
+
+Run them with `python migrate.py`; workers only call check_schema().
+"""
+import importlib
+import os
+import re
+
+import psycopg2
+
+from utils.db import get_db_connection
+
+# Arbitrary constant shared by every process that runs migrations.
+MIGRATION_LOCK_ID = 727274
+
+LOCK_TIMEOUT = os.getenv('MIGRATION_LOCK_TIMEOUT', '5s')
+
+_MODULE_RE = re.compile(r'^v(\d{4})_(\w+)\.py$')
+_INDEX_NAME_RE = re.compile(r'INDEX\s+(?:CONCURRENTLY\s+)?(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+
+
+class Migration:
+    def __init__(self, version, name, module):
+        self.version = version
+        self.name = name
+        self.statements = module.STATEMENTS
+        self.transactional = getattr(module, 'TRANSACTIONAL', True)
+
+    def __repr__(self):
+        return f"<Migration {self.version:04d} {self.name}>"
+
+
+def load_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(os.path.dirname(__file__))):
+        match = _MODULE_RE.match(filename)
+        if not match:
+            continue
+        module = importlib.import_module(f"{__name__}.{filename[:-3]}")
+        migrations.append(Migration(int(match.group(1)), match.group(2), module))
+    return migrations
+
+
+def latest_version():
+    migrations = load_migrations()
+    return migrations[-1].version if migrations else 0
+
+
+def _ensure_table(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name VARCHAR(200) NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+
+def applied_versions(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT version FROM schema_migrations")
+        return {row['version'] for row in cur.fetchall()}
+
+
+def _drop_invalid_indexes(conn, migration):
+    """Drop indexes left INVALID by an interrupted CONCURRENTLY build.
+
+    CREATE INDEX CONCURRENTLY IF NOT EXISTS would otherwise skip them on the
+    next run and leave the migration "applied" without a usable index.
+    """
+    names = set()
+    for statement in migration.statements:
+        if callable(statement):
+            continue
+        names.update(name.lower() for name in _INDEX_NAME_RE.findall(statement))
+    if not names:
+        return
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT c.relname
+            FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE NOT i.indisvalid
+            AND n.nspname = current_schema()
+            AND c.relname = ANY(%s)
+        """, (list(names),))
+        for row in cur.fetchall():
+            print(f"   - Dropping invalid index {row['relname']} from an earlier run")
+            cur.execute(f'DROP INDEX CONCURRENTLY IF EXISTS "{row["relname"]}"')
+
+
+def _run(cur, statement):
+    if callable(statement):
+        statement(cur)
+    else:
+        cur.execute(statement)
+
+
+def _apply(conn, migration):
+    if migration.transactional:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL lock_timeout = %s", (LOCK_TIMEOUT,))
+            for statement in migration.statements:
+                _run(cur, statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (migration.version, migration.name)
+            )
+        conn.commit()
+        return
+
+    conn.autocommit = True
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET lock_timeout = %s", (LOCK_TIMEOUT,))
+        _drop_invalid_indexes(conn, migration)
+        with conn.cursor() as cur:
+            for statement in migration.statements:
+                _run(cur, statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, name) VALUES (%s, %s)",
+                (migration.version, migration.name)
+            )
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("RESET lock_timeout")
+        conn.autocommit = False
+
+
+def migrate(conn=None, target=None):
+    """Apply every pending migration up to `target` (default: latest).
+
+    A session advisory lock makes concurrent runs (two deploys, a deploy and
+    a manual run) wait for each other instead of racing.
+    """
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s)", (MIGRATION_LOCK_ID,))
+        conn.commit()
+        try:
+            _ensure_table(conn)
+            done = applied_versions(conn)
+            conn.commit()
+            applied = []
+            for migration in load_migrations():
+                if migration.version in done:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+                print(f"Applying {migration.version:04d}_{migration.name}...")
+                try:
+                    _apply(conn, migration)
+                except Exception:
+                    conn.rollback()
+                    raise
+                applied.append(migration)
+            return applied
+        finally:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s)", (MIGRATION_LOCK_ID,))
+            conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def status(conn=None):
+    """Return [(migration, applied)] for every known migration."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+    try:
+        _ensure_table(conn)
+        done = applied_versions(conn)
+        conn.commit()
+        return [(m, m.version in done) for m in load_migrations()]
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def reset(conn=None):
+    """Drop every table in the current schema and migrate from scratch."""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT tablename FROM pg_tables WHERE schemaname = current_schema()")
+            tables = [row['tablename'] for row in cur.fetchall()]
+            for table in tables:
+                cur.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE')
+                print(f"   - Dropped {table}")
+        conn.commit()
+        return migrate(conn)
+    finally:
+        if own_conn:
+            conn.close()
+
+
+def check_schema():
+    """Cheap boot-time check: one query comparing the recorded version.
+
+    Never runs DDL. Prints a warning when the database is behind the code so
+    a forgotten `python migrate.py` shows up in the worker logs.
+    """
+    conn = get_db_connection()
+    if not conn:
+        print("Skipping schema check due to failed DB connection.")
+        return False
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT MAX(version) AS version FROM schema_migrations")
+            current = cur.fetchone()['version'] or 0
+        conn.commit()
+    except psycopg2.errors.UndefinedTable:
+        conn.rollback()
+        current = 0
+    except Exception as e:
+        conn.rollback()
+        print(f"Schema check failed: {e}")
+        return False
+    finally:
+        conn.close()
+
+    expected = latest_version()
+    if current < expected:
+        print(f"WARNING: database schema is at version {current}, code expects {expected}. Run `python migrate.py`.")
+        return False
+    return True
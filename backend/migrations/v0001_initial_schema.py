@@ -0,0 +1,171 @@
+"""Baseline schema, formerly created by app.init_tables() on every import.
+
+Everything is IF NOT EXISTS so the migration is a no-op on databases that
+init_tables() already set up; it just records them as version 1.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS users (
+        id SERIAL PRIMARY KEY,
+        username VARCHAR(100) NOT NULL,
+        email VARCHAR(100) UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        bio TEXT,
+        profile_image TEXT,
+        course VARCHAR(100),
+        year_level VARCHAR(50),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS otps (
+        email VARCHAR(100) PRIMARY KEY,
+        code VARCHAR(6) NOT NULL,
+        expires_at TIMESTAMP DEFAULT (NOW() + INTERVAL '5 minutes')
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id SERIAL PRIMARY KEY,
+        seller_id INTEGER REFERENCES users(id),
+        name VARCHAR(200) NOT NULL,
+        description TEXT,
+        price DECIMAL(10, 2),
+        category VARCHAR(100),
+        condition VARCHAR(50),
+        availability TEXT,
+        image_url TEXT,
+        listing_type VARCHAR(20) DEFAULT 'sell',
+        status VARCHAR(20) DEFAULT 'available',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rentals (
+        id SERIAL PRIMARY KEY,
+        product_id INTEGER REFERENCES products(id),
+        renter_id INTEGER REFERENCES users(id),
+        owner_id INTEGER REFERENCES users(id),
+        rent_start DATE NOT NULL,
+        rent_end DATE NOT NULL,
+        status VARCHAR(20) DEFAULT 'pending',
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS swaps (
+        id SERIAL PRIMARY KEY,
+        product_id INTEGER REFERENCES products(id),
+        offered_item_id INTEGER REFERENCES products(id),
+        requester_id INTEGER REFERENCES users(id),
+        offer_description TEXT,
+        offer_image_url TEXT,
+        status VARCHAR(20) DEFAULT 'pending',
+        rejection_reason TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id) NOT NULL,
+        amount DECIMAL(10, 2),
+        payment_method VARCHAR(50),
+        payment_reference VARCHAR(100),
+        receipt_code VARCHAR(100),
+        meetup_details TEXT,
+        status VARCHAR(20) DEFAULT 'pending',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transaction_items (
+        id SERIAL PRIMARY KEY,
+        transaction_id INTEGER REFERENCES transactions(id) ON DELETE CASCADE,
+        product_id INTEGER REFERENCES products(id) ON DELETE RESTRICT,
+        seller_id INTEGER REFERENCES users(id) NOT NULL,
+        quantity INTEGER NOT NULL,
+        price_at_sale DECIMAL(10, 2) NOT NULL,
+        listing_type VARCHAR(50) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS notifications (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id),
+        sender_id INTEGER REFERENCES users(id) DEFAULT NULL,
+        message TEXT NOT NULL,
+        type VARCHAR(50),
+        deep_link TEXT,
+        is_read BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS cart (
+        id SERIAL PRIMARY KEY,
+        user_id INTEGER REFERENCES users(id),
+        product_id INTEGER REFERENCES products(id),
+        quantity INTEGER DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        id SERIAL PRIMARY KEY,
+        sender_id INTEGER REFERENCES users(id),
+        receiver_id INTEGER REFERENCES users(id),
+        product_id INTEGER REFERENCES products(id) DEFAULT NULL,
+        message TEXT,
+        image_url TEXT,
+        is_read BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_relationships (
+        follower_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        followed_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (follower_id, followed_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_ratings (
+        id SERIAL PRIMARY KEY,
+        rater_id INTEGER REFERENCES users(id) NOT NULL,
+        rated_user_id INTEGER REFERENCES users(id) NOT NULL,
+        transaction_type VARCHAR(20) NOT NULL, -- 'sell', 'rent', 'swap'
+        transaction_id INTEGER, -- Reference sa transactions/rentals/swaps table ID
+        rating INTEGER CHECK (rating >= 1 AND rating <= 5) NOT NULL,
+        review_text TEXT,
+        likes INTEGER DEFAULT 0,
+        dislikes INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(rater_id, transaction_type, transaction_id)
+    )
+    """,
+
+    # Columns added after the first deploy; only older databases need them.
+    "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS sender_id INTEGER REFERENCES users(id) DEFAULT NULL",
+    "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS deep_link TEXT",
+    "ALTER TABLE swaps ADD COLUMN IF NOT EXISTS rejection_reason TEXT",
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS amount DECIMAL(10, 2)",
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS payment_method VARCHAR(50)",
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS payment_reference VARCHAR(100)",
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS receipt_code VARCHAR(100)",
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS meetup_details TEXT",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS message TEXT",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS receiver_id INTEGER REFERENCES users(id)",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS sender_id INTEGER REFERENCES users(id)",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS product_id INTEGER REFERENCES products(id) DEFAULT NULL",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS image_url TEXT",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS is_read BOOLEAN DEFAULT FALSE",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP",
+    "ALTER TABLE rentals ADD COLUMN IF NOT EXISTS comment TEXT",
+    "ALTER TABLE user_ratings ADD COLUMN IF NOT EXISTS likes INTEGER DEFAULT 0",
+    "ALTER TABLE user_ratings ADD COLUMN IF NOT EXISTS dislikes INTEGER DEFAULT 0",
+]
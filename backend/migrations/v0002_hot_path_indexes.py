@@ -0,0 +1,66 @@
+"""Indexes for the predicates the routes in app.py filter and sort on.
+
+Built CONCURRENTLY so reads and writes keep flowing during the build.
+`python -m benchmarks.bench_indexes` shows the plans before and after.
+"""
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    # Chat thread view: (a -> b) OR (b -> a) ordered by time, and the unread
+    # UPDATE that runs before it. The thread list ORs sender and receiver.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_sender_receiver_created_idx "
+    "ON messages (sender_id, receiver_id, created_at)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_receiver_sender_created_idx "
+    "ON messages (receiver_id, sender_id, created_at)",
+
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS notifications_user_created_idx "
+    "ON notifications (user_id, created_at DESC)",
+
+    # Overlap check in create_rental / update_rental_status, and the
+    # renter side of the rental request list.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS rentals_product_status_dates_idx "
+    "ON rentals (product_id, status, rent_start, rent_end)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS rentals_renter_idx "
+    "ON rentals (renter_id)",
+
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS swaps_product_status_idx "
+    "ON swaps (product_id, status)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS swaps_requester_idx "
+    "ON swaps (requester_id)",
+
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS transactions_user_created_idx "
+    "ON transactions (user_id, created_at DESC)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS transaction_items_transaction_idx "
+    "ON transaction_items (transaction_id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS transaction_items_seller_idx "
+    "ON transaction_items (seller_id)",
+
+    # Home feed: only available listings, newest first.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_available_created_idx "
+    "ON products (created_at DESC) WHERE status = 'available'",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_seller_idx "
+    "ON products (seller_id)",
+
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_ratings_rated_user_created_idx "
+    "ON user_ratings (rated_user_id, created_at DESC)",
+
+    # The primary key only covers lookups by follower_id.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_relationships_followed_idx "
+    "ON user_relationships (followed_id)",
+
+    # DELETE FROM cart WHERE product_id = ... when a listing is removed.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS cart_product_idx "
+    "ON cart (product_id)",
+
+    "ANALYZE messages",
+    "ANALYZE notifications",
+    "ANALYZE rentals",
+    "ANALYZE swaps",
+    "ANALYZE transactions",
+    "ANALYZE transaction_items",
+    "ANALYZE products",
+    "ANALYZE user_ratings",
+    "ANALYZE user_relationships",
+    "ANALYZE cart",
+]
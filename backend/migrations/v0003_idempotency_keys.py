@@ -0,0 +1,18 @@
+"""Stored responses for POSTs retried with the same Idempotency-Key."""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS idempotency_keys (
+        key VARCHAR(255) NOT NULL,
+        endpoint VARCHAR(100) NOT NULL,
+        request_hash CHAR(64) NOT NULL,
+        status_code SMALLINT, -- NULL while the first request is still running
+        content_type VARCHAR(100),
+        response_body TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL,
+        PRIMARY KEY (key, endpoint)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idempotency_keys_expires_idx ON idempotency_keys (expires_at)",
+]
@@ -0,0 +1,17 @@
+"""Indexes matching the keyset orderings of GET /api/products.
+
+Each sort walks (key, id) so a page is an index range scan that stops
+after LIMIT rows, whatever the cursor depth. The (created_at DESC, id DESC)
+index supersedes products_available_created_idx from 0002.
+"""
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_available_created_id_idx "
+    "ON products (created_at DESC, id DESC) WHERE status = 'available'",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_available_price_id_idx "
+    "ON products ((COALESCE(price, 0)), id) WHERE status = 'available'",
+    "DROP INDEX CONCURRENTLY IF EXISTS products_available_created_idx",
+    "ANALYZE products",
+]
@@ -0,0 +1,42 @@
+"""Full-text and trigram search over products.
+
+search_vector is a stored generated column, so Postgres keeps it current on
+every INSERT/UPDATE from create_product and modify_product; no trigger or
+rebuild job. Weights: name A, category B, description C.
+
+Adding a stored column rewrites products once under an exclusive lock; the
+GIN indexes are then built CONCURRENTLY. pg_trgm (typo tolerance) is
+optional: servers without the contrib package get full-text search only.
+"""
+
+TRANSACTIONAL = False
+
+
+def _trigram_index(cur):
+    cur.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    if not cur.fetchone():
+        print("   - pg_trgm is not available on this server; skipping fuzzy name index")
+        return
+    cur.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Not seen by _drop_invalid_indexes, so clear a half-built one ourselves.
+    cur.execute("DROP INDEX CONCURRENTLY IF EXISTS products_name_trgm_idx")
+    cur.execute(
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_name_trgm_idx "
+        "ON products USING GIN (name gin_trgm_ops)"
+    )
+
+
+STATEMENTS = [
+    """
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english'::regconfig, coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(category, '')), 'B') ||
+        setweight(to_tsvector('english'::regconfig, coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_search_idx "
+    "ON products USING GIN (search_vector)",
+    _trigram_index,
+    "ANALYZE products",
+]
@@ -0,0 +1,13 @@
+"""Single-row catalog version, bumped by every write that changes what the
+catalog endpoints return. Caches key on it instead of guessing at TTLs."""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS catalog_state (
+        id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+        version BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    "INSERT INTO catalog_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING",
+]
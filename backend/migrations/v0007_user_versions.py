@@ -0,0 +1,17 @@
+"""Per-user change counters behind the profile and review ETags.
+
+profile_version covers GET /api/users/profile/<id>; ratings_version covers
+the reviews list and average rating. Both default to 0, which Postgres
+records in the catalog without rewriting users.
+"""
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS profile_version INTEGER NOT NULL DEFAULT 0",
+    "ALTER TABLE users ADD COLUMN IF NOT EXISTS ratings_version INTEGER NOT NULL DEFAULT 0",
+    # A rater's name change bumps every user they reviewed; also serves the
+    # "already rated this transaction" check in submit_rating.
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS user_ratings_rater_idx "
+    "ON user_ratings (rater_id, transaction_type, transaction_id)",
+]
@@ -0,0 +1,37 @@
+"""Structured meetup days for products.
+
+availability stays the text the clients send ("monday,wednesday"); the
+new availability_days column is generated from it as ISO weekday numbers
+(1 = Monday ... 7 = Sunday), so create_product and modify_product need no
+changes and existing rows are backfilled by the ALTER itself. The GIN
+index serves `availability_days && '{1,3}'` ("any of Mon, Wed").
+"""
+
+TRANSACTIONAL = False
+
+STATEMENTS = [
+    # Only the first three letters count, so "Tues" and "thursday " parse too.
+    """
+    CREATE OR REPLACE FUNCTION availability_days_from_text(availability TEXT)
+    RETURNS SMALLINT[]
+    LANGUAGE sql IMMUTABLE PARALLEL SAFE
+    AS $$
+        SELECT COALESCE(array_agg(DISTINCT day ORDER BY day), '{}')::SMALLINT[]
+        FROM (
+            SELECT CASE left(btrim(part), 3)
+                WHEN 'mon' THEN 1 WHEN 'tue' THEN 2 WHEN 'wed' THEN 3 WHEN 'thu' THEN 4
+                WHEN 'fri' THEN 5 WHEN 'sat' THEN 6 WHEN 'sun' THEN 7
+            END AS day
+            FROM unnest(string_to_array(lower(COALESCE(availability, '')), ',')) AS part
+        ) days
+        WHERE day IS NOT NULL
+    $$
+    """,
+    """
+    ALTER TABLE products ADD COLUMN IF NOT EXISTS availability_days SMALLINT[]
+    GENERATED ALWAYS AS (availability_days_from_text(availability)) STORED
+    """,
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS products_available_days_idx "
+    "ON products USING GIN (availability_days) WHERE status = 'available'",
+    "ANALYZE products",
+]
@@ -0,0 +1,16 @@
+"""Precomputed "similar items" per product, filled by utils.similar."""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS product_similar (
+        product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        similar_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+        score REAL NOT NULL,
+        computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (product_id, similar_id)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS product_similar_product_score_idx ON product_similar (product_id, score DESC)",
+    # Finding the lists a product appears in when it changes.
+    "CREATE INDEX IF NOT EXISTS product_similar_similar_idx ON product_similar (similar_id)",
+]
@@ -0,0 +1,21 @@
+"""Time-decayed engagement per product, behind sort=trending.
+
+score is the decayed total as of updated_at; utils.engagement folds new
+events in with one UPSERT (decay the stored score to now, add the event
+weight), so ranking never scans cart or transaction history. The raw
+counters are kept alongside for sellers and for re-weighting later.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS product_engagement (
+        product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+        score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        views BIGINT NOT NULL DEFAULT 0,
+        cart_adds BIGINT NOT NULL DEFAULT 0,
+        requests BIGINT NOT NULL DEFAULT 0,
+        checkouts BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+]
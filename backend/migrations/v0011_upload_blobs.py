@@ -0,0 +1,29 @@
+"""Content-addressed uploads (utils.uploads).
+
+upload_blobs has one row per distinct file content, stored on disk as
+static/uploads/<sha256>.<extension>. upload_refs records which product,
+swap offer, message or profile points at it, so identical photos are kept
+and cached once however many rows use them.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS upload_blobs (
+        sha256 CHAR(64) PRIMARY KEY,
+        filename VARCHAR(80) NOT NULL UNIQUE,
+        size_bytes BIGINT NOT NULL,
+        content_type VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS upload_refs (
+        sha256 CHAR(64) NOT NULL REFERENCES upload_blobs(sha256),
+        owner_type VARCHAR(20) NOT NULL CHECK (owner_type IN ('product', 'swap', 'message', 'profile')),
+        owner_id INTEGER NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (owner_type, owner_id, sha256)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS upload_refs_sha256_idx ON upload_refs (sha256)",
+]
@@ -0,0 +1,29 @@
+"""Resumable uploads (utils.upload_sessions).
+
+One row per upload session. Chunks are written into
+static/uploads/.sessions/<id>.part and `received` lists the chunk numbers
+on disk. Finalizing moves the file into the content-addressed store and
+records where it went, so a later create request can use it by id.
+"""
+
+STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS upload_sessions (
+        id CHAR(32) PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+        filename VARCHAR(255),
+        size_bytes BIGINT NOT NULL CHECK (size_bytes > 0),
+        chunk_size INTEGER NOT NULL CHECK (chunk_size > 0),
+        received INTEGER[] NOT NULL DEFAULT '{}',
+        expected_sha256 CHAR(64),
+        status VARCHAR(10) NOT NULL DEFAULT 'open' CHECK (status IN ('open', 'complete')),
+        sha256 CHAR(64),
+        stored_filename VARCHAR(80),
+        content_type VARCHAR(100),
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        expires_at TIMESTAMP NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS upload_sessions_expires_idx ON upload_sessions (expires_at)",
+]
@@ -0,0 +1,24 @@
+import sys
+import time
+
+from utils import similar
+from utils.db import get_db_connection
+
+
+def main():
+    conn = get_db_connection()
+    if not conn:
+        print("❌ Database connection failed.")
+        return 1
+    try:
+        started = time.perf_counter()
+        products, rows = similar.rebuild(conn, progress=lambda done, total: print(f"  {done}/{total} products scored"))
+        print(f"✅ Stored {rows} similar-item rows for {products} products "
+              f"in {time.perf_counter() - started:.1f}s.")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
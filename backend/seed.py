@@ -0,0 +1,166 @@
+import argparse
+
+import bcrypt
+
+from utils.db import get_db_connection
+
+DAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+CATEGORIES = ['Electronics', 'Books', 'Clothing', 'School_Supplies', 'Gadgets', 'Sports', 'Others']
+CONDITIONS = ['New', 'Like New', 'Used', 'Fair', 'Poor']
+LISTING_TYPES = ['sell', 'rent', 'swap']
+WORDS = [
+    'calculator', 'uniform', 'laptop', 'charger', 'drafting', 'table', 'book', 'physics',
+    'calculus', 'shoes', 'bag', 'headset', 'keyboard', 'mouse', 'ruler', 'lab', 'gown',
+    'jersey', 'ball', 'racket', 'notebook', 'ink', 'printer', 'tripod', 'camera', 'scientific',
+]
+
+
+def seed_database(conn, scale=1):
+    """Fill an empty schema with synthetic marketplace data.
+
+    Everything is generated server-side with generate_series, so even
+    scale=10 (about 2M rows) loads in well under a minute. Row counts per
+    unit of scale: 1,000 users, 10,000 products, 50,000 messages,
+    50,000 notifications, 5,000 rentals, 3,000 swaps, 5,000 transactions,
+    5,000 ratings.
+    """
+    users = 1000 * scale
+    products = 10000 * scale
+    password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt()).decode('utf-8')
+
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (username, email, password_hash, course, year_level, created_at)
+        SELECT 'student' || i, 'student' || i || '@tup.edu.ph', %s,
+               'BSIT', ((i %% 4) + 1)::text, NOW() - (i || ' minutes')::interval
+        FROM generate_series(1, %s) AS i
+    """, (password_hash, users))
+
+    cur.execute("""
+        INSERT INTO products (seller_id, name, description, price, category, condition,
+                              availability, image_url, listing_type, status, created_at)
+        SELECT
+            u.id,
+            initcap((%(words)s::text[])[1 + (i %% array_length(%(words)s::text[], 1))]) || ' ' ||
+                (%(words)s::text[])[1 + ((i / 7) %% array_length(%(words)s::text[], 1))] || ' #' || i,
+            'Gently used ' || (%(words)s::text[])[1 + ((i / 3) %% array_length(%(words)s::text[], 1))] ||
+                ', meetup at the TUP Manila campus. ' || repeat('Good condition. ', 1 + i %% 5),
+            round((random() * 4990 + 10)::numeric, 2),
+            (%(categories)s::text[])[1 + (i %% array_length(%(categories)s::text[], 1))],
+            (%(conditions)s::text[])[1 + (i %% array_length(%(conditions)s::text[], 1))],
+            array_to_string(ARRAY(
+                SELECT d FROM unnest(%(days)s::text[]) WITH ORDINALITY AS t(d, n)
+                WHERE (i >> (n::int - 1)) %% 2 = 1
+            ), ','),
+            '/static/uploads/product_' || u.id || '_' || i || '.jpg',
+            (%(types)s::text[])[1 + (i %% 3)],
+            CASE WHEN i %% 5 = 0 THEN 'sold' ELSE 'available' END,
+            NOW() - (i || ' minutes')::interval
+        FROM generate_series(1, %(n)s) AS i
+        JOIN users u ON u.id = (SELECT MIN(id) FROM users) + (i %% %(users)s)
+    """, {
+        'words': WORDS, 'categories': CATEGORIES, 'conditions': CONDITIONS,
+        'days': DAYS, 'types': LISTING_TYPES, 'n': products, 'users': users,
+    })
+
+    cur.execute("SELECT MIN(id) AS lo FROM users")
+    first_user = cur.fetchone()['lo']
+    cur.execute("SELECT MIN(id) AS lo FROM products")
+    first_product = cur.fetchone()['lo']
+    params = {'u0': first_user, 'users': users, 'p0': first_product, 'products': products}
+
+    cur.execute("""
+        INSERT INTO messages (sender_id, receiver_id, message, is_read, created_at)
+        SELECT %(u0)s + (i %% %(users)s),
+               %(u0)s + ((i %% %(users)s) + 1 + (i / %(users)s) %% 40) %% %(users)s,
+               'Hi, is this still available? (' || i || ')',
+               i %% 3 <> 0,
+               NOW() - (i || ' seconds')::interval
+        FROM generate_series(1, %(n)s) AS i
+    """, dict(params, n=50000 * scale))
+
+    cur.execute("""
+        INSERT INTO notifications (user_id, sender_id, message, type, is_read, created_at)
+        SELECT %(u0)s + (i %% %(users)s), %(u0)s + ((i * 7) %% %(users)s),
+               'Notification ' || i, 'new_message', i %% 4 = 0,
+               NOW() - (i || ' seconds')::interval
+        FROM generate_series(1, %(n)s) AS i
+    """, dict(params, n=50000 * scale))
+
+    cur.execute("""
+        INSERT INTO rentals (product_id, renter_id, owner_id, rent_start, rent_end, status, created_at)
+        SELECT p.id, %(u0)s + ((i * 13) %% %(users)s), p.seller_id,
+               CURRENT_DATE + (i %% 60), CURRENT_DATE + (i %% 60) + 1 + (i %% 5),
+               (ARRAY['pending', 'accepted', 'declined', 'completed'])[1 + i %% 4],
+               NOW() - (i || ' minutes')::interval
+        FROM generate_series(1, %(n)s) AS i
+        JOIN products p ON p.id = %(p0)s + ((i * 3) %% %(products)s)
+    """, dict(params, n=5000 * scale))
+
+    cur.execute("""
+        INSERT INTO swaps (product_id, offered_item_id, requester_id, offer_description, status, created_at)
+        SELECT %(p0)s + ((i * 11) %% %(products)s), NULL, %(u0)s + ((i * 17) %% %(users)s),
+               'Swap offer ' || i,
+               (ARRAY['pending', 'accepted', 'rejected', 'completed'])[1 + i %% 4],
+               NOW() - (i || ' minutes')::interval
+        FROM generate_series(1, %(n)s) AS i
+    """, dict(params, n=3000 * scale))
+
+    cur.execute("""
+        INSERT INTO transactions (user_id, amount, payment_method, meetup_details, receipt_code, status, created_at)
+        SELECT %(u0)s + ((i * 19) %% %(users)s), 0, 'Cash', '{}', 'SEED-' || i,
+               (ARRAY['pending', 'completed', 'cancelled'])[1 + i %% 3],
+               NOW() - (i || ' minutes')::interval
+        FROM generate_series(1, %(n)s) AS i
+    """, dict(params, n=5000 * scale))
+
+    cur.execute("""
+        INSERT INTO transaction_items (transaction_id, product_id, seller_id, quantity, price_at_sale, listing_type)
+        SELECT t.id, p.id, p.seller_id, 1, COALESCE(p.price, 0), p.listing_type
+        FROM transactions t
+        JOIN products p ON p.id = %(p0)s + ((t.id * 5) %% %(products)s)
+    """, params)
+
+    cur.execute("""
+        INSERT INTO user_ratings (rater_id, rated_user_id, transaction_type, transaction_id, rating, review_text, created_at)
+        SELECT %(u0)s + ((i * 23) %% %(users)s), %(u0)s + ((i * 29 + 1) %% %(users)s),
+               'sell', i, 1 + i %% 5, 'Review ' || i,
+               NOW() - (i || ' minutes')::interval
+        FROM generate_series(1, %(n)s) AS i
+    """, dict(params, n=5000 * scale))
+
+    cur.execute("""
+        INSERT INTO user_relationships (follower_id, followed_id)
+        SELECT DISTINCT %(u0)s + (i %% %(users)s), %(u0)s + ((i * 31 + 1) %% %(users)s)
+        FROM generate_series(1, %(n)s) AS i
+        WHERE (i %% %(users)s) <> ((i * 31 + 1) %% %(users)s)
+        ON CONFLICT DO NOTHING
+    """, dict(params, n=5000 * scale))
+
+    cur.execute("""
+        INSERT INTO cart (user_id, product_id, quantity)
+        SELECT %(u0)s + (i %% %(users)s), %(p0)s + ((i * 37) %% %(products)s), 1
+        FROM generate_series(1, %(n)s) AS i
+        ON CONFLICT DO NOTHING
+    """, dict(params, n=3000 * scale))
+
+    conn.commit()
+    cur.close()
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+    conn.autocommit = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load synthetic data into a local development database.")
+    parser.add_argument('--scale', type=int, default=1)
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("Database connection failed")
+    seed_database(conn, args.scale)
+    conn.close()
+    print(f"✅ Seeded database at scale {args.scale}.")
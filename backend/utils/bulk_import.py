@@ -0,0 +1,265 @@
+"""Bulk listing import: validate while streaming, COPY into staging, insert set-based.
+
+Input is CSV (header row), JSON Lines, or a JSON array of objects, with the
+same fields create_product takes:
+
+    name, category, condition      required
+    description, availability      optional text
+    price                          optional, >= 0, at most 2 decimals
+    listing_type                   sell (default) | rent | swap
+    image_url                      optional reference to an existing upload
+                                   ("/static/uploads/<file>" or "<file>")
+                                   or an http(s) URL
+
+Rows are parsed and validated one at a time while COPY reads them, so a
+large file never sits in memory as a list of records (JSON arrays are the
+exception: they are parsed whole). A bad row becomes an error entry with
+its line (CSV/JSON Lines) or index (JSON array) and the rest still import.
+Valid rows get ids from the products sequence in staging and go in with
+one INSERT ... SELECT, in the caller's transaction.
+"""
+import codecs
+import csv
+import io
+import json
+import os
+from decimal import Decimal, InvalidOperation
+
+import psycopg2
+
+from utils import catalog
+
+MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', 10000))
+MAX_REPORTED_ERRORS = 200
+
+COLUMNS = ('name', 'description', 'price', 'category', 'condition', 'availability', 'image_url', 'listing_type')
+REQUIRED = ('name', 'category', 'condition')
+MAX_LENGTHS = {'name': 200, 'category': 100, 'condition': 50, 'availability': 500, 'image_url': 500}
+MAX_PRICE = Decimal('99999999.99')
+
+
+class ImportFileError(ValueError):
+    """The file as a whole can't be read (bad format, too many rows)."""
+
+
+def _records_csv(stream):
+    # The header is checked here, before COPY starts reading.
+    reader = csv.DictReader(codecs.getreader('utf-8-sig')(stream))
+    if not reader.fieldnames:
+        raise ImportFileError("CSV file is empty")
+    missing = [name for name in REQUIRED if name not in [f.strip() for f in reader.fieldnames]]
+    if missing:
+        raise ImportFileError(f"CSV header is missing: {', '.join(missing)}")
+    # Line of the record's last physical line; header is line 1.
+    return ((reader.line_num, {(key or '').strip(): value for key, value in record.items()})
+            for record in reader)
+
+
+def _records_json(stream):
+    text = codecs.getreader('utf-8-sig')(stream)
+    first = text.read(1)
+    while first and first.isspace():
+        first = text.read(1)
+    if first == '[':
+        try:
+            records = json.loads(first + text.read())
+        except ValueError as e:
+            raise ImportFileError(f"Invalid JSON: {e}")
+        for index, record in enumerate(records):
+            yield index, record
+        return
+    # JSON Lines: one object per line, streamed.
+    for number, line in enumerate(_lines(first, text), 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError as e:
+            yield number, e
+
+
+def _lines(first, text):
+    line = first + text.readline()
+    while line:
+        yield line
+        line = text.readline()
+
+
+def records(stream, fmt):
+    """(position, record) pairs from a binary stream; fmt is 'csv' or 'json'."""
+    if fmt == 'csv':
+        return _records_csv(stream)
+    if fmt == 'json':
+        return _records_json(stream)
+    raise ImportFileError("format must be csv or json")
+
+
+def detect_format(filename=None, content_type=None):
+    filename = (filename or '').lower()
+    content_type = (content_type or '').split(';')[0].strip().lower()
+    if filename.endswith('.csv') or content_type in ('text/csv', 'application/csv'):
+        return 'csv'
+    if filename.endswith(('.json', '.jsonl', '.ndjson')) or content_type in (
+            'application/json', 'application/x-ndjson', 'application/jsonl'):
+        return 'json'
+    return None
+
+
+def validate(record, upload_folder):
+    """Cleaned column values for one record; raises ValueError with the reason."""
+    if isinstance(record, Exception):
+        raise ValueError(f"Invalid JSON: {record}")
+    if not isinstance(record, dict):
+        raise ValueError("Row must be an object")
+
+    row = {}
+    for name in COLUMNS:
+        value = record.get(name)
+        if value is not None and not isinstance(value, (str, int, float)):
+            raise ValueError(f"{name} must be a string")
+        value = '' if value is None else str(value).strip()
+        # COPY rejects NUL in a text value, which would abort the whole batch.
+        if '\x00' in value:
+            raise ValueError(f"{name} contains a NUL character")
+        if name in MAX_LENGTHS and len(value) > MAX_LENGTHS[name]:
+            raise ValueError(f"{name} is longer than {MAX_LENGTHS[name]} characters")
+        row[name] = value
+
+    for name in REQUIRED:
+        if not row[name]:
+            raise ValueError(f"{name} is required")
+
+    listing_type = (row['listing_type'] or 'sell').lower()
+    if listing_type == 'buy/sell':
+        listing_type = 'sell'
+    if listing_type not in catalog.LISTING_TYPES:
+        raise ValueError(f"listing_type must be one of {', '.join(catalog.LISTING_TYPES)}")
+    row['listing_type'] = listing_type
+
+    if row['price']:
+        try:
+            price = Decimal(row['price'].replace(',', ''))
+        except InvalidOperation:
+            raise ValueError(f"price is not a number: {row['price']}")
+        if not price.is_finite() or price < 0 or price > MAX_PRICE or price != price.quantize(Decimal('0.01')):
+            raise ValueError(f"price must be between 0 and {MAX_PRICE} with at most 2 decimals")
+        row['price'] = str(price)
+
+    image = row['image_url']
+    if image and not image.startswith(('http://', 'https://')):
+        filename = image[len('/static/uploads/'):] if image.startswith('/static/uploads/') else image
+        if not filename or '/' in filename or '\\' in filename or filename.startswith('.'):
+            raise ValueError(f"image_url must be an uploaded file name or an http(s) URL: {image}")
+        if not os.path.isfile(os.path.join(upload_folder, filename)):
+            raise ValueError(f"image_url refers to a missing upload: {filename}")
+        row['image_url'] = f"/static/uploads/{filename}"
+    return row
+
+
+class _CopySource:
+    """File-like object for copy_expert(): validated rows as CSV, produced on read()."""
+
+    def __init__(self, rows, upload_folder, errors):
+        self._rows = rows
+        self._upload_folder = upload_folder
+        self._errors = errors
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = ''
+        self.valid = 0
+        self.total = 0
+        self.error = None
+
+    def _fill(self, size):
+        for position, record in self._rows:
+            self.total += 1
+            if self.total > MAX_ROWS:
+                raise ImportFileError(f"Import is limited to {MAX_ROWS} rows")
+            try:
+                row = validate(record, self._upload_folder)
+            except ValueError as e:
+                self._errors.append({'row': position, 'error': str(e)})
+                continue
+            self.valid += 1
+            # Unquoted empty fields load as NULL, like a field create_product didn't get.
+            self._writer.writerow([position] + [row[name] or None for name in COLUMNS])
+            if self._buffer.tell() >= size:
+                break
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def read(self, size=8192):
+        if len(self._pending) < size:
+            try:
+                self._pending += self._fill(size)
+            except (ImportFileError, UnicodeDecodeError, csv.Error) as e:
+                # psycopg2 turns this into a generic COPY error; keep ours to re-raise.
+                self.error = e
+                raise
+        data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+def import_products(conn, seller_id, rows, upload_folder):
+    """Insert every valid row for seller_id in conn's transaction (not committed).
+
+    Returns {'total', 'imported', 'failed', 'product_ids', 'errors'}; ids
+    follow file order. Raises ImportFileError when the file itself is unusable.
+    """
+    errors = []
+    source = _CopySource(rows, upload_folder, errors)
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE product_import (
+            source_row INTEGER NOT NULL,
+            name TEXT, description TEXT, price NUMERIC(10, 2), category TEXT, condition TEXT,
+            availability TEXT, image_url TEXT, listing_type TEXT,
+            product_id INTEGER
+        ) ON COMMIT DROP
+    """)
+    try:
+        cur.copy_expert(
+            f"COPY product_import (source_row, {', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)",
+            source,
+        )
+    except psycopg2.Error:
+        if isinstance(source.error, ImportFileError):
+            raise source.error
+        if source.error is not None:
+            raise ImportFileError(f"Unreadable file: {source.error}")
+        raise
+
+    # Ids up front so the response can map rows to products.
+    cur.execute("""
+        UPDATE product_import
+        SET product_id = nextval(pg_get_serial_sequence('products', 'id'))
+    """)
+    cur.execute(f"""
+        INSERT INTO products (id, seller_id, {', '.join(COLUMNS)})
+        SELECT product_id, %s, {', '.join(COLUMNS)}
+        FROM product_import
+        ORDER BY source_row
+    """, (seller_id,))
+    # Images that are content-addressed uploads get their references too.
+    cur.execute("""
+        INSERT INTO upload_refs (sha256, owner_type, owner_id)
+        SELECT b.sha256, 'product', i.product_id
+        FROM product_import i
+        JOIN upload_blobs b ON i.image_url = '/static/uploads/' || b.filename
+        ON CONFLICT DO NOTHING
+    """)
+    # One array instead of a dict row per product.
+    cur.execute("SELECT array_agg(product_id ORDER BY source_row) AS ids FROM product_import")
+    product_ids = cur.fetchone()['ids'] or []
+    cur.execute("DROP TABLE product_import")
+
+    errors.sort(key=lambda error: error['row'])
+    return {
+        'total': source.total,
+        'imported': len(product_ids),
+        'failed': len(errors),
+        'product_ids': product_ids,
+        'errors': errors[:MAX_REPORTED_ERRORS],
+    }
@@ -0,0 +1,514 @@
+"""Filter, sort and keyset-cursor handling for the product catalog.
+
+GET /api/products takes these query parameters:
+
+    listing_type   sell | rent | swap  ("buy/sell" is accepted for sell)
+    category       exact category name
+    condition      exact condition ("Like New", ...)
+    availability   meetup days ("monday" or "mon"), repeated or comma separated (any match)
+    price          price bands from PRICE_BANDS, repeated or comma separated (any match)
+    q              case-insensitive substring of the product name
+    sort           newest (default) | price_asc | price_desc | trending
+                   (decayed engagement, see utils.engagement)
+    limit          page size, capped at MAX_PAGE_SIZE
+    cursor         opaque next_cursor from the previous page
+    fields         columns per item from FIELDS, comma separated, or "all"
+                   (default: CARD_FIELDS, what a listing card shows);
+                   image_url also adds card_image_url, or the whole
+                   image_variants set with fields=all (utils.images)
+
+Cursors are keyset positions, not offsets, so deep pages cost the same as
+the first one and rows inserted meanwhile don't shift the window.
+
+GET /api/products/search takes the same filters plus q (required), ranks
+matches on the weighted search_vector (and name trigram similarity when
+pg_trgm is installed) and pages by (score, id).
+
+GET /api/products/facets counts every facet value under the same filters.
+Results are cached per normalized filter set and catalog version; product
+writes call bump_version() in their transaction to invalidate them.
+"""
+import base64
+import json
+import threading
+from collections import OrderedDict
+
+from utils import images
+
+LISTING_TYPES = ('sell', 'rent', 'swap')
+DAYS = ('monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday')
+# (key, lower bound inclusive, upper bound exclusive or None)
+PRICE_BANDS = (
+    ('0-99', 0, 100),
+    ('100-499', 100, 500),
+    ('500-999', 500, 1000),
+    ('1000+', 1000, None),
+)
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+# Spelled out instead of p.* so internal columns (search_vector) stay out of responses.
+PRODUCT_COLUMNS = (
+    "p.id, p.seller_id, p.name, p.description, p.price, p.category, p.condition, "
+    "p.availability, p.image_url, p.listing_type, p.status, p.created_at"
+)
+
+# Public field name -> SQL expression, for fields= and the lean list query.
+FIELDS = OrderedDict(
+    [(column.strip()[2:], column.strip()) for column in PRODUCT_COLUMNS.split(',')]
+    + [('seller_name', 'u.username'), ('seller_image', 'u.profile_image')]
+)
+CARD_FIELDS = ('id', 'name', 'price', 'image_url', 'listing_type', 'category', 'seller_name')
+
+
+
+def day_numbers(text):
+    """ISO weekday numbers in an availability string; mirrors availability_days_from_text()."""
+    prefixes = [day[:3] for day in DAYS]
+    numbers = set()
+    for part in (text or '').lower().split(','):
+        prefix = part.strip()[:3]
+        if prefix in prefixes:
+            numbers.add(prefixes.index(prefix) + 1)
+    return numbers
+
+
+FILTER_PARAMS = ('listing_type', 'category', 'condition', 'availability', 'price', 'q')
+QUERY_PARAMS = FILTER_PARAMS + ('sort', 'limit', 'cursor', 'fields')
+
+# sort name -> (key expression, direction). The id tiebreaker always runs
+# in the same direction so (key, id) is a strict total order.
+SORTS = {
+    'newest': ('p.created_at', 'DESC'),
+    'price_asc': ('COALESCE(p.price, 0)', 'ASC'),
+    'price_desc': ('COALESCE(p.price, 0)', 'DESC'),
+    # t is engagement.join_clause(): the cached ranking's weights.
+    'trending': ('COALESCE(t.weight, 0)', 'DESC'),
+}
+_KEY_CASTS = {'newest': 'timestamp', 'price_asc': 'numeric', 'price_desc': 'numeric', 'trending': 'integer'}
+
+
+def is_parameterized(args):
+    """Old clients call /api/products bare and expect the full array."""
+    return any(name in args for name in QUERY_PARAMS)
+
+
+def _split(values):
+    return [v.strip().lower() for value in values for v in value.split(',') if v.strip()]
+
+
+def parse_filters(args):
+    """Validate the filter parameters; raises ValueError with a client-facing message."""
+    filters = {}
+
+    listing_type = (args.get('listing_type') or '').strip().lower()
+    if listing_type == 'buy/sell':
+        listing_type = 'sell'
+    if listing_type and listing_type != 'all':
+        if listing_type not in LISTING_TYPES:
+            raise ValueError(f"listing_type must be one of {', '.join(LISTING_TYPES)}")
+        filters['listing_type'] = listing_type
+
+    for name in ('category', 'condition'):
+        value = (args.get(name) or '').strip()
+        if value:
+            filters[name] = value
+
+    days = []
+    for value in _split(args.getlist('availability')):
+        numbers = day_numbers(value)
+        if not numbers:
+            raise ValueError(f"Unknown availability day: {value}")
+        days.append(DAYS[numbers.pop() - 1])
+    if days:
+        filters['availability'] = sorted(set(days), key=DAYS.index)
+
+    bands = [band.strip() for value in args.getlist('price') for band in value.split(',') if band.strip()]
+    known = [band[0] for band in PRICE_BANDS]
+    unknown = [band for band in bands if band not in known]
+    if unknown:
+        raise ValueError(f"Unknown price band: {unknown[0]}")
+    if bands:
+        filters['price'] = sorted(set(bands), key=known.index)
+
+    q = ' '.join((args.get('q') or '').split())
+    if q:
+        filters['q'] = q[:200]
+
+    return filters
+
+
+def parse_limit(args):
+    try:
+        limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def parse_page(args):
+    """Return (sort, limit, cursor position or None)."""
+    sort = args.get('sort') or 'newest'
+    if sort not in SORTS:
+        raise ValueError(f"sort must be one of {', '.join(SORTS)}")
+
+    limit = parse_limit(args)
+    position = None
+    if args.get('cursor'):
+        position = decode_cursor(args['cursor'], sort)
+    return sort, limit, position
+
+
+def _price_band_condition(bands):
+    ranges = []
+    params = []
+    for key, low, high in PRICE_BANDS:
+        if key not in bands:
+            continue
+        if high is None:
+            ranges.append("COALESCE(p.price, 0) >= %s")
+            params.append(low)
+        else:
+            ranges.append("(COALESCE(p.price, 0) >= %s AND COALESCE(p.price, 0) < %s)")
+            params.extend([low, high])
+    return f"({' OR '.join(ranges)})", params
+
+
+def filter_conditions(filters):
+    """{filter name: (SQL condition, params)} for each active filter."""
+    conditions = OrderedDict()
+    for name in ('listing_type', 'category', 'condition'):
+        if name in filters:
+            conditions[name] = (f"p.{name} = %s", [filters[name]])
+    if 'availability' in filters:
+        numbers = [DAYS.index(day) + 1 for day in filters['availability']]
+        conditions['availability'] = ("p.availability_days && %s::smallint[]", [numbers])
+    if 'price' in filters:
+        conditions['price'] = _price_band_condition(filters['price'])
+    if 'q' in filters:
+        escaped = filters['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        conditions['q'] = ("p.name ILIKE %s", [f"%{escaped}%"])
+    return conditions
+
+
+def parse_fields(args):
+    """Fields to return per item; id is always included."""
+    value = (args.get('fields') or '').strip()
+    if not value:
+        return CARD_FIELDS
+    if value == 'all':
+        return tuple(FIELDS)
+    fields = ['id']
+    for name in value.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        if name not in FIELDS:
+            raise ValueError(f"Unknown field: {name}")
+        if name not in fields:
+            fields.append(name)
+    return tuple(fields)
+
+
+def select_list(fields, sort=None):
+    """SELECT list for `fields` plus whatever the sort's cursor needs."""
+    needed = list(fields)
+    for name in {'newest': ('created_at',), 'price_asc': ('price',), 'price_desc': ('price',)}.get(sort, ()):
+        if name not in needed:
+            needed.append(name)
+    columns = [f"{FIELDS[name]} AS {name}" for name in needed]
+    if sort == 'trending':
+        columns.append(f"{SORTS['trending'][0]} AS trending_weight")
+    return ', '.join(columns)
+
+
+def project(rows, fields):
+    """Items with just `fields`.
+
+    With image_url a lean item gets only card_image_url, one URL, so cards
+    stay small; every variant (image_variants) needs all of FIELDS.
+    """
+    items = [{name: row[name] for name in fields} for row in rows]
+    if 'image_url' not in fields:
+        return items
+    if set(FIELDS) <= set(fields):
+        for item in items:
+            images.add_variant_urls(item)
+    else:
+        for item in items:
+            item['card_image_url'] = images.variant_url(item['image_url'], 'card')
+    return items
+
+
+def where_clause(filters):
+    """SQL conditions and params for the available products matching filters."""
+    conditions = ["p.status = 'available'"]
+    params = []
+    for condition, condition_params in filter_conditions(filters).values():
+        conditions.append(condition)
+        params.extend(condition_params)
+    return conditions, params
+
+
+def page_clause(sort, position):
+    """Keyset condition (or None), ORDER BY, and params for one page."""
+    key, direction = SORTS[sort]
+    order_by = f"{key} {direction}, p.id {direction}"
+    if position is None:
+        return None, order_by, []
+    op = '<' if direction == 'DESC' else '>'
+    condition = f"({key}, p.id) {op} (%s::{_KEY_CASTS[sort]}, %s)"
+    return condition, order_by, [position[0], position[1]]
+
+
+def sort_value(row, sort):
+    if sort == 'relevance':
+        return repr(row['score'])
+    if sort == 'trending':
+        return str(row['trending_weight'])
+    if sort == 'newest':
+        return row['created_at'].isoformat()
+    return str(row['price'] if row['price'] is not None else 0)
+
+
+def encode_cursor(row, sort):
+    raw = json.dumps([sort, sort_value(row, sort), row['id']], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        last_id = int(last_id)
+        value = str(value)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort:
+        raise ValueError("Cursor was issued for a different sort order")
+    return value, last_id
+
+
+SEARCH_CONFIG = 'english'
+_HEADLINE_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=8'
+
+_has_trigram = None
+
+
+def has_trigram(cur):
+    """Whether pg_trgm is installed; checked once per process."""
+    global _has_trigram
+    if _has_trigram is None:
+        cur.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        _has_trigram = cur.fetchone() is not None
+    return _has_trigram
+
+
+def _escaped(column):
+    # ts_headline does not escape markup, so escape first and let <mark> through.
+    return f"replace(replace(replace(coalesce({column}, ''), '&', '&amp;'), '<', '&lt;'), '>', '&gt;')"
+
+
+def search_query(filters, term, limit, position, trigram):
+    """SQL and params for one ranked page of search results.
+
+    Matches are ranked in a CTE over the GIN index; headlines (the costly
+    part) are only built for the rows on the page.
+    """
+    conditions, params = where_clause(filters)
+    match = "p.search_vector @@ query.tsq"
+    score = "ts_rank_cd(p.search_vector, query.tsq, 32)"
+    if trigram:
+        # name % term uses products_name_trgm_idx (pg_trgm.similarity_threshold, default 0.3).
+        match = f"({match} OR p.name %% query.term)"
+        score = f"{score} + similarity(p.name, query.term) / 2"
+    conditions.append(match)
+
+    keyset = ""
+    page_params = []
+    if position is not None:
+        keyset = "WHERE (m.score, m.id) < (%s::real, %s)"
+        page_params = [position[0], position[1]]
+
+    query = f"""
+        WITH query AS (
+            SELECT websearch_to_tsquery('{SEARCH_CONFIG}', %s) AS tsq,
+                   %s::text AS term
+        ),
+        matches AS (
+            SELECT p.id, ({score})::real AS score
+            FROM products p, query
+            WHERE {' AND '.join(conditions)}
+        )
+        SELECT {select_list(FIELDS)}, m.score,
+               ts_headline('{SEARCH_CONFIG}', {_escaped('p.name')}, query.tsq,
+                           'HighlightAll=true, {_HEADLINE_OPTIONS}') AS name_highlight,
+               ts_headline('{SEARCH_CONFIG}', {_escaped('p.description')}, query.tsq,
+                           '{_HEADLINE_OPTIONS}') AS snippet
+        FROM (
+            SELECT m.id, m.score FROM matches m
+            {keyset}
+            ORDER BY m.score DESC, m.id DESC
+            LIMIT %s
+        ) m
+        JOIN products p ON p.id = m.id
+        JOIN users u ON p.seller_id = u.id
+        CROSS JOIN query
+        ORDER BY m.score DESC, m.id DESC
+    """
+    return query, [term, term] + params + page_params + [limit]
+
+
+_written_version = 0
+
+
+def bump_version(conn):
+    """Advance the catalog version inside the caller's transaction.
+
+    The new version becomes visible with the commit, so nothing can cache
+    pre-write results under it. The number is also remembered locally so
+    this worker's snapshot picks up its own writes without waiting for the
+    next periodic version check.
+    """
+    global _written_version
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE catalog_state SET version = version + 1, updated_at = NOW()
+            WHERE id = 1
+            RETURNING version
+        """)
+        row = cur.fetchone()
+    if row:
+        _written_version = max(_written_version, row['version'])
+        return row['version']
+    return None
+
+
+def written_version():
+    """Highest version this process has written (possibly not committed yet)."""
+    return _written_version
+
+
+def current_version(cur):
+    cur.execute("SELECT version FROM catalog_state WHERE id = 1")
+    row = cur.fetchone()
+    return row['version'] if row else 0
+
+
+class VersionedCache:
+    """Small thread-safe LRU whose entries only live for one catalog version."""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, version, key):
+        with self._lock:
+            if version != self._version:
+                return None
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, version, key, value):
+        with self._lock:
+            if self._version is not None and version < self._version:
+                return
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+facet_cache = VersionedCache()
+
+FACETS = ('listing_type', 'category', 'condition', 'price')
+_PRICE_BAND_SQL = "CASE " + " ".join(
+    f"WHEN COALESCE(p.price, 0) < {high} THEN '{key}'" for key, _, high in PRICE_BANDS if high is not None
+) + f" ELSE '{PRICE_BANDS[-1][0]}' END"
+
+
+def filter_key(filters):
+    """Normalized cache key: equivalent query strings map to the same key."""
+    normalized = dict(filters)
+    if 'q' in normalized:
+        normalized['q'] = normalized['q'].lower()
+    return json.dumps(normalized, sort_keys=True)
+
+
+def facet_query(filters):
+    """One grouped pass over the matching products that counts every facet.
+
+    Counts are disjunctive: each facet is counted with every filter applied
+    except its own, so picking one category still shows how many products
+    the other categories would give. Availability counts come from the
+    grand-total row since a product can match several days.
+    """
+    conditions = filter_conditions(filters)
+    # q narrows everything and is not a facet, so it goes in WHERE.
+    where = ["p.status = 'available'"]
+    where_params = []
+    if 'q' in conditions:
+        where.append(conditions['q'][0])
+        where_params.extend(conditions['q'][1])
+
+    def others(excluded):
+        sql = [c for name, (c, _) in conditions.items() if name not in (excluded, 'q')]
+        params = [v for name, (_, ps) in conditions.items() if name not in (excluded, 'q') for v in ps]
+        return (' AND '.join(sql) or 'TRUE'), params
+
+    columns = []
+    params = []
+    for facet in FACETS + ('availability',):
+        sql, facet_params = others(facet)
+        if facet == 'availability':
+            for day in DAYS:
+                number = DAYS.index(day) + 1
+                columns.append(f"COUNT(*) FILTER (WHERE {sql} AND {number} = ANY(p.availability_days)) AS day_{day}")
+                params.extend(facet_params)
+        else:
+            columns.append(f"COUNT(*) FILTER (WHERE {sql}) AS count_{facet}")
+            params.extend(facet_params)
+    total_sql, total_params = others(None)
+    columns.append(f"COUNT(*) FILTER (WHERE {total_sql}) AS total")
+    params.extend(total_params)
+
+    query = f"""
+        SELECT GROUPING(p.listing_type, p.category, p.condition, price_band) AS grouping_id,
+               p.listing_type, p.category, p.condition, price_band AS price,
+               {', '.join(columns)}
+        FROM products p
+        CROSS JOIN LATERAL (SELECT {_PRICE_BAND_SQL} AS price_band) band
+        WHERE {' AND '.join(where)}
+        GROUP BY GROUPING SETS ((p.listing_type), (p.category), (p.condition), (price_band), ())
+    """
+    return query, params + where_params
+
+
+def facet_counts(rows):
+    """Shape facet_query rows into {total, facets: {name: {value: count}}}."""
+    # GROUPING() sets a bit per column left out of the row's grouping set,
+    # first argument highest: (listing_type) alone is 0b0111, and so on.
+    by_grouping = {0b0111: 'listing_type', 0b1011: 'category', 0b1101: 'condition', 0b1110: 'price'}
+    facets = {name: {} for name in FACETS}
+    facets['price'] = {key: 0 for key, _, _ in PRICE_BANDS}
+    facets['availability'] = {day: 0 for day in DAYS}
+    total = 0
+    for row in rows:
+        facet = by_grouping.get(row['grouping_id'])
+        if facet:
+            count = row[f'count_{facet}']
+            if count and row[facet] is not None:
+                facets[facet][row[facet]] = count
+        elif row['grouping_id'] == 0b1111:
+            total = row['total']
+            facets['availability'] = {day: row[f'day_{day}'] for day in DAYS}
+    for name in ('listing_type', 'category', 'condition'):
+        facets[name] = dict(sorted(facets[name].items(), key=lambda item: (-item[1], item[0])))
+    return {'total': total, 'facets': facets}
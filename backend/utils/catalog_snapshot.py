@@ -0,0 +1,309 @@
+"""In-memory snapshot of the available catalog, keyed by catalog version.
+
+Every worker process keeps its own copy of the available products (with
+seller name and image) plus the legacy /api/products array pre-serialized.
+Workers stay consistent through catalog_state.version: the version is
+checked at most every CHECK_INTERVAL seconds, a plain SELECT that works
+through pgbouncer in transaction mode. When it has moved, the snapshot is
+rebuilt in one REPEATABLE READ transaction so the rows match the version.
+After this process writes (catalog.bump_version), the next read checks
+straight away, so a user sees their own listing without waiting.
+
+Config (environment):
+    CATALOG_SNAPSHOT         0 serves the catalog straight from SQL (default 1)
+    CATALOG_CHECK_INTERVAL   seconds between version checks (default 2)
+"""
+import bisect
+import datetime
+import heapq
+import os
+import threading
+import time
+from decimal import Decimal
+
+from flask import current_app
+
+from utils import catalog, images
+from utils.db import get_db_connection
+
+ENABLED = os.getenv('CATALOG_SNAPSHOT', '1').lower() not in ('0', 'false', 'no', 'off')
+CHECK_INTERVAL = float(os.getenv('CATALOG_CHECK_INTERVAL', 2))
+
+_ORDER_KEYS = {
+    'newest': lambda row: (row['created_at'], row['id']),
+    'price_asc': lambda row: (row['price'] or Decimal(0), row['id']),
+    'price_desc': lambda row: (row['price'] or Decimal(0), row['id']),
+}
+
+
+def _band(price):
+    price = price or 0
+    for key, low, high in catalog.PRICE_BANDS:
+        if high is None or price < high:
+            return key
+    return catalog.PRICE_BANDS[-1][0]
+
+
+class Snapshot:
+    """Immutable view of one catalog version; replaced wholesale on rebuild."""
+
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = rows  # newest first, as the legacy endpoint returns them
+        self.by_id = {row['id']: row for row in rows}
+        self.legacy_json = current_app.json.dumps(rows)
+        # Per-row values the filters need, computed once instead of per request.
+        self._days = {
+            row['id']: frozenset(catalog.DAYS[n - 1] for n in catalog.day_numbers(row['availability']))
+            for row in rows
+        }
+        self._bands = {row['id']: _band(row['price']) for row in rows}
+        self._names = {row['id']: (row['name'] or '').lower() for row in rows}
+        # Ascending (key, id) orders for keyset paging; DESC sorts walk them
+        # backwards. Each comes with its postings (see _postings).
+        self._orders = {}
+        for sort in ('newest', 'price_asc'):
+            ordered = sorted(rows, key=_ORDER_KEYS[sort])
+            self._orders[sort] = (ordered, [_ORDER_KEYS[sort](row) for row in ordered], self._postings(ordered))
+        self._orders['price_desc'] = self._orders['price_asc']
+        self._trending = None  # (ranking digest, ordered, keys, postings), built on first use
+
+    def _postings(self, ordered):
+        """{(filter, value): ascending positions in `ordered` of the rows with that value}.
+
+        The in-memory counterpart of the filter indexes: a filtered page
+        walks only the rows of its most selective filter.
+        """
+        postings = {}
+        for position, row in enumerate(ordered):
+            keys = [(name, row[name]) for name in ('listing_type', 'category', 'condition')]
+            keys += [('availability', day) for day in self._days[row['id']]]
+            keys.append(('price', self._bands[row['id']]))
+            for key in keys:
+                postings.setdefault(key, []).append(position)
+        return postings
+
+    @staticmethod
+    def _candidates(postings, filters):
+        """Position lists whose union holds every match: those of the most
+        selective indexed filter. None when no indexed filter is set."""
+        best = None
+        for name in ('listing_type', 'category', 'condition', 'availability', 'price'):
+            if name not in filters:
+                continue
+            values = filters[name] if name in ('availability', 'price') else [filters[name]]
+            lists = [postings.get((name, value), []) for value in values]
+            if best is None or sum(map(len, lists)) < sum(map(len, best)):
+                best = lists
+        return best
+
+    @staticmethod
+    def _walk(lists, start, descending):
+        """Positions from `lists` on from start (inclusive), in walking order, each once."""
+        def run(positions):
+            if descending:
+                return map(positions.__getitem__, range(bisect.bisect_right(positions, start) - 1, -1, -1))
+            return map(positions.__getitem__, range(bisect.bisect_left(positions, start), len(positions)))
+
+        previous = None
+        for position in heapq.merge(*map(run, lists), reverse=descending):
+            if position != previous:
+                yield position
+                previous = position
+
+    def _matches(self, row, filters):
+        for name in ('listing_type', 'category', 'condition'):
+            if name in filters and row[name] != filters[name]:
+                return False
+        if 'availability' in filters and not self._days[row['id']].intersection(filters['availability']):
+            return False
+        if 'price' in filters and self._bands[row['id']] not in filters['price']:
+            return False
+        if 'q' in filters and filters['q'].lower() not in self._names[row['id']]:
+            return False
+        return True
+
+    def _trending_order(self, ranking):
+        cached = self._trending
+        if cached is None or cached[0] != ranking.digest:
+            key = lambda row: (ranking.by_id.get(row['id'], 0), row['id'])
+            ordered = sorted(self.rows, key=key)
+            cached = self._trending = (ranking.digest, ordered, [key(row) for row in ordered],
+                                       self._postings(ordered))
+        return cached[1:]
+
+    def page(self, filters, sort, limit, position, ranking=None):
+        """Same rows, order and keyset semantics as the SQL page in get_products."""
+        if sort == 'trending':
+            ordered, keys, postings = self._trending_order(ranking)
+        else:
+            ordered, keys, postings = self._orders[sort]
+        descending = catalog.SORTS[sort][1] == 'DESC'
+        if position is None:
+            start = len(ordered) - 1 if descending else 0
+        else:
+            value, last_id = position
+            if sort == 'newest':
+                value = datetime.datetime.fromisoformat(value)
+            elif sort == 'trending':
+                value = int(value)
+            else:
+                value = Decimal(value)
+            if descending:
+                start = bisect.bisect_left(keys, (value, last_id)) - 1
+            else:
+                start = bisect.bisect_right(keys, (value, last_id))
+
+        candidates = self._candidates(postings, filters)
+        if candidates is None:
+            positions = range(start, -1, -1) if descending else range(start, len(ordered))
+        else:
+            positions = self._walk(candidates, start, descending)
+        items = []
+        for position in positions:
+            row = ordered[position]
+            if self._matches(row, filters):
+                items.append(row)
+                if len(items) > limit:
+                    break
+        if sort == 'trending':
+            items = [dict(row, trending_weight=ranking.by_id.get(row['id'], 0)) for row in items]
+        return items
+
+
+class CatalogSnapshot:
+    def __init__(self, check_interval=CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        # Counters only. Not self._lock, which a rebuild holds for its whole
+        # query; a fresh read must never wait on that just to count itself.
+        self._stats_lock = threading.Lock()
+        self._pid = os.getpid()
+        self._unseen_write = (0, 0.0)
+        self._ignored_write = 0
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+        self.version_checks = 0
+        self.last_rebuild_seconds = 0.0
+        self.total_rebuild_seconds = 0.0
+
+    def _load(self):
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        try:
+            cur = conn.cursor()
+            cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+            version = catalog.current_version(cur)
+            cur.execute(f"""
+                SELECT {catalog.PRODUCT_COLUMNS}, u.username as seller_name, u.profile_image as seller_image
+                FROM products p
+                JOIN users u ON p.seller_id = u.id
+                WHERE p.status = 'available'
+                ORDER BY p.created_at DESC, p.id DESC
+            """)
+            rows = [images.add_variant_urls(row) for row in cur.fetchall()]
+            conn.commit()
+            cur.close()
+            return version, rows
+        finally:
+            conn.close()
+
+    def _check_version(self):
+        conn = get_db_connection()
+        if not conn:
+            raise RuntimeError("Database connection failed")
+        try:
+            cur = conn.cursor()
+            version = catalog.current_version(cur)
+            conn.commit()
+            cur.close()
+            return version
+        finally:
+            conn.close()
+
+    def _fresh(self, snapshot, now):
+        if now - self._checked_at >= self.check_interval:
+            return False
+        written = catalog.written_version()
+        return written <= snapshot.version or written <= self._ignored_write
+
+    def get(self):
+        """The current snapshot, rebuilding it first if the catalog moved."""
+        if self._pid != os.getpid():
+            # Forked after the parent built one; start clean in this worker.
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._snapshot, self._checked_at, self._pid = None, 0.0, os.getpid()
+
+        snapshot = self._snapshot
+        if snapshot is not None and self._fresh(snapshot, time.monotonic()):
+            self._count('hits')
+            return snapshot
+
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None:
+                if self._fresh(snapshot, time.monotonic()):
+                    self._count('hits')
+                    return snapshot
+                self._count('version_checks')
+                version = self._check_version()
+                self._checked_at = time.monotonic()
+                if version == snapshot.version:
+                    self._note_unseen_write()
+                    self._count('hits')
+                    return snapshot
+
+            self._count('misses')
+            started = time.perf_counter()
+            version, rows = self._load()
+            self._snapshot = Snapshot(version, rows)
+            self._checked_at = time.monotonic()
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self.last_rebuild_seconds = elapsed
+                self.total_rebuild_seconds += elapsed
+                self.rebuilds += 1
+            return self._snapshot
+
+    def _count(self, name):
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _note_unseen_write(self):
+        """Our own bump isn't visible yet: its transaction is still open or rolled back.
+
+        Keep checking on every read for one interval, then leave it to the
+        periodic check so a rolled-back write doesn't cost a query per read.
+        """
+        written = catalog.written_version()
+        if written <= self._ignored_write:
+            return
+        if self._unseen_write[0] != written:
+            self._unseen_write = (written, time.monotonic())
+        elif time.monotonic() - self._unseen_write[1] >= self.check_interval:
+            self._ignored_write = written
+
+    def version(self):
+        return self.get().version
+
+    def stats(self):
+        snapshot = self._snapshot
+        with self._stats_lock:
+            return {
+                'version': snapshot.version if snapshot else None,
+                'products': len(snapshot.rows) if snapshot else 0,
+                'hits': self.hits,
+                'misses': self.misses,
+                'rebuilds': self.rebuilds,
+                'version_checks': self.version_checks,
+                'last_rebuild_ms': round(self.last_rebuild_seconds * 1000, 1),
+                'total_rebuild_ms': round(self.total_rebuild_seconds * 1000, 1),
+            }
+
+
+snapshot = CatalogSnapshot()
@@ -0,0 +1,313 @@
+import os
+import threading
+import time
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import RealDictCursor
+from dotenv import load_dotenv
+from flask import g, has_app_context
+
+load_dotenv()
+
+SESSION_TIME_ZONE = 'Asia/Manila'
+
+
+def _pool_max_size():
+    """Per-worker pool size.
+
+    DB_POOL_MAX wins when set. Otherwise the connection budget in
+    DB_MAX_CONNECTIONS is split evenly across WEB_CONCURRENCY workers so
+    every worker together never exceeds what the database allows.
+    """
+    if os.getenv('DB_POOL_MAX'):
+        return max(1, int(os.getenv('DB_POOL_MAX')))
+    budget = int(os.getenv('DB_MAX_CONNECTIONS', 20))
+    workers = int(os.getenv('WEB_CONCURRENCY', 1))
+    return max(1, budget // max(1, workers))
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+_query_listeners = []
+
+
+def add_query_listener(listener):
+    """Call listener(cursor, query, vars, seconds) after every statement.
+
+    Used by the query-plan audit and the per-request query counter. With no
+    listeners registered, cursors skip the timing entirely.
+    """
+    _query_listeners.append(listener)
+
+
+def remove_query_listener(listener):
+    if listener in _query_listeners:
+        _query_listeners.remove(listener)
+
+
+class InstrumentedCursor(RealDictCursor):
+    def execute(self, query, vars=None):
+        if not _query_listeners:
+            return super().execute(query, vars)
+        started = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            elapsed = time.perf_counter() - started
+            for listener in list(_query_listeners):
+                listener(self, query, vars, elapsed)
+
+    def executemany(self, query, vars_list):
+        if not _query_listeners:
+            return super().executemany(query, vars_list)
+        started = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            elapsed = time.perf_counter() - started
+            for listener in list(_query_listeners):
+                listener(self, query, None, elapsed)
+
+
+class PooledConnection(psycopg2.extensions.connection):
+    """psycopg2 connection whose close() gives it back to the pool.
+
+    Routes keep calling conn.close() like before; the physical connection
+    stays open and is reused by the next checkout. Only the thread holding
+    the checkout can give it back: a second close() after another thread
+    has checked the connection out again does nothing.
+    """
+
+    def close(self):
+        pool = getattr(self, '_pool', None)
+        if pool is None:
+            return super().close()
+        pool.putconn(self, owner=threading.get_ident())
+
+    def close_physical(self):
+        super().close()
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of PooledConnection objects.
+
+    Session settings are applied once per physical connection, idle
+    connections are pinged before reuse, and checkouts wait at most
+    `timeout` seconds for a free slot.
+    """
+
+    def __init__(self, maxconn=5, timeout=5.0, recycle=1800, ping_after=30):
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self._idle = []
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def _connect(self):
+        db_url = os.getenv('DATABASE_URL')
+        if db_url:
+            if db_url.startswith('postgres://'):
+                db_url = db_url.replace('postgres://', 'postgresql://', 1)
+            conn = psycopg2.connect(
+                db_url,
+                sslmode='require',
+                connection_factory=PooledConnection,
+                cursor_factory=InstrumentedCursor,
+                keepalives=1,
+                keepalives_idle=30,
+                keepalives_interval=10,
+                keepalives_count=5
+            )
+        else:
+            conn = psycopg2.connect(
+                host=os.getenv('DB_HOST', 'localhost'),
+                database=os.getenv('DB_NAME', 'postgres'),
+                user=os.getenv('DB_USER', 'postgres'),
+                password=os.getenv('DB_PASSWORD', 'password'),
+                port=os.getenv('DB_PORT', 5432),
+                connection_factory=PooledConnection,
+                cursor_factory=InstrumentedCursor
+            )
+        with conn.cursor() as cur:
+            cur.execute("SET TIME ZONE %s", (SESSION_TIME_ZONE,))
+        conn.commit()
+        conn._pool = None
+        conn._created_at = time.monotonic()
+        conn._returned_at = conn._created_at
+        conn._checked_out = False
+        return conn
+
+    def _is_usable(self, conn):
+        if conn.closed:
+            return False
+        if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            return False
+        now = time.monotonic()
+        if self.recycle and now - conn._created_at > self.recycle:
+            return False
+        if self.ping_after is not None and now - conn._returned_at > self.ping_after:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _discard(self, conn):
+        try:
+            conn.close_physical()
+        except Exception:
+            pass
+        with self._cond:
+            self._opened -= 1
+            self._cond.notify()
+
+    def _reset_after_fork(self):
+        # Connections inherited from a parent process (gunicorn --preload)
+        # share a socket with it and must never be used here.
+        self._idle = []
+        self._opened = 0
+        self._cond = threading.Condition()
+        self._pid = os.getpid()
+
+    def getconn(self):
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+
+        deadline = time.monotonic() + self.timeout
+        while True:
+            conn = None
+            with self._cond:
+                while not self._idle and self._opened >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(
+                            f"No database connection free after {self.timeout}s "
+                            f"(pool size {self.maxconn})"
+                        )
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn = self._idle.pop()
+                else:
+                    self._opened += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._opened -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_usable(conn):
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                # Owner and token first: putconn reads _checked_out last.
+                conn._pool = self
+                conn._owner = threading.get_ident()
+                conn._checkout = object()
+                conn._checked_out = True
+            return conn
+
+    def putconn(self, conn, checkout=None, owner=None):
+        """Give a checkout back; with checkout/owner set, only if it is still that one."""
+        with self._cond:
+            if not getattr(conn, '_checked_out', False):
+                return
+            if checkout is not None and conn._checkout is not checkout:
+                return
+            if owner is not None and conn._owner != owner:
+                return
+            conn._checked_out = False
+            conn._checkout = None
+        if conn._pool is not self or self._pid != os.getpid():
+            conn.close_physical()
+            return
+
+        if not conn.closed:
+            try:
+                if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                pass
+
+        if conn.closed or conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            self._discard(conn)
+            return
+
+        conn._returned_at = time.monotonic()
+        with self._cond:
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def closeall(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+        for conn in idle:
+            try:
+                conn.close_physical()
+            except Exception:
+                pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.maxconn,
+                "open": self._opened,
+                "idle": len(self._idle),
+                "in_use": self._opened - len(self._idle),
+            }
+
+
+pool = ConnectionPool(
+    maxconn=_pool_max_size(),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 5)),
+    recycle=int(os.getenv('DB_POOL_RECYCLE', 1800)),
+    ping_after=float(os.getenv('DB_POOL_PING_AFTER', 30)),
+)
+
+
+def get_db_connection():
+    """Check a connection out of the shared pool.
+
+    Inside a Flask request/app context the connection is also tracked on
+    `g` so it is handed back automatically at teardown, even when a route
+    returns early without closing it. Returns None if no connection could
+    be obtained, matching the old per-request helper.
+    """
+    try:
+        conn = pool.getconn()
+    except Exception as e:
+        print(f"Database Connection Failed: {e}")
+        return None
+
+    if has_app_context():
+        g.setdefault('_db_conns', []).append((conn, conn._checkout))
+    return conn
+
+
+def release_db_connections(exc=None):
+    """Return every connection checked out in this app context to the pool.
+
+    A connection the route already closed may have been checked out again
+    since, by another thread; putconn compares the checkout token under the
+    pool lock, so teardown never releases someone else's connection.
+    """
+    for conn, checkout in g.pop('_db_conns', []):
+        pool.putconn(conn, checkout=checkout)
+
+
+def init_app(app):
+    app.teardown_appcontext(release_db_connections)
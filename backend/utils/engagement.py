@@ -0,0 +1,143 @@
+"""Time-decayed engagement counters and the trending ranking built on them.
+
+Each event adds its weight to product_engagement.score, which decays with
+a half-life of HALF_LIFE_HOURS. The stored score is the value as of
+updated_at, so record() folds an event in with one UPSERT:
+
+    score = score * 2^(-(now - updated_at) / half_life) + weight * n
+
+record() runs in the caller's transaction, like catalog.bump_version(), so
+a rolled-back checkout leaves no engagement behind.
+
+trending() ranks the TRENDING_SIZE highest decayed scores among available
+products. Each process caches the ranking for TRENDING_REFRESH seconds.
+sort=trending pages through it by rank weight (TRENDING_SIZE for the top
+product, counting down), then through unranked products newest id first.
+A refresh can move products between pages of a walk already in progress.
+
+Config (environment):
+    TRENDING_HALF_LIFE_HOURS   decay half-life (default 48)
+    TRENDING_REFRESH           seconds a ranking is reused (default 30)
+    TRENDING_SIZE              products ranked (default 1000)
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import namedtuple
+
+from psycopg2.extras import execute_values
+
+from utils.db import get_db_connection
+
+HALF_LIFE_HOURS = float(os.getenv('TRENDING_HALF_LIFE_HOURS', 48))
+TRENDING_REFRESH = float(os.getenv('TRENDING_REFRESH', 30))
+TRENDING_SIZE = int(os.getenv('TRENDING_SIZE', 1000))
+
+# event -> (weight, counter column)
+EVENTS = {
+    'view': (1.0, 'views'),
+    'cart': (4.0, 'cart_adds'),
+    'request': (6.0, 'requests'),
+    'checkout': (10.0, 'checkouts'),
+}
+
+# Per second, for exp(): 2^(-t / half_life) == exp(-t * ln 2 / half_life).
+_DECAY_RATE = math.log(2) / (HALF_LIFE_HOURS * 3600)
+_DECAYED = (
+    "{table}.score * exp(-{rate} * GREATEST(0, extract(epoch FROM NOW() - {table}.updated_at)))"
+)
+
+
+def record(conn, event, product_ids):
+    """Add `event` for each product (an iterable of ids, or {id: count}) in conn's transaction."""
+    weight, column = EVENTS[event]
+    if isinstance(product_ids, dict):
+        counts = product_ids
+    else:
+        counts = {}
+        for product_id in product_ids:
+            counts[int(product_id)] = counts.get(int(product_id), 0) + 1
+    if not counts:
+        return
+    decayed = _DECAYED.format(table='product_engagement', rate=repr(_DECAY_RATE))
+    with conn.cursor() as cur:
+        # Sorted so concurrent batches lock rows in the same order. The join
+        # skips ids that were deleted meanwhile instead of failing the FK.
+        execute_values(cur, f"""
+            INSERT INTO product_engagement (product_id, score, updated_at, {column})
+            SELECT v.product_id, v.n * {weight!r}, NOW(), v.n
+            FROM (VALUES %s) AS v (product_id, n)
+            JOIN products p ON p.id = v.product_id
+            ORDER BY v.product_id
+            ON CONFLICT (product_id) DO UPDATE SET
+                score = {decayed} + EXCLUDED.score,
+                updated_at = NOW(),
+                {column} = product_engagement.{column} + EXCLUDED.{column}
+        """, sorted(counts.items()), template="(%s::integer, %s::integer)")
+
+
+Ranking = namedtuple('Ranking', 'digest ids weights by_id')
+
+
+def _load_ranking():
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        cur = conn.cursor()
+        decayed = _DECAYED.format(table='e', rate=repr(_DECAY_RATE))
+        cur.execute(f"""
+            SELECT e.product_id
+            FROM product_engagement e
+            JOIN products p ON p.id = e.product_id
+            WHERE p.status = 'available'
+            ORDER BY {decayed} DESC, e.product_id DESC
+            LIMIT %s
+        """, (TRENDING_SIZE,))
+        ids = [row['product_id'] for row in cur.fetchall()]
+        conn.commit()
+        cur.close()
+    finally:
+        conn.close()
+
+    weights = [TRENDING_SIZE - index for index in range(len(ids))]
+    # Same order, same digest, in every worker: ETags survive refreshes that change nothing.
+    digest = hashlib.sha1(','.join(map(str, ids)).encode('ascii')).hexdigest()[:12]
+    return Ranking(digest, ids, weights, dict(zip(ids, weights)))
+
+
+class TrendingCache:
+    def __init__(self, refresh=TRENDING_REFRESH):
+        self.refresh = refresh
+        self._ranking = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self):
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._ranking, self._loaded_at, self._pid = None, 0.0, os.getpid()
+
+        ranking = self._ranking
+        if ranking is not None and time.monotonic() - self._loaded_at < self.refresh:
+            return ranking
+        with self._lock:
+            if self._ranking is None or time.monotonic() - self._loaded_at >= self.refresh:
+                self._ranking = _load_ranking()
+                self._loaded_at = time.monotonic()
+            return self._ranking
+
+
+trending = TrendingCache().get
+
+
+def join_clause(ranking):
+    """LEFT JOIN exposing t.weight (0 when unranked) for catalog.SORTS['trending'], plus params."""
+    return (
+        "LEFT JOIN unnest(%s::integer[], %s::integer[]) AS t (product_id, weight) ON t.product_id = p.id",
+        [ranking.ids, ranking.weights],
+    )
@@ -0,0 +1,67 @@
+"""ETags built from version counters instead of response bodies.
+
+Each cacheable GET derives its tag from a counter that every relevant
+write bumps (catalog_state.version, users.profile_version,
+users.ratings_version). The handler computes the tag before running its
+query and answers 304 Not Modified when the client already holds it, so
+an unchanged read costs one primary-key lookup (or nothing at all for the
+catalog, whose version is already in memory).
+"""
+import hashlib
+from urllib.parse import urlencode
+
+from flask import current_app, request
+
+
+def query_digest():
+    """Short stable digest of the query string, independent of parameter order."""
+    args = sorted(request.args.items(multi=True))
+    return hashlib.sha1(urlencode(args).encode('utf-8')).hexdigest()[:16]
+
+
+def not_modified(tag, private=False):
+    """A 304 response if the request's If-None-Match already has `tag`, else None."""
+    if not request.if_none_match.contains_weak(tag):
+        return None
+    return tagged(current_app.response_class(status=304), tag, private)
+
+
+def tagged(response, tag, private=False):
+    """Attach the ETag and make clients revalidate instead of guessing freshness."""
+    response = current_app.make_response(response)
+    if response.status_code in (200, 304):
+        response.set_etag(tag)
+        response.headers['Cache-Control'] = 'private, no-cache' if private else 'no-cache'
+    return response
+
+
+def user_versions(cur, user_id):
+    cur.execute("SELECT profile_version, ratings_version FROM users WHERE id = %s", (user_id,))
+    return cur.fetchone()
+
+
+def bump_profile_version(conn, user_ids):
+    """Invalidate the profile of each user, e.g. after a follow or a profile edit."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE users SET profile_version = profile_version + 1 WHERE id = ANY(%s)",
+            ([int(user_id) for user_id in user_ids],)
+        )
+
+
+def bump_ratings_version(conn, user_ids):
+    """Invalidate the reviews and average rating shown for each user."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE users SET ratings_version = ratings_version + 1 WHERE id = ANY(%s)",
+            ([int(user_id) for user_id in user_ids],)
+        )
+
+
+def bump_rater_identity(conn, rater_id):
+    """The rater's name and picture appear in every review they wrote."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE users SET ratings_version = ratings_version + 1
+            WHERE id IN (SELECT rated_user_id FROM user_ratings WHERE rater_id = %s)
+        """, (int(rater_id),))
@@ -0,0 +1,35 @@
+import json
+
+
+def explain(cur, query, params=None, analyze=True):
+    """Run EXPLAIN (FORMAT JSON) for a query and return the root plan dict.
+
+    With analyze=True the statement is really executed, so callers that
+    explain writes must do it inside a transaction they roll back.
+    """
+    options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+    cur.execute(f"EXPLAIN ({options}) {query}", params)
+    row = cur.fetchone()
+    result = row['QUERY PLAN'] if isinstance(row, dict) else row[0]
+    if isinstance(result, str):
+        result = json.loads(result)
+    return result[0]
+
+
+def walk(plan):
+    """Yield every node of a plan tree, depth first."""
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from walk(child)
+
+
+def scan_summary(plan):
+    """Short 'Node Type on relation' list used in reports, e.g. 'Seq Scan products'."""
+    summary = []
+    for node in walk(plan['Plan']):
+        node_type = node['Node Type']
+        if 'Scan' not in node_type:
+            continue
+        target = node.get('Index Name') or node.get('Relation Name') or ''
+        summary.append(f"{node_type} {target}".strip())
+    return summary
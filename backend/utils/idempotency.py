@@ -0,0 +1,184 @@
+"""Idempotency-Key support for POST endpoints that create rows.
+
+The first request with a given key claims it in idempotency_keys, runs the
+view and stores the response. Retries with the same key get the stored
+response back without running the view. A retry that arrives while the
+first request is still running polls until that response is stored,
+so the two never race.
+
+Config (environment):
+    IDEMPOTENCY_TTL_HOURS     how long stored responses are replayed (default 24)
+    IDEMPOTENCY_WAIT_SECONDS  how long a concurrent duplicate waits (default 10)
+    IDEMPOTENCY_LOCK_SECONDS  after this, an unfinished claim counts as abandoned
+                              (worker crashed mid-request) and can be retaken (default 60)
+"""
+import hashlib
+import os
+import random
+import time
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+from utils.db import get_db_connection
+
+TTL_SECONDS = int(float(os.getenv('IDEMPOTENCY_TTL_HOURS', 24)) * 3600)
+WAIT_SECONDS = float(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 10))
+LOCK_SECONDS = int(os.getenv('IDEMPOTENCY_LOCK_SECONDS', 60))
+POLL_INTERVAL = 0.1
+
+
+def _fingerprint():
+    """Hash of what the client sent, so a reused key with a different body is caught."""
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.full_path}\n".encode('utf-8'))
+    body_file = getattr(request, 'body_file', None)
+    if body_file is not None:
+        # Spooled by @streamed_upload, already hashed while it streamed in.
+        digest.update(body_file.sha256.encode('ascii'))
+    elif request.mimetype == 'multipart/form-data':
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode('utf-8'))
+        for name, storage in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{storage.filename}\n".encode('utf-8'))
+            sha256 = getattr(storage.stream, 'sha256', None)
+            if sha256 is not None:
+                digest.update(sha256.encode('ascii'))
+                continue
+            for chunk in iter(lambda: storage.stream.read(64 * 1024), b''):
+                digest.update(chunk)
+            storage.stream.seek(0)
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _claim(cur, key, endpoint, request_hash):
+    cur.execute("""
+        INSERT INTO idempotency_keys (key, endpoint, request_hash, expires_at)
+        VALUES (%s, %s, %s, NOW() + %s * INTERVAL '1 second')
+        ON CONFLICT (key, endpoint) DO UPDATE
+            SET request_hash = EXCLUDED.request_hash,
+                status_code = NULL,
+                content_type = NULL,
+                response_body = NULL,
+                created_at = CURRENT_TIMESTAMP,
+                expires_at = EXCLUDED.expires_at
+            WHERE idempotency_keys.expires_at < NOW()
+            OR (idempotency_keys.status_code IS NULL
+                AND idempotency_keys.created_at < NOW() - %s * INTERVAL '1 second')
+        RETURNING key
+    """, (key, endpoint, request_hash, TTL_SECONDS, LOCK_SECONDS))
+    return cur.fetchone() is not None
+
+
+def _purge_expired(cur):
+    cur.execute("""
+        DELETE FROM idempotency_keys
+        WHERE ctid IN (SELECT ctid FROM idempotency_keys WHERE expires_at < NOW() LIMIT 500)
+    """)
+
+
+def _release(key, endpoint):
+    """Drop an unfinished claim so the client's retry runs the request again."""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cur = conn.cursor()
+        cur.execute("DELETE FROM idempotency_keys WHERE key = %s AND endpoint = %s", (key, endpoint))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        print(f"Idempotency release failed: {e}")
+    finally:
+        conn.close()
+
+
+def _store(key, endpoint, response):
+    if response.status_code >= 500:
+        _release(key, endpoint)
+        return
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE idempotency_keys
+            SET status_code = %s, content_type = %s, response_body = %s
+            WHERE key = %s AND endpoint = %s
+        """, (response.status_code, response.content_type, response.get_data(as_text=True), key, endpoint))
+        conn.commit()
+        cur.close()
+    except Exception as e:
+        conn.rollback()
+        print(f"Idempotency store failed: {e}")
+    finally:
+        conn.close()
+
+
+def _replay(row):
+    response = current_app.response_class(
+        row['response_body'], status=row['status_code'], content_type=row['content_type']
+    )
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return view(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": "Idempotency-Key must be at most 255 characters."}), 400
+
+        endpoint = request.endpoint
+        request_hash = _fingerprint()
+        deadline = time.monotonic() + WAIT_SECONDS
+
+        while True:
+            conn = get_db_connection()
+            if not conn:
+                return jsonify({"error": "Database connection failed"}), 500
+            try:
+                cur = conn.cursor()
+                claimed = _claim(cur, key, endpoint, request_hash)
+                if claimed and random.random() < 0.01:
+                    _purge_expired(cur)
+                row = None
+                if not claimed:
+                    cur.execute("""
+                        SELECT request_hash, status_code, content_type, response_body
+                        FROM idempotency_keys WHERE key = %s AND endpoint = %s
+                    """, (key, endpoint))
+                    row = cur.fetchone()
+                conn.commit()
+                cur.close()
+            finally:
+                conn.close()
+
+            if claimed:
+                try:
+                    response = current_app.make_response(view(*args, **kwargs))
+                except Exception:
+                    _release(key, endpoint)
+                    raise
+                _store(key, endpoint, response)
+                return response
+
+            if row is None:
+                # The first request failed and released the key; try to take it.
+                continue
+            if row['request_hash'] != request_hash:
+                return jsonify({"error": "Idempotency-Key was already used for a different request."}), 422
+            if row['status_code'] is not None:
+                return _replay(row)
+            if time.monotonic() >= deadline:
+                return jsonify({"error": "A request with this Idempotency-Key is still being processed."}), 409
+            time.sleep(POLL_INTERVAL)
+
+    return wrapper
@@ -0,0 +1,128 @@
+"""Fixed-size, re-encoded variants of uploaded images.
+
+Every upload under static/uploads gets three variants, longest side capped:
+
+    thumb   160 px   avatars, chat previews, cart rows
+    card    480 px   listing cards on the home grid
+    full   1600 px   product detail
+
+Variants are WebP at IMAGE_QUALITY. Orientation from EXIF is applied
+first, then all metadata is dropped (no GPS or camera tags), and images
+are never upscaled. They live at
+static/uploads/variants/<variant>/<upload name>.webp, so the URL follows
+from image_url alone (variant_urls) without a lookup. Clients can derive it
+the same way: for image_url /static/uploads/<name>, the card variant is
+/static/uploads/variants/card/<name>.webp. That is why list cards carry
+only card_image_url, and the full set comes with detail responses.
+
+New uploads get their variants at upload time (generate). Files uploaded
+before this, or whose variants were deleted, get them on first request
+(ensure). If a file can't be decoded, callers fall back to the original.
+
+Config (environment):
+    IMAGE_QUALITY   WebP quality, 1-100 (default 80)
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+VARIANTS = OrderedDict([('full', 1600), ('card', 480), ('thumb', 160)])
+QUALITY = int(os.getenv('IMAGE_QUALITY', 80))
+VARIANT_DIR = 'variants'
+VARIANT_EXTENSION = '.webp'
+URL_PREFIX = '/static/uploads/'
+
+# Refuse to decode anything bigger than a 50 MP photo (Pillow raises
+# DecompressionBombError past twice this).
+Image.MAX_IMAGE_PIXELS = 25_000_000
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+class ImageError(ValueError):
+    pass
+
+
+def upload_name(image_url):
+    """File name under the upload folder for a local image_url, else None."""
+    if not image_url or not image_url.startswith(URL_PREFIX):
+        return None
+    name = image_url[len(URL_PREFIX):]
+    if not name or '/' in name or name.startswith('.'):
+        return None
+    return name
+
+
+def variant_urls(image_url):
+    """{variant: url} for a local upload, None for empty or external image URLs."""
+    if upload_name(image_url) is None:
+        return None
+    return {variant: variant_url(image_url, variant) for variant in VARIANTS}
+
+
+def variant_url(image_url, variant):
+    """URL of one variant of a local upload, None for empty or external image URLs."""
+    name = upload_name(image_url)
+    if name is None:
+        return None
+    return f"{URL_PREFIX}{VARIANT_DIR}/{variant}/{name}{VARIANT_EXTENSION}"
+
+
+def add_variant_urls(row, field='image_url', key='image_variants'):
+    row[key] = variant_urls(row.get(field))
+    return row
+
+
+def variant_path(upload_folder, variant, name):
+    return os.path.join(upload_folder, VARIANT_DIR, variant, name + VARIANT_EXTENSION)
+
+
+def _encode(image, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        # No exif=/icc_profile= passed: the variant carries no metadata.
+        image.save(temp, 'WEBP', quality=QUALITY, method=4)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def generate(upload_folder, name):
+    """Write every variant of upload `name`; raises ImageError if it isn't a decodable image."""
+    source = os.path.join(upload_folder, name)
+    try:
+        with Image.open(source) as image:
+            # JPEG can decode at a reduced scale directly, much cheaper for phone photos.
+            image.draft('RGB', (VARIANTS['full'], VARIANTS['full']))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+            # Largest first, each from the previous: three resizes of shrinking inputs.
+            for variant, size in VARIANTS.items():
+                image.thumbnail((size, size), Image.LANCZOS)
+                _encode(image, variant_path(upload_folder, variant, name))
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError, SyntaxError) as e:
+        raise ImageError(f"Cannot process image {name}: {e}")
+
+
+def ensure(upload_folder, variant, name):
+    """Path of a variant, generating the set on first use; None if the source is missing."""
+    path = variant_path(upload_folder, variant, name)
+    if os.path.exists(path):
+        return path
+    if not os.path.isfile(os.path.join(upload_folder, name)):
+        return None
+    with _locks_guard:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        # Another request may have generated it while we waited.
+        if not os.path.exists(path):
+            generate(upload_folder, name)
+    with _locks_guard:
+        _locks.pop(name, None)
+    return path
@@ -0,0 +1,116 @@
+"""Per-request SQL accounting and N+1 detection.
+
+Every statement run through a pooled cursor during a request is counted,
+timed and grouped by shape (the SQL with whitespace and literal lists
+collapsed). In dev mode the totals are sent back as response headers.
+When one shape repeats SQL_REPEAT_THRESHOLD times in a single request it
+is logged, or raised as RepeatedQueryError when SQL_REPEAT_FAIL is on
+(tests set this so a new N+1 loop fails the suite).
+
+With neither the headers nor repeat detection on (the production
+default) no listener is registered, so statements are not shaped or
+timed at all. That is decided on the first request, after app.run() has
+set debug.
+
+Config (app.config or environment):
+    SQL_STATS_HEADER       send X-SQL-Stats / Server-Timing (default: app.debug)
+    SQL_REPEAT_THRESHOLD   repeats of one shape that count as N+1
+                           (0 = off; default 5 with app.debug or SQL_REPEAT_FAIL, else 0)
+    SQL_REPEAT_FAIL        raise instead of logging (default off)
+"""
+import os
+import re
+import threading
+from collections import Counter
+
+from flask import g, has_request_context, request
+
+from utils.db import add_query_listener
+
+_WHITESPACE = re.compile(r'\s+')
+_PLACEHOLDER_LIST = re.compile(r'%s(\s*,\s*%s)+')
+_NUMBER = re.compile(r'\b\d+(\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+
+class RepeatedQueryError(Exception):
+    pass
+
+
+def statement_shape(query):
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    shape = _WHITESPACE.sub(' ', query).strip()
+    shape = _STRING.sub("'?'", shape)
+    shape = _NUMBER.sub('?', shape)
+    return _PLACEHOLDER_LIST.sub('%s, ...', shape)
+
+
+def _flag(name, app, default):
+    value = app.config.get(name, os.getenv(name))
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+
+def _threshold(app):
+    default = 5 if app.debug or _flag('SQL_REPEAT_FAIL', app, False) else 0
+    return int(app.config.get('SQL_REPEAT_THRESHOLD', os.getenv('SQL_REPEAT_THRESHOLD', default)))
+
+
+def _record(cursor, query, vars, seconds):
+    if not has_request_context():
+        return
+    stats = g.get('_sql_stats')
+    if stats is None:
+        stats = g._sql_stats = {'count': 0, 'seconds': 0.0, 'shapes': Counter()}
+    stats['count'] += 1
+    stats['seconds'] += seconds
+    stats['shapes'][statement_shape(query)] += 1
+
+
+def current_stats():
+    """Stats for the current request: count, seconds and the top repeated shape."""
+    stats = g.get('_sql_stats') or {'count': 0, 'seconds': 0.0, 'shapes': Counter()}
+    shape, repeats = (stats['shapes'].most_common(1) or [(None, 0)])[0]
+    return {'count': stats['count'], 'seconds': stats['seconds'], 'top_shape': shape, 'max_repeat': repeats}
+
+
+def init_app(app):
+    enabled = []
+    lock = threading.Lock()
+
+    @app.before_request
+    def start_sql_stats():
+        if enabled:
+            return
+        with lock:
+            if not enabled:
+                enabled.append(_flag('SQL_STATS_HEADER', app, app.debug) or _threshold(app) > 0)
+                if enabled[0]:
+                    add_query_listener(_record)
+
+    @app.after_request
+    def report_sql_stats(response):
+        if not enabled or not enabled[0]:
+            return response
+        stats = current_stats()
+        threshold = _threshold(app)
+        if _flag('SQL_STATS_HEADER', app, app.debug):
+            db_ms = stats['seconds'] * 1000
+            response.headers['X-SQL-Stats'] = (
+                f"queries={stats['count']}; db_ms={db_ms:.1f}; max_repeat={stats['max_repeat']}"
+            )
+            response.headers['Server-Timing'] = f"db;dur={db_ms:.1f};desc=\"{stats['count']} queries\""
+
+        if threshold and stats['max_repeat'] >= threshold:
+            message = (
+                f"Repeated query in {request.method} {request.path}: "
+                f"{stats['max_repeat']}x {stats['top_shape'][:200]}"
+            )
+            if _flag('SQL_REPEAT_FAIL', app, False):
+                raise RepeatedQueryError(message)
+            print(f"N+1 warning: {message}")
+        return response
@@ -0,0 +1,298 @@
+"""Top-K "similar items" per product, stored in product_similar.
+
+Similarity blends four signals:
+
+    0.50  TF-IDF cosine over products.search_vector lexemes
+          (name terms count double the description's)
+    0.25  same category
+    0.10  same listing_type
+    0.15  price proximity (cheaper / dearer, 1.0 for equal prices)
+
+Candidates for a product are the listings sharing one of its rarer terms
+(document frequency under MAX_DF_RATIO of the catalog) plus its nearest
+neighbours by price in the same category, so scoring never walks the whole
+catalog. GET /api/products/<id>/similar then reads K rows by primary key.
+
+Keeping it current is incremental. create_product and modify_product call
+schedule() after committing, and a background thread recomputes that one
+product's list. It also slots the product into the lists of candidates it
+now beats and drops it from lists where its old score no longer applies.
+Those lists may sit at K-1 entries until their own next recompute, and
+work queued when a worker exits is lost. `python rebuild_similar.py`
+recomputes everything from scratch and covers both.
+"""
+import math
+import os
+import queue
+import re
+import threading
+import time
+from collections import defaultdict
+
+from psycopg2.extras import execute_values
+
+from utils.db import get_db_connection
+
+TOP_K = 20
+DEFAULT_LIMIT = 8
+MAX_DF_RATIO = 0.05
+PRICE_NEIGHBOURS = 30
+MAX_TEXT_CANDIDATES = 2000
+STATS_TTL = int(os.getenv('SIMILAR_STATS_TTL', 3600))
+# Larger batches (bulk imports) wait for rebuild_similar.py instead of
+# keeping the worker busy for minutes.
+MAX_SCHEDULED_BATCH = int(os.getenv('SIMILAR_MAX_SCHEDULED_BATCH', 200))
+
+WEIGHTS = {'text': 0.50, 'category': 0.25, 'listing_type': 0.10, 'price': 0.15}
+# search_vector weights: A = name, B = category (scored separately), C/D = description.
+_TERM_WEIGHTS = {'A': 1.0, 'B': 0.0, 'C': 0.5, 'D': 0.5}
+_LEXEME = re.compile(r"'((?:[^']|'')+)'(?::([0-9A-D,]+))?")
+
+_CANDIDATE_COLUMNS = "p.id, p.search_vector::text AS vector, p.category, p.listing_type, p.price"
+
+
+def parse_vector(text):
+    """{lexeme: weighted term frequency} from a tsvector's text form."""
+    terms = {}
+    for lexeme, positions in _LEXEME.findall(text or ''):
+        lexeme = lexeme.replace("''", "'")
+        weight = 0.0
+        for position in (positions or '1').split(','):
+            weight += _TERM_WEIGHTS.get(position[-1] if position[-1].isalpha() else 'D', 0.5)
+        if weight:
+            terms[lexeme] = weight
+    return terms
+
+
+class TermStats:
+    """Document frequencies over the available catalog."""
+
+    def __init__(self, df, documents):
+        self.df = df
+        self.documents = max(documents, 1)
+        self.max_df = max(2, int(self.documents * MAX_DF_RATIO))
+
+    def idf(self, term):
+        return math.log((self.documents + 1) / (self.df.get(term, 0) + 1)) + 1
+
+    def rare(self, terms):
+        return [term for term in terms if self.df.get(term, 0) <= self.max_df]
+
+    @classmethod
+    def load(cls, cur):
+        cur.execute("SELECT count(*) AS n FROM products WHERE status = 'available'")
+        documents = cur.fetchone()['n']
+        cur.execute("""
+            SELECT word, ndoc FROM ts_stat(
+                'SELECT search_vector FROM products WHERE status = ''available'''
+            )
+        """)
+        return cls({row['word']: row['ndoc'] for row in cur.fetchall()}, documents)
+
+
+_stats = None
+_stats_loaded_at = 0.0
+
+
+def term_stats(cur):
+    """TermStats, reloaded at most every STATS_TTL seconds (one catalog scan)."""
+    global _stats, _stats_loaded_at
+    if _stats is None or time.monotonic() - _stats_loaded_at > STATS_TTL:
+        _stats = TermStats.load(cur)
+        _stats_loaded_at = time.monotonic()
+    return _stats
+
+
+class Item:
+    __slots__ = ('id', 'category', 'listing_type', 'price', 'vector', 'norm')
+
+    def __init__(self, row, stats):
+        self.id = row['id']
+        self.category = row['category']
+        self.listing_type = row['listing_type']
+        self.price = float(row['price'] or 0)
+        terms = parse_vector(row['vector'])
+        self.vector = {term: tf * stats.idf(term) for term, tf in terms.items()}
+        self.norm = math.sqrt(sum(w * w for w in self.vector.values())) or 1.0
+
+
+def score(a, b):
+    if len(a.vector) > len(b.vector):
+        a, b = b, a
+    dot = sum(w * b.vector.get(term, 0.0) for term, w in a.vector.items())
+    text = dot / (a.norm * b.norm)
+    high = max(a.price, b.price)
+    price = 1.0 if high == 0 else min(a.price, b.price) / high
+    return (WEIGHTS['text'] * text
+            + WEIGHTS['category'] * (a.category == b.category)
+            + WEIGHTS['listing_type'] * (a.listing_type == b.listing_type)
+            + WEIGHTS['price'] * price)
+
+
+def _tsquery(terms):
+    return ' | '.join("'" + term.replace('\\', '\\\\').replace("'", "''") + "'" for term in terms)
+
+
+def _candidates(cur, item, stats):
+    rare = stats.rare(item.vector)
+    parts = []
+    params = {'id': item.id, 'category': item.category, 'price': item.price,
+              'neighbours': PRICE_NEIGHBOURS, 'text_limit': MAX_TEXT_CANDIDATES}
+    if rare:
+        parts.append(f"""
+            (SELECT {_CANDIDATE_COLUMNS} FROM products p
+             WHERE p.status = 'available' AND p.id <> %(id)s
+             AND p.search_vector @@ to_tsquery('simple', %(query)s)
+             LIMIT %(text_limit)s)
+        """)
+        params['query'] = _tsquery(rare)
+    parts.append(f"""
+        (SELECT {_CANDIDATE_COLUMNS} FROM products p
+         WHERE p.status = 'available' AND p.id <> %(id)s AND p.category = %(category)s
+         AND COALESCE(p.price, 0) >= %(price)s
+         ORDER BY COALESCE(p.price, 0) LIMIT %(neighbours)s)
+    """)
+    parts.append(f"""
+        (SELECT {_CANDIDATE_COLUMNS} FROM products p
+         WHERE p.status = 'available' AND p.id <> %(id)s AND p.category = %(category)s
+         AND COALESCE(p.price, 0) < %(price)s
+         ORDER BY COALESCE(p.price, 0) DESC LIMIT %(neighbours)s)
+    """)
+    cur.execute(' UNION '.join(parts), params)
+    return [Item(row, stats) for row in cur.fetchall()]
+
+
+def recompute(conn, product_id):
+    """Refresh one product's list and its place in its candidates' lists."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {_CANDIDATE_COLUMNS}, p.status FROM products p WHERE p.id = %s", (product_id,))
+        row = cur.fetchone()
+        # Its old scores in other lists are stale whatever happens next.
+        cur.execute("DELETE FROM product_similar WHERE similar_id = %s", (product_id,))
+        if not row or row['status'] != 'available':
+            conn.commit()
+            return 0
+
+        stats = term_stats(cur)
+        item = Item(row, stats)
+        scored = sorted(((score(item, other), other.id) for other in _candidates(cur, item, stats)), reverse=True)
+
+        cur.execute("DELETE FROM product_similar WHERE product_id = %s", (product_id,))
+        if scored:
+            execute_values(cur, "INSERT INTO product_similar (product_id, similar_id, score) VALUES %s",
+                           [(product_id, other_id, s) for s, other_id in scored[:TOP_K]])
+
+        # Similarity is symmetric: offer this product to the candidates' own lists.
+        offers = scored[:TOP_K * 10]
+        if offers:
+            execute_values(cur, f"""
+                INSERT INTO product_similar (product_id, similar_id, score)
+                SELECT o.product_id, o.similar_id, o.score
+                FROM (VALUES %s) AS o (product_id, similar_id, score)
+                WHERE (SELECT count(*) FROM product_similar s WHERE s.product_id = o.product_id) < {TOP_K}
+                OR o.score > (SELECT min(s.score) FROM product_similar s WHERE s.product_id = o.product_id)
+                ON CONFLICT (product_id, similar_id) DO UPDATE SET score = EXCLUDED.score, computed_at = NOW()
+            """, [(other_id, product_id, s) for s, other_id in offers], template="(%s, %s, %s::real)")
+            cur.execute("""
+                DELETE FROM product_similar s
+                USING (
+                    SELECT product_id, similar_id,
+                           row_number() OVER (PARTITION BY product_id ORDER BY score DESC, similar_id) AS rank
+                    FROM product_similar
+                    WHERE product_id = ANY(%s)
+                ) ranked
+                WHERE s.product_id = ranked.product_id AND s.similar_id = ranked.similar_id
+                AND ranked.rank > %s
+            """, ([other_id for _, other_id in offers], TOP_K))
+    conn.commit()
+    return len(scored[:TOP_K])
+
+
+def rebuild(conn, progress=None):
+    """Recompute every list from scratch, in memory, and replace the table."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT {_CANDIDATE_COLUMNS} FROM products p WHERE p.status = 'available'")
+        rows = cur.fetchall()
+
+    df = defaultdict(int)
+    for row in rows:
+        for term in parse_vector(row['vector']):
+            df[term] += 1
+    stats = TermStats(df, len(rows))
+    items = [Item(row, stats) for row in rows]
+
+    postings = defaultdict(list)
+    for item in items:
+        for term in stats.rare(item.vector):
+            postings[term].append(item)
+    by_category = defaultdict(list)
+    for item in items:
+        by_category[item.category].append(item)
+    for members in by_category.values():
+        members.sort(key=lambda member: member.price)
+    positions = {item.id: index for members in by_category.values() for index, item in enumerate(members)}
+
+    results = []
+    for count, item in enumerate(items, 1):
+        candidates = {}
+        for term in stats.rare(item.vector):
+            for other in postings[term][:MAX_TEXT_CANDIDATES]:
+                candidates[other.id] = other
+        members = by_category[item.category]
+        at = positions[item.id]
+        for other in members[max(0, at - PRICE_NEIGHBOURS):at + PRICE_NEIGHBOURS + 1]:
+            candidates[other.id] = other
+        candidates.pop(item.id, None)
+        scored = sorted(((score(item, other), other.id) for other in candidates.values()), reverse=True)
+        results.extend((item.id, other_id, s) for s, other_id in scored[:TOP_K])
+        if progress and count % 1000 == 0:
+            progress(count, len(items))
+
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM product_similar")
+        execute_values(cur, "INSERT INTO product_similar (product_id, similar_id, score) VALUES %s",
+                       results, page_size=5000)
+    conn.commit()
+    return len(items), len(results)
+
+
+_queue = queue.Queue()
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def _run_worker():
+    while True:
+        product_id = _queue.get()
+        conn = get_db_connection()
+        if not conn:
+            continue
+        try:
+            recompute(conn, product_id)
+        except Exception as e:
+            conn.rollback()
+            print(f"Similar items recompute failed for product {product_id}: {e}")
+        finally:
+            conn.close()
+
+
+def schedule(product_id):
+    """Queue a recompute for product_id; call after the write has committed."""
+    global _worker, _worker_pid
+    with _worker_lock:
+        if _worker is None or _worker_pid != os.getpid() or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='similar-items', daemon=True)
+            _worker_pid = os.getpid()
+            _worker.start()
+    _queue.put(int(product_id))
+
+
+def schedule_many(product_ids):
+    """schedule() each id, unless there are more than MAX_SCHEDULED_BATCH; returns whether it did."""
+    if len(product_ids) > MAX_SCHEDULED_BATCH:
+        print(f"Similar items: {len(product_ids)} new products left for the next rebuild_similar.py run")
+        return False
+    for product_id in product_ids:
+        schedule(product_id)
+    return True
@@ -0,0 +1,288 @@
+"""Resumable chunked uploads.
+
+A phone on a bad network can send an image in numbered chunks instead of
+one multipart POST:
+
+    POST /api/uploads                   {user_id, filename, size[, sha256]}
+                                        -> upload_id, chunk_size, chunk_count
+    PUT  /api/uploads/<id>/chunks/<n>   raw bytes of chunk n (from 0)
+    GET  /api/uploads/<id>              offset received without gaps, missing chunks
+    POST /api/uploads/<id>/complete     -> image_url
+
+After a dropped connection the client asks for the offset and resumes
+from there. Chunk n is written with pwrite at n * chunk_size in a
+preallocated part file under SESSION_DIR while it streams in. Chunks may
+arrive in any order, a repeated chunk is acknowledged without being
+rewritten, and no chunk is held in memory. Finalizing copies the part
+file into a fresh temp file, hashing the copy, and renames the copy into
+the content-addressed store (utils.uploads). A PUT still writing into the
+part file when it finalizes cannot reach the stored file, whose bytes are
+the ones its name was hashed from. create_product and create_swap then
+take the session id as upload_id in place of an image file.
+
+An open session expires SESSION_TTL after its last chunk. A finalized one
+stays usable for SESSION_TTL after finalizing. sweep() deletes expired
+sessions and their part files. It runs a bounded batch each time a
+session is created, and the upload GC runs it too.
+
+Config (environment):
+    UPLOAD_CHUNK_KB           chunk size given to clients (default 512;
+                              keep it under MAX_CONTENT_LENGTH)
+    UPLOAD_SESSION_TTL_HOURS  default 24
+"""
+import hashlib
+import os
+import re
+import tempfile
+import uuid
+
+from utils import upload_stream, uploads
+
+SESSION_DIR = '.sessions'
+CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_KB', 512)) * 1024
+SESSION_TTL_SECONDS = int(float(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24)) * 3600)
+SWEEP_BATCH = 100
+
+_SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+_SHA256 = re.compile(r'^[0-9a-f]{64}$')
+
+
+class SessionError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def part_path(upload_folder, session_id):
+    return os.path.join(upload_folder, SESSION_DIR, f"{session_id}.part")
+
+
+def chunk_count(session):
+    return -(-session['size_bytes'] // session['chunk_size'])
+
+
+def chunk_length(session, index):
+    return min(session['chunk_size'], session['size_bytes'] - index * session['chunk_size'])
+
+
+def describe(session):
+    """API view of a session row."""
+    received = set(session['received'])
+    count = chunk_count(session)
+    contiguous = 0
+    while contiguous in received:
+        contiguous += 1
+    return {
+        'upload_id': session['id'],
+        'status': session['status'],
+        'size': session['size_bytes'],
+        'chunk_size': session['chunk_size'],
+        'chunk_count': count,
+        'offset': min(contiguous * session['chunk_size'], session['size_bytes']),
+        'missing': [index for index in range(count) if index not in received],
+        'expires_at': session['expires_at'].isoformat(),
+        'image_url': uploads.URL_PREFIX + session['stored_filename'] if session['stored_filename'] else None,
+    }
+
+
+def get(conn, session_id, for_update=False):
+    """Unexpired session row, or None."""
+    if not _SESSION_ID.match(session_id or ''):
+        return None
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT * FROM upload_sessions
+            WHERE id = %s AND expires_at > NOW()
+            {'FOR UPDATE' if for_update else ''}
+        """, (session_id,))
+        return cur.fetchone()
+
+
+def _get_or_fail(conn, session_id, for_update=False):
+    session = get(conn, session_id, for_update)
+    if session is None:
+        raise SessionError("Upload session not found or expired", 404)
+    return session
+
+
+def create(conn, upload_folder, user_id, filename, size, sha256=None):
+    """New open session with its part file preallocated (sparse), in conn's transaction."""
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise SessionError("size must be a number of bytes")
+    if size <= 0:
+        raise SessionError("size must be positive")
+    if size > upload_stream.MAX_IMAGE_BYTES:
+        raise SessionError(f"File is larger than {upload_stream.MAX_IMAGE_BYTES // upload_stream.MB} MB.", 413)
+    if sha256 is not None and not _SHA256.match(str(sha256).lower()):
+        raise SessionError("sha256 must be 64 hex characters")
+
+    sweep(conn, upload_folder)
+    session_id = uuid.uuid4().hex
+    path = part_path(upload_folder, session_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.truncate(size)
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO upload_sessions (id, user_id, filename, size_bytes, chunk_size, expected_sha256, expires_at)
+            VALUES (%s, %s, %s, %s, %s, %s, NOW() + %s * INTERVAL '1 second')
+            RETURNING *
+        """, (session_id, user_id, (filename or '')[:255] or None, size, CHUNK_SIZE,
+              sha256.lower() if sha256 else None, SESSION_TTL_SECONDS))
+        return cur.fetchone()
+
+
+def write_chunk(conn, upload_folder, session_id, index, stream, length):
+    """Write chunk `index` from `stream` to its offset; returns the updated session row.
+
+    Ends conn's transaction before reading the body, so no lock or
+    snapshot is held while a slow client sends it.
+    """
+    session = _get_or_fail(conn, session_id)
+    if session['status'] != 'open':
+        raise SessionError("Upload is already finalized", 409)
+    if not 0 <= index < chunk_count(session):
+        raise SessionError(f"Chunk must be between 0 and {chunk_count(session) - 1}")
+    expected = chunk_length(session, index)
+    if length != expected:
+        raise SessionError(f"Chunk {index} must be {expected} bytes")
+    if index in session['received']:
+        return session
+    conn.commit()
+
+    offset = index * session['chunk_size']
+    written = 0
+    head = b''
+    try:
+        fd = os.open(part_path(upload_folder, session_id), os.O_WRONLY)
+    except FileNotFoundError:
+        raise SessionError("Upload session not found or expired", 404)
+    try:
+        # Finalized between the check above and the open: the part file is
+        # no longer the upload, so don't write into it.
+        session = _get_or_fail(conn, session_id)
+        conn.commit()
+        if session['status'] != 'open':
+            raise SessionError("Upload is already finalized", 409)
+        while written < expected:
+            data = stream.read(min(uploads.CHUNK_SIZE, expected - written))
+            if not data:
+                break
+            if index == 0 and len(head) < upload_stream.SNIFF_BYTES:
+                head += data[:upload_stream.SNIFF_BYTES]
+                if len(head) >= upload_stream.SNIFF_BYTES or written + len(data) == expected:
+                    if upload_stream.sniff(head, upload_stream.IMAGE_KINDS) is None:
+                        raise SessionError(f"File must be one of: {', '.join(upload_stream.IMAGE_KINDS)}.", 415)
+            view = memoryview(data)
+            while view:
+                count = os.pwrite(fd, view, offset + written)
+                view = view[count:]
+                written += count
+    finally:
+        os.close(fd)
+    if written != expected:
+        raise SessionError(f"Chunk {index} ended after {written} of {expected} bytes")
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE upload_sessions
+            SET received = ARRAY(SELECT DISTINCT unnest(received || %s::integer) ORDER BY 1),
+                updated_at = NOW(),
+                expires_at = NOW() + %s * INTERVAL '1 second'
+            WHERE id = %s AND status = 'open'
+            RETURNING *
+        """, (index, SESSION_TTL_SECONDS, session_id))
+        session = cur.fetchone()
+    if session is None:
+        raise SessionError("Upload is already finalized", 409)
+    return session
+
+
+def finalize(conn, upload_folder, session_id):
+    """Move a fully received upload into the store, in conn's transaction.
+
+    Returns (session row, StoredUpload or None); the upload is None when
+    the session was already finalized by an earlier call. Call
+    remove_part once the transaction is committed.
+    """
+    session = _get_or_fail(conn, session_id, for_update=True)
+    if session['status'] == 'complete':
+        return session, None
+    missing = chunk_count(session) - len(session['received'])
+    if missing:
+        raise SessionError(f"{missing} chunks are still missing", 409)
+
+    # Hash and place a copy, never the part file itself: a PUT of a chunk
+    # that was already received may still be writing into it.
+    path = part_path(upload_folder, session_id)
+    digest = hashlib.sha256()
+    size = 0
+    temp = tempfile.NamedTemporaryFile(dir=upload_folder, prefix='.upload-', delete=False)
+    try:
+        with temp, open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(uploads.CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                temp.write(chunk)
+        with open(temp.name, 'rb') as f:
+            head = f.read(upload_stream.SNIFF_BYTES)
+        sha256 = digest.hexdigest()
+        kind = upload_stream.sniff(head, upload_stream.IMAGE_KINDS)
+
+        with conn.cursor() as cur:
+            if kind is None or (session['expected_sha256'] and session['expected_sha256'] != sha256):
+                # Start over: the client re-sends every chunk into the same session.
+                cur.execute("UPDATE upload_sessions SET received = '{}', updated_at = NOW() WHERE id = %s",
+                            (session_id,))
+                conn.commit()
+                if kind is None:
+                    raise SessionError(f"File must be one of: {', '.join(upload_stream.IMAGE_KINDS)}.", 415)
+                raise SessionError("sha256 does not match the received file; send the chunks again", 422)
+
+            extension, content_type, _ = upload_stream.IMAGE_KINDS[kind]
+            upload = uploads.place(temp.name, sha256, size, upload_folder, f"upload.{extension}", content_type)
+    finally:
+        if os.path.exists(temp.name):
+            os.remove(temp.name)
+
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE upload_sessions
+            SET status = 'complete', sha256 = %s, stored_filename = %s, content_type = %s,
+                updated_at = NOW(), expires_at = NOW() + %s * INTERVAL '1 second'
+            WHERE id = %s
+            RETURNING *
+        """, (sha256, upload.filename, content_type, SESSION_TTL_SECONDS, session_id))
+        return cur.fetchone(), upload
+
+
+def remove_part(upload_folder, session_id):
+    """Drop a finalized session's part file; a late chunk write only reaches the unlinked inode."""
+    path = part_path(upload_folder, session_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def stored_upload(conn, session_id, user_id):
+    """StoredUpload of user_id's finalized session, for a create request's upload_id."""
+    session = get(conn, session_id)
+    if session is None or session['status'] != 'complete' or str(session['user_id']) != str(user_id):
+        raise SessionError("upload_id does not refer to a finished upload of this user")
+    return uploads.StoredUpload(session['sha256'], session['stored_filename'], session['size_bytes'],
+                                session['content_type'], False)
+
+
+def sweep(conn, upload_folder, limit=SWEEP_BATCH):
+    """Delete up to `limit` expired sessions and their part files; returns how many."""
+    with conn.cursor() as cur:
+        cur.execute("""
+            DELETE FROM upload_sessions
+            WHERE id IN (SELECT id FROM upload_sessions WHERE expires_at < NOW() LIMIT %s)
+            RETURNING id
+        """, (limit,))
+        expired = cur.fetchall()
+    for session in expired:
+        remove_part(upload_folder, session['id'])
+    return len(expired)
@@ -0,0 +1,183 @@
+"""Streaming ingestion for multipart uploads.
+
+Werkzeug's default parser spools each file part into a temp file that the
+view then copies again, and it checks nothing until the whole body is in.
+Views decorated with @streamed_upload get IngestFile instead: each chunk
+the parser decodes is hashed and written to a temp file in the upload
+folder. The first bytes are checked against the allowed file signatures,
+and the running size against the route's limit, so a wrong or oversized
+file is refused (415 / 413) as soon as that is known. A Content-Length
+over the limit is refused before any of the body is read. Memory per
+upload is one parser chunk whatever the file size, and a kept file is
+renamed into place by uploads.place without being read again.
+
+A route that accepts any content (kinds=None, the bulk import) may also
+take its file as the raw request body. That body is spooled the same way
+into request.body_file, so the view and the Idempotency-Key fingerprint
+read a hashed file on disk instead of an in-memory copy.
+
+Temp files that are not kept are removed when the request is closed.
+
+Config (environment):
+    UPLOAD_MAX_IMAGE_MB   largest image accepted by image upload routes (default 10)
+    UPLOAD_MAX_IMPORT_MB  largest bulk import file (default 50)
+"""
+import hashlib
+import os
+import tempfile
+from collections import namedtuple
+from functools import wraps
+
+from flask import Request, current_app, request
+from werkzeug.exceptions import RequestEntityTooLarge, UnsupportedMediaType
+
+from utils import uploads
+
+MB = 1024 * 1024
+MAX_IMAGE_BYTES = int(float(os.getenv('UPLOAD_MAX_IMAGE_MB', 10)) * MB)
+MAX_IMPORT_BYTES = int(float(os.getenv('UPLOAD_MAX_IMPORT_MB', 50)) * MB)
+# Room for the text fields and multipart framing next to the file.
+MAX_FIELDS_BYTES = 256 * 1024
+
+# kind -> (extension, content type, signatures)
+IMAGE_KINDS = {
+    'png': ('png', 'image/png', (b'\x89PNG\r\n\x1a\n',)),
+    'jpeg': ('jpg', 'image/jpeg', (b'\xff\xd8\xff',)),
+    'gif': ('gif', 'image/gif', (b'GIF87a', b'GIF89a')),
+}
+SNIFF_BYTES = 8
+
+UploadPolicy = namedtuple('UploadPolicy', 'max_bytes kinds')
+
+
+def sniff(head, kinds):
+    """Kind whose signature `head` starts with, else None."""
+    for kind in kinds:
+        if head.startswith(IMAGE_KINDS[kind][2]):
+            return kind
+    return None
+
+
+def streamed_upload(max_bytes, kinds=tuple(IMAGE_KINDS)):
+    """Stream this view's file parts through IngestFile.
+
+    kinds=None accepts any content, and a body that isn't a form is spooled
+    to request.body_file. The body is read before the view runs, so 413/415
+    reach the client as such rather than through the view's own error
+    handling.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if kinds is None and not request.mimetype.startswith(('multipart/', 'application/x-www-form-urlencoded')):
+                request.body_file = request.spool_body()
+            else:
+                request.files
+            return view(*args, **kwargs)
+        wrapper.upload_policy = UploadPolicy(max_bytes, tuple(kinds) if kinds else None)
+        return wrapper
+    return decorator
+
+
+class IngestFile:
+    """Write-only-then-read temp file that hashes and checks what the parser writes."""
+
+    def __init__(self, upload_folder, policy):
+        self._policy = policy
+        # Same directory as the destination, so uploads.place is a rename.
+        self._file = tempfile.NamedTemporaryFile(dir=upload_folder, prefix='.upload-', delete=False)
+        self.name = self._file.name
+        self._digest = hashlib.sha256()
+        self._head = b''
+        self.size = 0
+        self.kind = None
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self._policy.max_bytes:
+            self.close()
+            raise RequestEntityTooLarge(f"File is larger than {round(self._policy.max_bytes / MB, 1):g} MB.")
+        if self._policy.kinds and self.kind is None:
+            self._head += data[:SNIFF_BYTES]
+            if len(self._head) >= SNIFF_BYTES:
+                self.kind = sniff(self._head, self._policy.kinds)
+                if self.kind is None:
+                    self.close()
+                    raise UnsupportedMediaType(
+                        f"File must be one of: {', '.join(self._policy.kinds)}.")
+        self._digest.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._digest.hexdigest()
+
+    def save(self, upload_folder):
+        """Move into the content-addressed store; None if too short to be an allowed file."""
+        if self._policy.kinds and self.kind is None:
+            self.kind = sniff(self._head, self._policy.kinds)
+        if self.kind is None:
+            return None
+        extension, content_type, _ = IMAGE_KINDS[self.kind]
+        self._file.close()
+        return uploads.place(self.name, self.sha256, self.size, upload_folder, f"upload.{extension}", content_type)
+
+    def seek(self, *args):
+        return self._file.seek(*args)
+
+    def read(self, *args):
+        return self._file.read(*args)
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+
+class UploadRequest(Request):
+    """Request that applies the matched view's UploadPolicy, if any."""
+
+    max_form_memory_size = MAX_FIELDS_BYTES
+    # Set by @streamed_upload(kinds=None) for a raw (non-form) body.
+    body_file = None
+
+    @property
+    def upload_policy(self):
+        if self.url_rule is None:
+            return None
+        return getattr(current_app.view_functions.get(self.endpoint), 'upload_policy', None)
+
+    @property
+    def max_content_length(self):
+        policy = self.upload_policy
+        if policy is not None:
+            return policy.max_bytes + MAX_FIELDS_BYTES
+        return super().max_content_length
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        policy = self.upload_policy
+        if policy is None:
+            return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+        stream = IngestFile(current_app.config['UPLOAD_FOLDER'], policy)
+        self.__dict__.setdefault('_ingest_files', []).append(stream)
+        return stream
+
+    def spool_body(self):
+        """The raw body copied to an IngestFile in uploads.CHUNK_SIZE pieces, rewound."""
+        stream = self._get_file_stream(self.content_length, self.content_type)
+        for chunk in iter(lambda: self.stream.read(uploads.CHUNK_SIZE), b''):
+            stream.write(chunk)
+        stream.seek(0)
+        return stream
+
+    def close(self):
+        super().close()
+        for stream in self.__dict__.get('_ingest_files', ()):
+            stream.close()
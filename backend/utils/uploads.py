@@ -0,0 +1,169 @@
+"""Content-addressed storage for uploaded files.
+
+An upload is copied in CHUNK_SIZE pieces to a temp file in the upload
+folder while its SHA-256 is computed. It is then renamed to
+<sha256>.<extension>, or dropped if that file already exists. The same
+photo uploaded twice, by anyone, is stored once, gets its variants
+(utils.images) once, and has one URL that browsers and proxies may cache
+forever because its content can never change.
+
+upload_blobs and upload_refs (migration 0011) track which rows use which
+file. Routes call add_ref() in the transaction that writes the row. A file
+whose transaction then fails is left unreferenced for the upload GC.
+
+send_upload() serves files from the upload folder. Content-addressed files
+and their variants are marked immutable for a year, with the hash as ETag;
+legacy names get UPLOAD_MAX_AGE. Conditional and Range requests are
+answered (304 / 206) by Werkzeug. UPLOAD_SERVE_MODE hands the byte pushing
+to the front server instead:
+
+    app          Flask streams the file (default; fine behind a CDN)
+    x-sendfile   X-Sendfile header for Apache mod_xsendfile / lighttpd
+    x-accel      X-Accel-Redirect to UPLOAD_ACCEL_PREFIX for nginx:
+
+        location /_uploads/ {
+            internal;
+            alias /srv/app/backend/static/uploads/;
+        }
+
+In x-accel mode nginx keeps the Content-Type and Cache-Control set here
+and does ranges and conditionals itself. nginx can also serve
+/static/uploads/ directly, falling back to the app only for variants not
+generated yet:
+
+    location /static/uploads/ {
+        root /srv/app/backend;
+        expires max;
+        try_files $uri @app;
+    }
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import tempfile
+from collections import namedtuple
+from urllib.parse import quote
+
+from flask import current_app, send_from_directory
+from psycopg2.extras import execute_values
+
+CHUNK_SIZE = 64 * 1024
+URL_PREFIX = '/static/uploads/'
+OWNER_TYPES = ('product', 'swap', 'message', 'profile')
+# owner_type -> (table, column) holding the image URL
+OWNER_COLUMNS = {
+    'product': ('products', 'image_url'),
+    'swap': ('swaps', 'offer_image_url'),
+    'message': ('messages', 'image_url'),
+    'profile': ('users', 'profile_image'),
+}
+_EXTENSION_ALIASES = {'jpeg': 'jpg'}
+CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]{1,8}$')
+# A content-addressed file or one of its variants (<sha256>.jpg.webp).
+_HASHED = re.compile(r'^([0-9a-f]{64})\.')
+
+SERVE_MODE = os.getenv('UPLOAD_SERVE_MODE', 'app').lower()
+ACCEL_PREFIX = os.getenv('UPLOAD_ACCEL_PREFIX', '/_uploads/')
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+LEGACY_MAX_AGE = int(os.getenv('UPLOAD_MAX_AGE', 3600))
+
+
+class StoredUpload(namedtuple('StoredUpload', 'sha256 filename size content_type created')):
+    """A file in the upload folder; created is False when identical content was already there."""
+
+    @property
+    def url(self):
+        return URL_PREFIX + self.filename
+
+
+def extension_for(filename):
+    extension = filename.rsplit('.', 1)[1].lower() if '.' in (filename or '') else 'bin'
+    return _EXTENSION_ALIASES.get(extension, extension)
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_ADDRESSED.match(name or ''))
+
+
+def store(stream, upload_folder, original_filename, content_type=None):
+    """Copy a binary stream into the upload folder under its content hash."""
+    digest = hashlib.sha256()
+    size = 0
+    # Same directory as the destination, so the final rename is atomic.
+    temp = tempfile.NamedTemporaryFile(dir=upload_folder, prefix='.upload-', delete=False)
+    try:
+        with temp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+                size += len(chunk)
+                temp.write(chunk)
+        return place(temp.name, digest.hexdigest(), size, upload_folder, original_filename, content_type)
+    finally:
+        if os.path.exists(temp.name):
+            os.remove(temp.name)
+
+
+def place(temp_path, sha256, size, upload_folder, original_filename, content_type=None):
+    """Move an already-hashed temp file to <sha256>.<extension>, or drop it if that exists."""
+    filename = f"{sha256}.{extension_for(original_filename)}"
+    final = os.path.join(upload_folder, filename)
+    if os.path.exists(final):
+        os.remove(temp_path)
+        # Fresh mtime: the upload GC's grace period now covers the row about to use it.
+        os.utime(final)
+        return StoredUpload(sha256, filename, size, content_type, False)
+    os.chmod(temp_path, 0o644)
+    os.replace(temp_path, final)
+    return StoredUpload(sha256, filename, size, content_type, True)
+
+
+def add_ref(conn, upload, owner_type, owner_id):
+    """Record that owner_type/owner_id uses `upload`, in conn's transaction."""
+    add_refs(conn, upload, owner_type, [owner_id])
+
+
+def add_refs(conn, upload, owner_type, owner_ids):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO upload_blobs (sha256, filename, size_bytes, content_type)
+            VALUES (%s, %s, %s, %s)
+            ON CONFLICT (sha256) DO NOTHING
+        """, (upload.sha256, upload.filename, upload.size, upload.content_type))
+        execute_values(cur, """
+            INSERT INTO upload_refs (sha256, owner_type, owner_id) VALUES %s
+            ON CONFLICT DO NOTHING
+        """, [(upload.sha256, owner_type, owner_id) for owner_id in owner_ids])
+
+
+def drop_refs(conn, owner_type, owner_ids):
+    """Forget what these owners pointed at (row deleted, or image replaced)."""
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM upload_refs WHERE owner_type = %s AND owner_id = ANY(%s)",
+                    (owner_type, [int(owner_id) for owner_id in owner_ids]))
+
+
+def send_upload(upload_folder, path):
+    """Response for `path` (relative to the upload folder; the caller checked it exists)."""
+    name = os.path.basename(path)
+    hashed = _HASHED.match(name)
+    max_age = IMMUTABLE_MAX_AGE if hashed else LEGACY_MAX_AGE
+
+    if SERVE_MODE == 'x-accel':
+        response = current_app.response_class()
+        response.headers['X-Accel-Redirect'] = ACCEL_PREFIX + quote(path.replace(os.sep, '/'))
+        response.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+    else:
+        # x-sendfile mode sets USE_X_SENDFILE; Werkzeug then sends the
+        # header instead of the body.
+        response = send_from_directory(
+            upload_folder, path,
+            max_age=max_age,
+            # The same bytes get the same validator on every server, unlike mtime.
+            etag=name if hashed else True,
+        )
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if hashed:
+        response.cache_control.immutable = True
+    return response
@@ -0,0 +1,106 @@
+"""Write-behind product view counter.
+
+GET /api/products/<id> is the hottest read, so a view only bumps a counter
+in process memory. A background thread folds the pending counts into
+product_engagement with one batched UPSERT (engagement.record 'view', so
+views also feed sort=trending). It runs every FLUSH_INTERVAL seconds, or
+sooner once FLUSH_EVENTS views are pending. Counts still pending are
+flushed at interpreter exit, which is how gunicorn workers stop. A crash,
+or a flush that fails, loses at most that one window of views.
+
+Config (environment):
+    VIEW_FLUSH_INTERVAL   seconds between flushes (default 5)
+    VIEW_FLUSH_EVENTS     pending views that trigger an early flush (default 1000)
+"""
+import atexit
+import os
+import threading
+
+from utils import engagement
+from utils.db import get_db_connection
+
+FLUSH_INTERVAL = float(os.getenv('VIEW_FLUSH_INTERVAL', 5))
+FLUSH_EVENTS = int(os.getenv('VIEW_FLUSH_EVENTS', 1000))
+
+
+class ViewCounter:
+    def __init__(self, flush_interval=FLUSH_INTERVAL, flush_events=FLUSH_EVENTS):
+        self.flush_interval = flush_interval
+        self.flush_events = flush_events
+        self._counts = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._pid = None
+        self.flushed_views = 0
+        self.flushes = 0
+        self.dropped_views = 0
+
+    def _ensure_thread(self):
+        if self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: the parent's pending counts are the parent's to flush.
+                self._counts, self._pending = {}, 0
+                self._wake = threading.Event()
+            if self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+
+    def hit(self, product_id):
+        """Count one view; never touches the database."""
+        self._ensure_thread()
+        with self._lock:
+            self._counts[product_id] = self._counts.get(product_id, 0) + 1
+            self._pending += 1
+            if self._pending >= self.flush_events:
+                self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write pending counts in one UPSERT; returns how many views were written."""
+        with self._flush_lock:
+            with self._lock:
+                counts, self._counts, self._pending = self._counts, {}, 0
+            if not counts:
+                return 0
+            views = sum(counts.values())
+            conn = get_db_connection()
+            if not conn:
+                self.dropped_views += views
+                print(f"View counter flush skipped, database connection failed ({views} views dropped)")
+                return 0
+            try:
+                engagement.record(conn, 'view', counts)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                self.dropped_views += views
+                print(f"View counter flush failed ({views} views dropped): {e}")
+                return 0
+            finally:
+                conn.close()
+            self.flushes += 1
+            self.flushed_views += views
+            return views
+
+    def stats(self):
+        return {
+            'pending': self._pending,
+            'flushes': self.flushes,
+            'flushed_views': self.flushed_views,
+            'dropped_views': self.dropped_views,
+        }
+
+
+views = ViewCounter()
+atexit.register(views.flush)